@@ -2,54 +2,149 @@
 
 This module contains the main window of the application.
 
+The time to the first paint of the home list can be measured with:
+    python app.py --startup-profile
+which prints how long the imports, the Tk initialization, the loading of \
+    the catalog and the first render took, and quits.
+
+The link graph and the search index are loaded on background threads \
+    after the first paint (or once the catalog is reconciled, when it came \
+    from the snapshot), so opening the first article or the search screen \
+    does not wait for them.
+
 '''
 
+import time
+STARTED = time.perf_counter()
 
+import argparse
+import atexit
 import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import data_manager
+import instrumentation
+import link_graph
+import search_index
 from state import State
-from screens import CreateScreen, EditScreen, ListScreen, ViewScreen, CreateViewScreen, EditViewScreen
-from tkinter import * 
+from screens import CreateScreen, EditScreen, ListScreen, ViewScreen, CreateViewScreen, EditViewScreen, SearchScreen
+from tkinter import *
+
+IMPORTED = time.perf_counter()
+
+# milliseconds between two checks for the end of the catalog scan
+RECONCILE_POLL = 50
+
+def start_loading():
+    '''Starts loading what is derived from the articles on background threads.'''
+
+    link_graph.start_loading()
+    search_index.start_loading()
+
+def reconcile_catalog(root, state, scan):
+    '''Puts the result of the background scan of the articles in place.
+
+    The home list is painted from the catalog snapshot. Once the directory \
+        scan running on another thread is done, the catalog is reconciled \
+        with it, and the list is shown again if it is on screen and changed.\
+        Then the loading of the link graph and the search index starts, \
+        see start_loading.
+
+    Arguments:
+        root: the Tk object
+        state: the State object
+        scan: a future of data_manager.scan
+    '''
+
+    if not scan.done():
+        root.after(RECONCILE_POLL, reconcile_catalog, root, state, scan)
+        return
+    try:
+        scanned = scan.result()
+    except OSError:
+        scanned = None
+    if data_manager.reconcile(scanned) and state.current=='list_screen':
+        state.show({'screen_name': 'list_screen'}, record=False)
+    start_loading()
 
-def main():
+def main(argv=None):
     '''Starting point of the application.
-    
-    In this function, all of the screens are created, the state object is \
-        created and the screens are attached to the state object. 
+
+    In this function, the state object is created and the screens are \
+        registered to it. A screen is only made the first time it is shown.
     And on startup the list_screen is shown.
-    
+
     '''
-    
+
+    arg_parser = argparse.ArgumentParser(description='OwnWiki')
+    arg_parser.add_argument('--startup-profile', action='store_true', help='print the time to the first paint and quit')
+    args = arg_parser.parse_args(argv)
+
     BASE_DIR = os.getcwd()
+    timings = [('import', IMPORTED - STARTED)]
 
+    started = time.perf_counter()
     root = Tk()
     root.geometry('1500x600')
     root.minsize(1500, 600)
+    instrumentation.install_shortcuts(root)
     # root.resizable(False, False)
+    timings.append(('tk init', time.perf_counter() - started))
+
+    started = time.perf_counter()
+    from_snapshot = data_manager.load_catalog_snapshot()
+    if not from_snapshot:
+        data_manager.get_articles_list()
+    atexit.register(data_manager.save_catalog_snapshot)
+    timings.append(('catalog load', time.perf_counter() - started))
 
+    started = time.perf_counter()
     state = State(base_dir=BASE_DIR)
-    create_screen = {
-        'screen': CreateViewScreen(root, state, 'Create New Article', '', False),
+    state.add_screen({
+        'make': partial(CreateViewScreen, root, state, 'Create New Article', '', False),
         'name': 'create_screen'
-    }
-    view_screen = {
-        'screen': ViewScreen(root, state, 'Read Article', '', False),
+    })
+    state.add_screen({
+        'make': partial(ViewScreen, root, state, 'Read Article', '', False),
         'name': 'view_screen'
-    }
-    edit_screen = {
-        'screen': EditViewScreen(root, state, 'Edit Article', '', False),
+    })
+    state.add_screen({
+        'make': partial(EditViewScreen, root, state, 'Edit Article', '', False),
         'name': 'edit_screen'
-    }
-    list_screen = {
-        'screen': ListScreen(root, state, 'OwnWiki - Welcome', 'OwnWiki - All Articles', True),
+    })
+    state.add_screen({
+        'make': partial(ListScreen, root, state, 'OwnWiki - Welcome', 'OwnWiki - All Articles', True),
         'name': 'list_screen'
-    }
-    state.add_screen(create_screen)
-    state.add_screen(view_screen)
-    state.add_screen(edit_screen)
-    state.add_screen(list_screen)
+    })
+    state.add_screen({
+        'make': partial(SearchScreen, root, state, 'Search Articles', 'Search Articles', False),
+        'name': 'search_screen'
+    })
     state.show({'screen_name':'list_screen'})
+    root.update()
+    timings.append(('first render', time.perf_counter() - started))
+
+    if args.startup_profile:
+        for name, seconds in timings:
+            print(f'{name:<14}{seconds*1000:9.1f} ms')
+        print(f"{'first paint':<14}{(time.perf_counter() - STARTED)*1000:9.1f} ms "\
+            f"({len(data_manager.get_articles_list())} articles, catalog from {'snapshot' if from_snapshot else 'scan'})")
+        root.destroy()
+        return
+
+    if from_snapshot:
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='catalog')
+        root.after(RECONCILE_POLL, reconcile_catalog, root, state, executor.submit(data_manager.scan))
+        executor.shutdown(wait=False)
+    else:
+        start_loading()
+
+    # back and forward through the shown screens, like in a browser
+    root.bind('<Alt-Left>', state.back)
+    root.bind('<Alt-Right>', state.forward)
 
     root.mainloop()
 
 if __name__=='__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,317 @@
+'''This module renders articles without a display.
+
+The Renderer needs a Tk Text widget. The backends of this module get the \
+    same ParsedLines from the pipeline (blocks, sanitizing, parse_line) and \
+    write to any file-like sink instead, so articles can be rendered in \
+    batch jobs, on servers or in tests:
+    HTMLBackend: HTML, one element per line
+    ANSIBackend: text for a terminal, with escape codes for the styles, or \
+        plain text with the same layout as the Text widget
+    RecordingBackend: counts the operations, writes nothing but a summary
+
+    from backends import HTMLBackend, render_content
+    render_content(content, HTMLBackend(sys.stdout), title='Article')
+
+From the command line:
+    python backends.py [--format html|ansi|text|record] ARTICLE
+    python backends.py [--format ...] --all --output DIRECTORY
+
+'''
+
+import argparse
+import html
+import json
+import os
+import sys
+from abc import ABC, abstractmethod
+from collections import Counter
+from urllib.parse import quote
+
+from parsers import ATTRIBUTE_BITS, ParsedLine
+from pipeline import content_2_parsed_blocks
+
+def line_kind(parsed_line):
+    '''Returns 'h1', 'h2', 'bullet' or 'text', from the first run of a line.'''
+
+    if not parsed_line.runs:
+        return 'text'
+    mask = parsed_line.runs[0][2]
+    if mask & ATTRIBUTE_BITS['h1']:
+        return 'h1'
+    if mask & ATTRIBUTE_BITS['h2']:
+        return 'h2'
+    if mask & ATTRIBUTE_BITS['bulleted_list']:
+        return 'bullet'
+    return 'text'
+
+class Backend(ABC):
+    '''The interface of a headless rendering backend.
+
+    render_parsed_blocks calls, in order: begin_document, then for every \
+        block begin_block, for every line begin_line, text for every run and\
+        end_line, then end_block, and at last end_document.
+
+    Attributes:
+        sink: a file-like object with a write method, or None
+    '''
+
+    def __init__(self, sink=None):
+        self.sink = sink
+
+    def write(self, text):
+        '''Writes to the sink if there is one.'''
+
+        if self.sink is not None:
+            self.sink.write(text)
+
+    def begin_document(self, title):
+        '''Called once before anything else.'''
+
+    def end_document(self):
+        '''Called once after everything else.'''
+
+    def begin_block(self, block_num):
+        '''Called before the lines of a block.'''
+
+    def end_block(self, block_num):
+        '''Called after the lines of a block.'''
+
+    def begin_line(self, kind, line_num):
+        '''Called before the runs of a line, kind is given by line_kind.'''
+
+    def end_line(self, kind, line_num):
+        '''Called after the runs of a line.'''
+
+    @abstractmethod
+    def text(self, text, attributes, href):
+        '''Called for every run of a line.
+
+        Arguments:
+            text (str): the text of the run
+            attributes (list): names of the attributes of the run, see \
+                parsers.ATTRIBUTES
+            href (str): the link target or None
+        '''
+
+class HTMLBackend(Backend):
+    '''Writes HTML.
+
+    Headings become h1 and h2, consecutive bullets a ul, other lines a p. \
+        The runs become strong, em, u, code and a elements.
+
+    Attributes:
+        link_format: format of the href of a link, the quoted article name \
+            is put in the braces
+        standalone: True to write a whole page with head and body
+    '''
+
+    INLINE = (('bold', 'strong'), ('italic', 'em'), ('underline', 'u'), ('inline_code', 'code'))
+
+    def __init__(self, sink=None, link_format='{}.html', standalone=True):
+        super().__init__(sink)
+        self.link_format = link_format
+        self.standalone = standalone
+        self.in_list = False
+
+    def begin_document(self, title):
+        if self.standalone:
+            title = html.escape(title or '')
+            self.write(f'<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8">\n<title>{title}</title>\n</head>\n<body>\n')
+
+    def end_document(self):
+        if self.standalone:
+            self.write('</body>\n</html>\n')
+
+    def begin_block(self, block_num):
+        self.write('<div class="block">\n')
+
+    def end_block(self, block_num):
+        if self.in_list:
+            self.write('</ul>\n')
+            self.in_list = False
+        self.write('</div>\n')
+
+    def begin_line(self, kind, line_num):
+        if kind=='bullet' and not self.in_list:
+            self.write('<ul>\n')
+            self.in_list = True
+        elif kind!='bullet' and self.in_list:
+            self.write('</ul>\n')
+            self.in_list = False
+        self.write({'h1': '<h1>', 'h2': '<h2>', 'bullet': '<li>', 'text': '<p>'}[kind])
+
+    def end_line(self, kind, line_num):
+        self.write({'h1': '</h1>', 'h2': '</h2>', 'bullet': '</li>', 'text': '</p>'}[kind] + '\n')
+
+    def text(self, text, attributes, href):
+        text = html.escape(text)
+        for attr, element in self.INLINE:
+            if attr in attributes:
+                text = f'<{element}>{text}</{element}>'
+        if href is not None:
+            text = f'<a href="{html.escape(self.link_format.format(quote(href)))}">{text}</a>'
+        self.write(text)
+
+class ANSIBackend(Backend):
+    '''Writes text for a terminal.
+
+    The layout is the one of the Text widget: a line per line, an empty line\
+        between blocks and bullets as '    • '. With color the styles are \
+        shown with SGR escape codes, without it the output is plain text.
+    '''
+
+    CODES = {
+        'bold': '1',
+        'italic': '3',
+        'underline': '4',
+        'inline_code': '36',
+        'link': '34;4',
+        'h1': '1;4',
+        'h2': '1',
+    }
+
+    def __init__(self, sink=None, color=True):
+        super().__init__(sink)
+        self.color = color
+
+    def begin_block(self, block_num):
+        if block_num>0:
+            self.write('\n\n')
+
+    def begin_line(self, kind, line_num):
+        if line_num>0:
+            self.write('\n')
+        if kind=='bullet':
+            self.write('    ' + u'•' + ' ')
+
+    def end_document(self):
+        self.write('\n')
+
+    def text(self, text, attributes, href):
+        codes = [self.CODES[attr] for attr in attributes if attr in self.CODES]
+        if self.color and codes:
+            self.write(f'\x1b[{";".join(codes)}m{text}\x1b[0m')
+        else:
+            self.write(text)
+
+class RecordingBackend(Backend):
+    '''Counts the operations, for tests and benchmarks.
+
+    Attributes:
+        counts: a Counter of the calls per method, of the characters \
+            ('chars'), of the runs per attribute ('attr:bold', ...) and of \
+            the links ('links')
+
+        events: the list of calls as tuples, when record_events is True
+    '''
+
+    def __init__(self, sink=None, record_events=False):
+        super().__init__(sink)
+        self.counts = Counter()
+        self.events = [] if record_events else None
+
+    def __record(self, *event):
+        self.counts[event[0]] += 1
+        if self.events is not None:
+            self.events.append(event)
+
+    def begin_document(self, title):
+        self.__record('begin_document', title)
+
+    def end_document(self):
+        self.__record('end_document')
+        self.write(json.dumps(dict(self.counts), sort_keys=True) + '\n')
+
+    def begin_block(self, block_num):
+        self.__record('begin_block', block_num)
+
+    def end_block(self, block_num):
+        self.__record('end_block', block_num)
+
+    def begin_line(self, kind, line_num):
+        self.__record('begin_line', kind, line_num)
+
+    def end_line(self, kind, line_num):
+        self.__record('end_line', kind, line_num)
+
+    def text(self, text, attributes, href):
+        self.__record('text', text, tuple(attributes), href)
+        self.counts['chars'] += len(text)
+        for attr in attributes:
+            self.counts['attr:'+attr] += 1
+        if href is not None:
+            self.counts['links'] += 1
+
+def render_parsed_blocks(parsed_blocks, backend, title=None):
+    '''Drives a backend over parsed blocks.
+
+    Arguments:
+        parsed_blocks: list of tuples of ParsedLines, see \
+            pipeline.content_2_parsed_blocks
+        backend: a Backend
+        title (str): the article name
+
+    Returns:
+        Backend: backend
+    '''
+
+    backend.begin_document(title)
+    for block_num, parsed_lines in enumerate(parsed_blocks):
+        backend.begin_block(block_num)
+        for line_num, parsed_line in enumerate(parsed_lines):
+            kind = line_kind(parsed_line)
+            backend.begin_line(kind, line_num)
+            for start, end, mask, href in parsed_line.runs:
+                backend.text(parsed_line.text[start:end], ParsedLine.attributes(mask), href)
+            backend.end_line(kind, line_num)
+        backend.end_block(block_num)
+    backend.end_document()
+    return backend
+
+def render_content(content, backend, title=None):
+    '''Parses raw content and drives a backend over it.'''
+
+    return render_parsed_blocks(content_2_parsed_blocks(content), backend, title)
+
+FORMATS = {
+    'html': ('.html', lambda sink: HTMLBackend(sink)),
+    'ansi': ('.txt', lambda sink: ANSIBackend(sink)),
+    'text': ('.txt', lambda sink: ANSIBackend(sink, color=False)),
+    'record': ('.json', lambda sink: RecordingBackend(sink)),
+}
+
+def main():
+    import data_manager
+    import render_cache
+
+    arg_parser = argparse.ArgumentParser(description='Renders articles without a display.')
+    arg_parser.add_argument('article', nargs='?', help='name of the article')
+    arg_parser.add_argument('--format', choices=sorted(FORMATS), default='html')
+    arg_parser.add_argument('--all', action='store_true', help='render every article')
+    arg_parser.add_argument('--output', help='directory to write the files to, stdout by default')
+    args = arg_parser.parse_args()
+    if args.all==(args.article is not None):
+        arg_parser.error('give either an article or --all')
+
+    extension, make_backend = FORMATS[args.format]
+    titles = [file_name[:-3] for file_name in data_manager.get_articles_list()] if args.all else [args.article]
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+    failed = 0
+    for title in titles:
+        try:
+            parsed_blocks = render_cache.get_parsed_blocks(title)
+        except (OSError, UnicodeDecodeError) as e:
+            print(f'{title}: {e}', file=sys.stderr)
+            failed += 1
+            continue
+        if args.output:
+            with open(os.path.join(args.output, title+extension), 'w', encoding='utf-8') as sink:
+                render_parsed_blocks(parsed_blocks, make_backend(sink), title)
+        else:
+            render_parsed_blocks(parsed_blocks, make_backend(sys.stdout), title)
+    if failed:
+        sys.exit(1)
+
+if __name__=='__main__':
+    main()
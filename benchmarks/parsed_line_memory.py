@@ -0,0 +1,70 @@
+'''Compares the memory taken by the parsed list of chars and by ParsedLine.
+
+For every article in data/mds, and for a large article made by repeating \
+    them, all lines are parsed once with parsers.parse (one dictionary per \
+    character) and once with parsers.parse_line (text plus attribute runs). \
+    The memory still allocated after parsing is measured with tracemalloc.
+
+Usage:
+    python benchmarks/parsed_line_memory.py [--repeat N]
+
+'''
+
+import argparse
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from parsers import parse, parse_line
+
+MDS_DIR = os.path.join(os.path.dirname(__file__), '..', 'data', 'mds')
+
+def retained_bytes(parser, lines):
+    '''Parses all lines and returns the bytes still allocated by the result.
+
+    Arguments:
+        parser: parse or parse_line
+        lines: list of raw lines
+
+    Returns:
+        int: allocated bytes
+    '''
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = [parser(line+' ') for line in lines]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return after - before
+
+def read_articles():
+    '''Returns a list of (article name, content) of data/mds.'''
+
+    articles = []
+    for file_name in sorted(os.listdir(MDS_DIR)):
+        with open(os.path.join(MDS_DIR, file_name), 'r', errors='replace') as f:
+            articles.append((file_name[:-3], f.read()))
+    return articles
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    arg_parser.add_argument('--repeat', type=int, default=200, help='how many times the articles are repeated for the large article')
+    args = arg_parser.parse_args()
+
+    articles = read_articles()
+    large = '\n\n'.join(content for _, content in articles) * args.repeat
+    articles.append((f'all articles x {args.repeat}', large))
+
+    print(f'{"article":<32} {"chars":>9} {"list of dicts":>14} {"ParsedLine":>12} {"ratio":>7}')
+    for name, content in articles:
+        lines = content.split('\n')
+        chars_bytes = retained_bytes(parse, lines)
+        runs_bytes = retained_bytes(parse_line, lines)
+        ratio = chars_bytes / runs_bytes if runs_bytes else 0
+        print(f'{name[:32]:<32} {len(content):>9} {chars_bytes:>14} {runs_bytes:>12} {ratio:>6.1f}x')
+
+if __name__=='__main__':
+    main()
@@ -0,0 +1,110 @@
+'''Compares listing, reading and saving on the storage backends.
+
+A wiki of synthetic articles is written once to a DirectoryStorage and once \
+    to a SqliteStorage in a temporary directory, then both are timed on:
+    bulk save: writing all of the articles
+    list cold: get_articles_list on a freshly opened storage
+    list warm: get_articles_list again
+    read: get on random articles
+    exists: exists on random titles, half of them missing
+    edit: edit on random articles, keeping the old version
+
+Usage:
+    python benchmarks/storage_backends.py [--sizes 10000,100000] [--operations N]
+
+'''
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from revisions import RevisionStore
+from storage import DirectoryStorage, SqliteStorage
+
+PARAGRAPH = '''This is **article {i}**, with some *italic* text, `inline code` and a \
+[link](Article {j:06d}). The rest of the paragraph is plain text so that the \
+article has about the size of a real one.'''
+
+def make_articles(count, paragraphs=4):
+    '''Returns a list of (title, content) of synthetic articles.'''
+
+    articles = []
+    for i in range(count):
+        content = '\n\n'.join(PARAGRAPH.format(i=i, j=(i*7+k) % count) for k in range(paragraphs))
+        articles.append((f'Article {i:06d}', content))
+    return articles
+
+def timed(function, repeat=1):
+    '''Returns the seconds taken by calling function repeat times.'''
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return time.perf_counter() - started
+
+def benchmark(name, open_storage, articles, operations):
+    '''Times the operations on one backend.
+
+    Arguments:
+        name: name of the backend, for the report
+        open_storage: function returning a new Storage on the same data
+        articles: list of (title, content)
+        operations: number of reads, exists and edits
+
+    Returns:
+        dict: {operation: seconds}
+    '''
+
+    rng = random.Random(1)
+    titles = [title for title, _ in articles]
+    result = {}
+
+    storage = open_storage()
+    result['bulk save'] = timed(lambda: storage.save_many(articles))
+    storage.close()
+
+    storage = open_storage()
+    result['list cold'] = timed(storage.get_articles_list)
+    result['list warm'] = timed(storage.get_articles_list)
+
+    sample = [rng.choice(titles) for _ in range(operations)]
+    result['read'] = timed(lambda: [storage.get(title) for title in sample])
+
+    sample = [rng.choice(titles) if i % 2 else f'Missing {i}' for i in range(operations)]
+    result['exists'] = timed(lambda: [storage.exists(title) for title in sample])
+
+    sample = [rng.choice(articles) for _ in range(operations)]
+    result['edit'] = timed(lambda: [storage.edit(title, content+'\n\nEdited.') for title, content in sample])
+    storage.close()
+    return result
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    arg_parser.add_argument('--sizes', default='10000,100000', help='comma separated numbers of articles')
+    arg_parser.add_argument('--operations', type=int, default=1000, help='number of reads, exists and edits')
+    args = arg_parser.parse_args()
+
+    print(f'{"articles":>9} {"backend":<10} {"operation":<10} {"total s":>9} {"per op ms":>10}')
+    for size in [int(size) for size in args.sizes.split(',')]:
+        articles = make_articles(size)
+        with tempfile.TemporaryDirectory() as directory:
+            mds = os.path.join(directory, 'mds')
+            revisions = os.path.join(directory, 'revisions')
+            os.makedirs(mds)
+            backends = [
+                ('directory', lambda: DirectoryStorage(mds, RevisionStore(revisions))),
+                ('sqlite', lambda: SqliteStorage(os.path.join(directory, 'wiki.sqlite3'))),
+            ]
+            for name, open_storage in backends:
+                result = benchmark(name, open_storage, articles, args.operations)
+                for operation, seconds in result.items():
+                    count = size if operation=='bulk save' else 1 if operation.startswith('list') else args.operations
+                    print(f'{size:>9} {name:<10} {operation:<10} {seconds:>9.3f} {seconds/count*1000:>10.4f}')
+
+if __name__=='__main__':
+    main()
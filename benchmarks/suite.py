@@ -0,0 +1,348 @@
+'''Measures the time and peak memory of every stage of the article pipeline.
+
+Synthetic articles are generated from 100 characters up to 1 MB, with a \
+    configurable density of markup, and every stage is timed on them:
+    sanitize: pipeline.block_2_sanitized_block (Renderer.block_2_sanitized_block)
+    parse: parsers.parse on every sanitized line
+    parse_line: parsers.parse_line on every sanitized line
+    Parser4*: each legacy parser class on its own, on every sanitized line
+    pipeline: pipeline.content_2_parsed_blocks with empty caches
+    html: backends.HTMLBackend over the parsed blocks
+    data_manager.*: create_and_save, get, get_articles_list, edit and delete\
+        on a wiki in a temporary directory
+
+Time is the best of several runs, peak memory is measured by tracemalloc on \
+    a separate run. The legacy Parser4* classes are quadratic, they are \
+    skipped above --legacy-max-size.
+
+Usage:
+    python benchmarks/suite.py run [--sizes 100,1000,...] [--profiles mixed,long]\
+        [--density bold=0.2,links=0.1] [--stages parse,sanitize] [--output results.json]
+    python benchmarks/suite.py compare OLD.json NEW.json [--threshold 0.1]
+
+compare exits with status 1 when a stage got slower than the threshold.
+
+'''
+
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import cache
+import data_manager
+import parsers
+import pipeline
+from backends import HTMLBackend, render_parsed_blocks
+from revisions import RevisionStore
+from storage import DirectoryStorage
+
+SIZES = (100, 1000, 10000, 100000, 1000000)
+
+# fraction of words (bold, italic, underline, code, links) or of lines \
+# (bullets, headings) carrying the markup, and the fraction of paragraphs \
+# written as a single unbroken line
+PROFILES = {
+    'plain': {'bold': 0, 'italic': 0, 'underline': 0, 'code': 0, 'links': 0, 'bullets': 0, 'headings': 0, 'long_paragraphs': 0},
+    'mixed': {'bold': 0.05, 'italic': 0.05, 'underline': 0.02, 'code': 0.02, 'links': 0.02, 'bullets': 0.1, 'headings': 0.05, 'long_paragraphs': 0.2},
+    'heavy': {'bold': 0.3, 'italic': 0.2, 'underline': 0.1, 'code': 0.1, 'links': 0.1, 'bullets': 0.3, 'headings': 0.1, 'long_paragraphs': 0.2},
+    'long': {'bold': 0.05, 'italic': 0.05, 'underline': 0, 'code': 0, 'links': 0.02, 'bullets': 0, 'headings': 0, 'long_paragraphs': 1},
+}
+
+WORDS = ('lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor '
+         'incididunt ut labore et dolore magna aliqua wiki article markup parser').split()
+
+def make_content(size, density, seed=0):
+    '''Returns a synthetic article of about size characters.
+
+    Arguments:
+        size (int): number of characters
+        density (dict): see PROFILES
+        seed (int): seed of the random generator
+
+    Returns:
+        str: the article
+    '''
+
+    rng = random.Random(seed)
+    paragraphs = []
+    length = 0
+    while length<size:
+        long_paragraph = rng.random()<density['long_paragraphs']
+        words = []
+        for _ in range(rng.randint(20, 120)):
+            word = rng.choice(WORDS)
+            r = rng.random()
+            for markup, template in (('bold', '**{}**'), ('italic', '*{}*'), ('underline', '_{}_'), ('code', '`{}`'), ('links', '[{}](Article {})')):
+                if r<density[markup]:
+                    word = template.format(word, rng.randint(0, 999))
+                    break
+                r -= density[markup]
+            words.append(word)
+        if long_paragraph:
+            lines = [' '.join(words)]
+        else:
+            lines = []
+            line = []
+            for word in words:
+                line.append(word)
+                if sum(len(word)+1 for word in line)>72:
+                    lines.append(' '.join(line))
+                    line = []
+            if line:
+                lines.append(' '.join(line))
+        for i, line in enumerate(lines):
+            r = rng.random()
+            if r<density['bullets']:
+                lines[i] = '* ' + line
+            elif r<density['bullets']+density['headings']:
+                lines[i] = rng.choice(('# ', '## ')) + line
+        paragraph = '\n'.join(lines)
+        paragraphs.append(paragraph)
+        length += len(paragraph) + 2
+    return '\n\n'.join(paragraphs)[:size]
+
+def sanitized_lines(content):
+    '''Returns the lines of the sanitized blocks of content.'''
+
+    lines = []
+    for block in pipeline.content_2_blocks(content):
+        lines.extend(pipeline.block_2_sanitized_block(block).split('\n'))
+    return lines
+
+def clear_caches():
+    cache.line_cache.clear()
+    cache.block_cache.clear()
+
+def legacy_stage(parser_class):
+    def stage(content):
+        lines = sanitized_lines(content)
+        return lambda: [parser_class([{'char': char} for char in line+' ']) for line in lines]
+    return stage
+
+def sanitize_stage(content):
+    blocks = pipeline.content_2_blocks(content)
+    return lambda: [pipeline.block_2_sanitized_block(block) for block in blocks]
+
+def parse_stage(content):
+    lines = sanitized_lines(content)
+    return lambda: [parsers.parse(line+' ') for line in lines]
+
+def parse_line_stage(content):
+    lines = sanitized_lines(content)
+    return lambda: [parsers.parse_line(line+' ') for line in lines]
+
+def pipeline_stage(content):
+    def run():
+        clear_caches()
+        return pipeline.content_2_parsed_blocks(content)
+    return run
+
+def html_stage(content):
+    parsed_blocks = pipeline.content_2_parsed_blocks(content)
+    return lambda: render_parsed_blocks(parsed_blocks, HTMLBackend(io.StringIO()))
+
+class TemporaryWiki():
+    '''Points data_manager to a wiki in a temporary directory.
+
+    The wiki has 100 small articles and 'Article 1' with the benchmark content.
+    '''
+
+    def __init__(self, content):
+        self.content = content
+
+    def __enter__(self):
+        self.directory = tempfile.TemporaryDirectory()
+        mds = os.path.join(self.directory.name, 'mds')
+        os.makedirs(mds)
+        self.saved = (data_manager.storage, data_manager.listeners)
+        data_manager.storage = DirectoryStorage(mds, RevisionStore(os.path.join(self.directory.name, 'revisions')))
+        data_manager.listeners = []
+        data_manager.save_many([(f'Article {i}', 'A small article.') for i in range(100)])
+        data_manager.create_and_save('Article 1', self.content)
+        data_manager.get_articles_list()
+        return self
+
+    def __exit__(self, *exc_info):
+        data_manager.storage, data_manager.listeners = self.saved
+        self.directory.cleanup()
+
+def data_manager_stage(operation):
+    def stage(content):
+        wiki = TemporaryWiki(content)
+        def run():
+            if operation=='create_and_save':
+                data_manager.create_and_save('New Article', content)
+            elif operation=='get':
+                data_manager.get('Article 1')
+            elif operation=='get_articles_list':
+                data_manager.get_articles_list()
+            elif operation=='edit':
+                data_manager.edit('Article 1', content[:len(content)//2] + ' edited ' + content[len(content)//2:])
+            else:
+                data_manager.delete('Article 1')
+        run.prepare = wiki.__enter__
+        run.cleanup = lambda: wiki.__exit__(None, None, None)
+        return run
+    return stage
+
+STAGES = {
+    'sanitize': sanitize_stage,
+    'parse': parse_stage,
+    'parse_line': parse_line_stage,
+    'pipeline': pipeline_stage,
+    'html': html_stage,
+}
+LEGACY_STAGES = {}
+for parser_class in (parsers.Parser4Bold, parsers.Parser4Italic, parsers.Parser4Underline, parsers.Parser4InlineCode,
+                     parsers.Parser4Heading1, parsers.Parser4Heading2, parsers.Parser4BulletedList, parsers.Parser4Link):
+    LEGACY_STAGES[parser_class.__name__] = legacy_stage(parser_class)
+STAGES.update(LEGACY_STAGES)
+for operation in ('create_and_save', 'get', 'get_articles_list', 'edit', 'delete'):
+    STAGES['data_manager.'+operation] = data_manager_stage(operation)
+
+def measure(run, min_time=0.2, max_repeat=20):
+    '''Returns the best time of run and its peak memory.
+
+    Arguments:
+        run: a function without arguments. If it has the attributes prepare\
+            and cleanup, they are called before and after every run, \
+            outside of the measurement
+        min_time: run again until this many seconds were spent
+        max_repeat: at most this many runs
+
+    Returns:
+        tuple: (seconds, peak bytes, runs)
+    '''
+
+    prepare = getattr(run, 'prepare', lambda: None)
+    cleanup = getattr(run, 'cleanup', lambda: None)
+    best = None
+    spent = 0
+    runs = 0
+    while runs<max_repeat and (runs<1 or spent<min_time):
+        prepare()
+        started = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - started
+        cleanup()
+        best = elapsed if best is None else min(best, elapsed)
+        spent += elapsed
+        runs += 1
+
+    prepare()
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    cleanup()
+    return best, peak, runs
+
+def parse_density(text, profile):
+    density = dict(PROFILES[profile])
+    for item in filter(None, (text or '').split(',')):
+        key, value = item.split('=')
+        if key not in density:
+            raise SystemExit(f'unknown density {key!r}, one of {", ".join(density)}')
+        density[key] = float(value)
+    return density
+
+def run(args):
+    sizes = [int(size) for size in args.sizes.split(',')]
+    profiles = args.profiles.split(',')
+    stages = args.stages.split(',') if args.stages else list(STAGES)
+    for stage in stages:
+        if stage not in STAGES:
+            raise SystemExit(f'unknown stage {stage!r}, one of {", ".join(STAGES)}')
+
+    results = []
+    print(f'{"stage":<30} {"profile":<8} {"size":>8} {"ms":>11} {"peak KB":>10} {"runs":>5}')
+    for profile in profiles:
+        density = parse_density(args.density, profile)
+        for size in sizes:
+            content = make_content(size, density, args.seed)
+            for stage in stages:
+                if stage in LEGACY_STAGES and size>args.legacy_max_size:
+                    continue
+                seconds, peak, runs = measure(STAGES[stage](content), args.min_time)
+                results.append({'stage': stage, 'profile': profile, 'size': size, 'density': density,
+                                'seconds': seconds, 'peak_bytes': peak, 'runs': runs})
+                print(f'{stage:<30} {profile:<8} {size:>8} {seconds*1000:>11.3f} {peak/1024:>10.1f} {runs:>5}')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'meta': {
+                    'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                    'python': platform.python_version(),
+                    'platform': platform.platform(),
+                    'parser_version': parsers.PARSER_VERSION,
+                    'arguments': vars(args),
+                },
+                'results': results,
+            }, f, indent=1)
+        print(f'results written to {args.output}')
+
+def compare(args):
+    '''Prints the change of every stage between two runs.
+
+    Returns:
+        int: the number of regressions above the threshold
+    '''
+
+    def load(path):
+        with open(path) as f:
+            return {(result['stage'], result['profile'], result['size']): result for result in json.load(f)['results']}
+
+    old, new = load(args.old), load(args.new)
+    regressions = 0
+    print(f'{"stage":<30} {"profile":<8} {"size":>8} {"old ms":>11} {"new ms":>11} {"change":>8} {"peak":>8}')
+    for key in sorted(old.keys() & new.keys()):
+        old_seconds, new_seconds = old[key]['seconds'], new[key]['seconds']
+        change = new_seconds / old_seconds - 1 if old_seconds else 0
+        peak_change = new[key]['peak_bytes'] / old[key]['peak_bytes'] - 1 if old[key]['peak_bytes'] else 0
+        flag = ''
+        if change>args.threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        elif change<-args.threshold:
+            flag = '  faster'
+        print(f'{key[0]:<30} {key[1]:<8} {key[2]:>8} {old_seconds*1000:>11.3f} {new_seconds*1000:>11.3f} {change:>+8.1%} {peak_change:>+8.1%}{flag}')
+    for key in sorted(old.keys() ^ new.keys()):
+        print(f'{key[0]:<30} {key[1]:<8} {key[2]:>8} only in {"old" if key in old else "new"}')
+    print(f'{regressions} regression(s) above {args.threshold:.0%}')
+    return regressions
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    subparsers = arg_parser.add_subparsers(dest='command', required=True)
+    run_parser = subparsers.add_parser('run', help='run the benchmarks')
+    run_parser.add_argument('--sizes', default=','.join(map(str, SIZES)), help='comma separated sizes in characters')
+    run_parser.add_argument('--profiles', default='mixed', help=f'comma separated markup profiles: {", ".join(PROFILES)}')
+    run_parser.add_argument('--density', default='', help='override the profile, for example bold=0.2,links=0.1')
+    run_parser.add_argument('--stages', default='', help='comma separated stages, all by default')
+    run_parser.add_argument('--legacy-max-size', type=int, default=10000, help='largest size the Parser4* classes are run on')
+    run_parser.add_argument('--min-time', type=float, default=0.2, help='seconds spent on each measurement at least')
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--output', help='path of the JSON results')
+    compare_parser = subparsers.add_parser('compare', help='compare two JSON results')
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type=float, default=0.1, help='relative slow down flagged as a regression')
+    args = arg_parser.parse_args()
+
+    if args.command=='run':
+        run(args)
+    elif compare(args):
+        sys.exit(1)
+
+if __name__=='__main__':
+    main()
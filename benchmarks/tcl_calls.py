@@ -0,0 +1,148 @@
+'''Counts the Tcl calls made by Renderer for the articles in data/mds.
+
+The per-character render_line the Renderer used before is kept here as \
+    LegacyRenderer, so both versions can be compared on the same articles.
+
+With a display the calls going through the Text widget's Tcl interpreter are \
+    counted. Without a display (for example on a server) a stand-in Text \
+    widget counts one call for every widget and font method the renderer \
+    invokes, which is what each of them costs in Tcl.
+
+Usage:
+    python benchmarks/tcl_calls.py
+
+'''
+
+import os
+import sys
+import types
+from functools import partial
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import renderer
+import styles
+from renderer import Renderer
+
+MDS_DIR = os.path.join(os.path.dirname(__file__), '..', 'data', 'mds')
+
+class LegacyRenderer(Renderer):
+    '''Renderer with the per-character render_line of the old versions.'''
+
+    def create_tag(self, attrs):
+        my_font = styles.font.Font(self.textarea, self.textarea.cget('font'))
+        attrs.sort()
+        for attr in attrs:
+            if attr=='bold':
+                my_font.configure(weight="bold")
+            elif attr=='italic':
+                my_font.configure(slant='italic')
+            elif attr=='underline':
+                my_font.configure(underline=True)
+            elif attr=='h1':
+                my_font.configure(size=24)
+            elif attr=='h2':
+                my_font.configure(size=20)
+        tag = '_'.join(attrs)
+        self.textarea.tag_configure(tag, font=my_font)
+        return tag
+
+    def render_line(self, line):
+        if line=='\n':
+            self.textarea.insert(renderer.END, '\n')
+        else:
+            line = self.line_2_parsed_chars(line+' ')[:-1]
+            if len(line)>0 and line[0].get('bulleted_list'):
+                self.textarea.insert(renderer.END, '    ' + u'•' + ' ')
+            for char in line:
+                if char.get('link'):
+                    new_heading = char['href']
+                    self.textarea.insert(renderer.END, char['char'], self.hyperlink.add(partial(self.app_state.show, {'screen_name':'view_screen', 'article_name': new_heading})))
+                else:
+                    self.textarea.insert(renderer.END, char['char'])
+                attrs = [ 'bold', 'italic', 'underline', 'link', 'inline_code', 'h1', 'h2', 'bulleted_list' ]
+                char_attrs = []
+                for attr in attrs:
+                    if char.get(attr):
+                        char_attrs.append(attr)
+                self.textarea.tag_add(self.create_tag(char_attrs), 'end -2 chars', 'end -1 chars')
+
+class CountingTk():
+    '''Wraps a Tcl interpreter and counts the calls made through it.'''
+
+    def __init__(self, tk):
+        self.__tk = tk
+        self.calls = 0
+
+    def call(self, *args):
+        self.calls += 1
+        return self.__tk.call(*args)
+
+    def __getattr__(self, name):
+        return getattr(self.__tk, name)
+
+class StandInText():
+    '''Counts the Text widget methods used by Renderer without a display.'''
+
+    def __init__(self):
+        self.tk = types.SimpleNamespace(calls=0)
+
+    def __count(self, *args, **kwargs):
+        self.tk.calls += 1
+
+    insert = tag_add = tag_configure = tag_config = tag_bind = config = __count
+
+    def cget(self, option):
+        self.tk.calls += 1
+        return 'comicsansms 15'
+
+class StandInFont():
+    '''Counts 'font create' and 'font configure' without a display.'''
+
+    def __init__(self, root, *args, **kwargs):
+        root.tk.calls += 1
+        self.root = root
+
+    def configure(self, **options):
+        self.root.tk.calls += 1
+
+def count_calls(renderer_class, content, make_text):
+    '''Renders content with renderer_class and returns the Tcl call count.'''
+
+    text = make_text()
+    state = types.SimpleNamespace(show=lambda options=None, event=None: None)
+    instance = renderer_class(text, content, state)
+    text.tk.calls = 0
+    instance.render()
+    return text.tk.calls
+
+def main():
+    try:
+        from tkinter import Tk, Text
+        root = Tk()
+        def make_text():
+            text = Text(root)
+            text.tk = CountingTk(text.tk)
+            return text
+        mode = 'Tk'
+    except Exception:
+        styles.font = types.SimpleNamespace(Font=StandInFont)
+        make_text = StandInText
+        mode = 'stand-in Text widget, no display'
+
+    print(f'Tcl calls per article ({mode})')
+    print(f'{"article":<24} {"chars":>7} {"per char":>9} {"per run":>8}')
+    total_before = total_after = 0
+    for file_name in sorted(os.listdir(MDS_DIR)):
+        with open(os.path.join(MDS_DIR, file_name), 'r', errors='replace') as f:
+            content = f.read()
+        before = count_calls(LegacyRenderer, content, make_text)
+        after = count_calls(Renderer, content, make_text)
+        total_before += before
+        total_after += after
+        print(f'{file_name[:-3][:24]:<24} {len(content):>7} {before:>9} {after:>8}')
+    print(f'{"total":<24} {"":>7} {total_before:>9} {total_after:>8}')
+    print(f'style registry: {styles.style_registry.stats()}')
+
+if __name__=='__main__':
+    main()
@@ -0,0 +1,174 @@
+'''This module caches parsed lines and blocks in memory.
+
+The same lines are parsed again and again: on every change in the preview \
+    panes, every time an article is opened and when the edit screen renders \
+    the article it just loaded. The caches of this module sit in front of \
+    the parser and are keyed by the content itself, so an unchanged line or \
+    block costs a dictionary lookup (hash of the string plus a comparison) \
+    instead of a full parse.
+
+    from cache import line_cache
+    parsed_line = line_cache.get_or_compute(line, parse_line_function)
+
+'''
+
+import sys
+import threading
+from collections import OrderedDict
+
+# limits of the shared caches
+LINE_CACHE_ENTRIES = 20000
+LINE_CACHE_BYTES = 32 * 1024 * 1024
+BLOCK_CACHE_ENTRIES = 5000
+BLOCK_CACHE_BYTES = 32 * 1024 * 1024
+
+def parsed_line_size(key, parsed_line):
+    '''Estimates the bytes taken by a cached ParsedLine and its key.'''
+
+    return sys.getsizeof(key) + sys.getsizeof(parsed_line.text) + 100 * len(parsed_line.runs) + 64
+
+def parsed_block_size(key, parsed_lines):
+    '''Estimates the bytes taken by a cached tuple of ParsedLines and its key.'''
+
+    size = sys.getsizeof(key) + sys.getsizeof(parsed_lines)
+    for parsed_line in parsed_lines:
+        size += parsed_line_size('', parsed_line)
+    return size
+
+class LRUCache():
+    '''A bounded least recently used cache with statistics.
+
+    The cache holds at most max_entries values and at most max_bytes bytes, \
+        as estimated by the sizeof function. When a new value does not fit, \
+        the least recently used values are evicted. All methods take a lock,\
+        so the cache can be shared by the Tk main thread and the preview \
+        worker thread.
+
+    Attributes:
+        max_entries: maximum number of values
+
+        max_bytes: maximum estimated size of all values
+
+        sizeof: a function (key, value) -> estimated bytes
+
+        hits, misses, evictions: counters, see stats
+
+    Methods:
+        get: returns the value of a key or None
+
+        put: adds a value
+
+        get_or_compute: returns the cached value or computes and adds it
+
+        clear: removes all values
+
+        stats: returns the counters
+    '''
+
+    def __init__(self, max_entries, max_bytes, sizeof):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.lock = threading.Lock()
+        self.entries = OrderedDict() # items: key -> (value, size)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key):
+        '''Returns the value of a key and marks it as recently used.
+
+        Arguments:
+            key: the content the value was computed from
+
+        Returns:
+            the cached value or None
+        '''
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value):
+        '''Adds a value and evicts the least recently used ones if needed.
+
+        A value bigger than max_bytes is not cached at all.
+
+        Arguments:
+            key: the content the value was computed from
+            value: the value to cache
+
+        Returns:
+            None
+        '''
+
+        size = self.sizeof(key, value)
+        if size>self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            self.entries[key] = (value, size)
+            self.bytes += size
+            while len(self.entries)>self.max_entries or self.bytes>self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute):
+        '''Returns the cached value of key or computes, caches and returns it.
+
+        Arguments:
+            key: the content the value is computed from
+            compute: a function (key) -> value, called on a miss
+
+        Returns:
+            the value
+        '''
+
+        value = self.get(key)
+        if value is None:
+            value = compute(key)
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        '''Removes all values, the counters are kept.'''
+
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        '''Returns the counters of the cache.
+
+        Returns:
+            dict: {'entries', 'bytes', 'hits', 'misses', 'evictions'}
+        '''
+
+        return {
+            'entries': len(self.entries),
+            'bytes': self.bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+# raw line -> ParsedLine
+line_cache = LRUCache(LINE_CACHE_ENTRIES, LINE_CACHE_BYTES, parsed_line_size)
+
+# raw block -> tuple of the ParsedLines of the sanitized block
+block_cache = LRUCache(BLOCK_CACHE_ENTRIES, BLOCK_CACHE_BYTES, parsed_block_size)
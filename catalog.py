@@ -0,0 +1,277 @@
+'''This module keeps the list of articles in memory.
+
+Listing the articles used to scan the data/mds directory on every call, and \
+    checking whether a title exists lowercased every file name of the wiki. \
+    The Catalog scans the directory once, keeps a case folded title -> file \
+    name map with the mtime and size of every file, and is updated in place\
+    by data_manager whenever it writes or removes an article. Changes made \
+    by somebody else are noticed by comparing the mtime of the directory.
+
+To start without scanning, the app loads the catalog from a snapshot saved \
+    at the previous exit. The directory is then scanned on another thread \
+    and the result is put in place with reconcile.
+
+'''
+
+import marshal
+import os
+
+# has to be increased whenever the layout of the snapshot changes
+SNAPSHOT_VERSION = 1
+
+class Catalog():
+    '''The articles of a directory, indexed by case folded title.
+
+    Attributes:
+        directory: the directory holding the .md files
+
+        files: a dictionary of type {file_name: (mtime_ns, size)}
+
+        titles: a dictionary of type {case folded title: file_name}
+
+        directory_mtime_ns: mtime of the directory at the last scan or update
+
+        snapshot: True while the content comes from a snapshot which was not\
+            reconciled with the directory yet, revalidate does nothing then
+
+    Methods:
+        load: scans the directory
+
+        scan: reads the directory without changing the catalog
+
+        replace: replaces the content by the result of scan
+
+        reconcile: replaces the content loaded from a snapshot by a scan
+
+        load_snapshot, save_snapshot: reads and writes a snapshot file
+
+        revalidate: scans the directory again if it changed since the last \
+            scan or update
+
+        file_names: the sorted list of file names
+
+        contains: checks if an article exists, ignoring the case
+
+        get: returns the file name and stat of an article
+
+        add: adds or updates an article after it was written
+
+        add_many: adds or updates many articles after they were written
+
+        remove: removes an article after it was deleted
+    '''
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.files = {}
+        self.titles = {}
+        # {case folded title: set of file names}, only for titles which exist\
+        # in more than one case
+        self.__variants = {}
+        self.directory_mtime_ns = None
+        self.snapshot = False
+        self.__sorted = None
+
+    @staticmethod
+    def title_key(title):
+        '''Returns the key of a title in the titles map.'''
+
+        return title.casefold()
+
+    def load(self):
+        '''Scans the directory and replaces the content of the catalog.'''
+
+        self.replace(*self.scan())
+
+    def scan(self):
+        '''Reads the directory, safe to run outside the Tk main thread.
+
+        Returns:
+            tuple: (mtime_ns of the directory, {file_name: (mtime_ns, size)})
+        '''
+
+        files = {}
+        directory_mtime_ns = os.stat(self.directory).st_mtime_ns
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.name.endswith('.md') and entry.is_file():
+                    stat = entry.stat()
+                    files[entry.name] = (stat.st_mtime_ns, stat.st_size)
+        return directory_mtime_ns, files
+
+    def replace(self, directory_mtime_ns, files):
+        '''Replaces the content of the catalog by the result of scan.'''
+
+        self.files = files
+        titles = {}
+        variants = {}
+        for file_name in sorted(files):
+            key = self.title_key(file_name[:-3])
+            if key in titles:
+                variants.setdefault(key, {titles[key]}).add(file_name)
+            else:
+                titles[key] = file_name
+        self.titles = titles
+        self.__variants = variants
+        self.directory_mtime_ns = directory_mtime_ns
+        self.snapshot = False
+        self.__sorted = None
+
+    def reconcile(self, scanned=None):
+        '''Replaces the content loaded from a snapshot by a scan.
+
+        The scan may have run on another thread while articles were written;\
+            if the directory changed since, it is scanned again here.
+
+        Arguments:
+            scanned: the result of scan, or None to scan now
+
+        Returns:
+            bool: True if the list of articles or their stats changed
+        '''
+
+        if scanned is None or os.stat(self.directory).st_mtime_ns!=scanned[0]:
+            scanned = self.scan()
+        changed = scanned[1]!=self.files
+        self.replace(*scanned)
+        return changed
+
+    def load_snapshot(self, path):
+        '''Loads the catalog from a snapshot written by save_snapshot.
+
+        Arguments:
+            path (str): path of the snapshot file
+
+        Returns:
+            bool: True if the snapshot was loaded, False if it is missing, \
+                damaged or made for another directory
+        '''
+
+        try:
+            with open(path, 'rb') as f:
+                version, directory, directory_mtime_ns, files = marshal.load(f)
+        except (OSError, ValueError, EOFError, TypeError):
+            return False
+        if (version, directory)!=(SNAPSHOT_VERSION, self.directory):
+            return False
+        self.replace(directory_mtime_ns, {file_name: tuple(stat) for file_name, stat in files.items()})
+        self.snapshot = True
+        return True
+
+    def save_snapshot(self, path):
+        '''Writes the catalog to a snapshot file, see load_snapshot.
+
+        Raises:
+            OSError: if the file cannot be written
+        '''
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path+'.tmp', 'wb') as f:
+            marshal.dump((SNAPSHOT_VERSION, self.directory, self.directory_mtime_ns, self.files), f)
+        os.replace(path+'.tmp', path)
+
+    def revalidate(self):
+        '''Scans the directory again if it changed since the last scan.
+
+        This costs a single stat call when nothing changed, and nothing \
+            while a snapshot waits to be reconciled.
+
+        Returns:
+            bool: True if the directory was scanned again
+        '''
+
+        if self.snapshot:
+            return False
+        if self.directory_mtime_ns is not None and os.stat(self.directory).st_mtime_ns==self.directory_mtime_ns:
+            return False
+        self.load()
+        return True
+
+    def file_names(self):
+        '''Returns the file names of all articles, sorted by title.
+
+        Returns:
+            list: list of file names like 'Title.md'
+        '''
+
+        if self.__sorted is None:
+            self.__sorted = sorted(self.files, key=lambda file_name: (self.title_key(file_name), file_name))
+        return list(self.__sorted)
+
+    def contains(self, title):
+        '''Checks if an article exists, ignoring the case of the title.'''
+
+        return self.title_key(title) in self.titles
+
+    def get(self, title):
+        '''Returns the file name, mtime and size of an article.
+
+        Arguments:
+            title (str): article name, the case is ignored
+
+        Returns:
+            tuple: (file_name, mtime_ns, size) or None
+        '''
+
+        file_name = self.titles.get(self.title_key(title))
+        if file_name is None:
+            return None
+        return (file_name,) + self.files[file_name]
+
+    def add(self, file_name):
+        '''Adds or updates an article after its file was written.
+
+        Arguments:
+            file_name (str): the file name like 'Title.md'
+
+        Returns:
+            None
+        '''
+
+        self.add_many([file_name])
+
+    def add_many(self, file_names):
+        '''Same as add for many files, the directory is checked only once.'''
+
+        for file_name in file_names:
+            stat = os.stat(os.path.join(self.directory, file_name))
+            if file_name not in self.files:
+                self.__sorted = None
+            self.files[file_name] = (stat.st_mtime_ns, stat.st_size)
+            key = self.title_key(file_name[:-3])
+            other = self.titles.setdefault(key, file_name)
+            if other!=file_name:
+                self.__variants.setdefault(key, {other}).add(file_name)
+        self.__touch()
+
+    def remove(self, file_name):
+        '''Removes an article after its file was deleted or moved away.
+
+        Arguments:
+            file_name (str): the file name like 'Title.md'
+
+        Returns:
+            None
+        '''
+
+        if self.files.pop(file_name, None) is None:
+            return
+        self.__sorted = None
+        key = self.title_key(file_name[:-3])
+        variants = self.__variants.get(key)
+        if variants is None:
+            del self.titles[key]
+        else:
+            # another file has the same title in another case
+            variants.discard(file_name)
+            if self.titles[key]==file_name:
+                self.titles[key] = min(variants)
+            if len(variants)==1:
+                del self.__variants[key]
+        self.__touch()
+
+    def __touch(self):
+        # our own change updated the directory mtime, it is not a reason to
+        # scan again
+        if self.directory_mtime_ns is not None:
+            self.directory_mtime_ns = os.stat(self.directory).st_mtime_ns
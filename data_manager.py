@@ -1,15 +1,122 @@
 '''This modules handles all of the read and writes from the database.
 
-Currently all the articles are residing inside a directory inside the app.
-But later it can be easily integrated to some cloud database.
+By default all the articles are residing inside a directory inside the app.
+The reads and writes go through a Storage (see the storage module), and \
+    the backend is chosen by the environment:
+    OWNWIKI_STORAGE=directory   .md files in data/mds (the default)
+    OWNWIKI_STORAGE=sqlite      a SQLite database, data/wiki.sqlite3 or the\
+        path in OWNWIKI_DB
+
+Nothing outside this module and the storage module touches the article \
+    files: the caches built from the articles check them with version and \
+    versions, and links are checked with contains.
+
+The directory backend keeps the list of articles in memory in a Catalog, \
+    which is loaded on first use and updated by create_and_save, edit and \
+    delete. The app loads it from a snapshot instead, see \
+    load_catalog_snapshot.
+
+Other modules keeping something derived from the articles (the search index,\
+    for example) subscribe to the changes:
+    data_manager.subscribe(listener)  # listener(action, file_name, content)
+    where action is 'save' or 'delete'.
 
 '''
 
 from datetime import datetime
 import os 
 
+from instrumentation import span
+from revisions import RevisionStore
+from storage import DirectoryStorage, SqliteStorage
+
 BASE_DIR = os.getcwd()
 
+STORAGE_BACKEND = os.environ.get('OWNWIKI_STORAGE', 'directory')
+SQLITE_PATH = os.environ.get('OWNWIKI_DB', os.path.join(BASE_DIR, 'data', 'wiki.sqlite3'))
+
+def make_storage(backend):
+    '''Makes the Storage of the wiki.
+
+    Arguments:
+        backend (str): 'directory' or 'sqlite'
+
+    Returns:
+        Storage: the storage
+
+    Raises:
+        ValueError: if there is no such backend
+    '''
+
+    if backend=='directory':
+        return DirectoryStorage(os.path.join(BASE_DIR, 'data', 'mds'), RevisionStore(os.path.join(BASE_DIR, 'data', 'revisions')))
+    if backend=='sqlite':
+        os.makedirs(os.path.dirname(SQLITE_PATH) or '.', exist_ok=True)
+        return SqliteStorage(SQLITE_PATH)
+    raise ValueError(f"unknown storage backend {backend!r}, OWNWIKI_STORAGE has to be 'directory' or 'sqlite'")
+
+storage = make_storage(STORAGE_BACKEND)
+
+CATALOG_SNAPSHOT_PATH = os.path.join(BASE_DIR, 'data', 'cache', 'catalog.snapshot')
+
+listeners = []
+
+def subscribe(listener):
+    '''Registers a function called after every change of an article.
+
+    Arguments:
+        listener: a function (action, file_name, file_content) where action\
+            is 'save' or 'delete' and file_content is None for 'delete'
+
+    Returns:
+        None
+
+    '''
+
+    listeners.append(listener)
+
+def notify(action, file_name, file_content=None):
+    '''Calls every subscribed listener, see subscribe.'''
+
+    for listener in listeners:
+        listener(action, file_name, file_content)
+
+def load_catalog_snapshot():
+    '''Loads the list of articles from the snapshot saved at the last exit.
+
+    The list has to be reconciled with the storage afterwards: scan (on \
+        any thread) and then reconcile. Backends which do not need a \
+        snapshot return False.
+
+    Returns:
+        bool: True if the snapshot was loaded
+    '''
+
+    with span('data_manager.load_catalog_snapshot'):
+        return storage.load_snapshot(CATALOG_SNAPSHOT_PATH)
+
+def save_catalog_snapshot():
+    '''Saves the list of articles for the next start.'''
+
+    try:
+        storage.save_snapshot(CATALOG_SNAPSHOT_PATH)
+    except OSError:
+        pass
+
+def scan():
+    '''Reads the list of articles for reconcile, safe outside the Tk main thread.'''
+
+    return storage.scan()
+
+def reconcile(scanned=None):
+    '''Replaces the list loaded by load_catalog_snapshot by the result of scan.
+
+    Returns:
+        bool: True if the list of articles changed
+    '''
+
+    return storage.reconcile(scanned)
+
 def random_id():
     '''Generates a random id from the current time.'''
 
@@ -17,6 +124,63 @@ def random_id():
     now = now.replace(':', '').replace(' ', '')
     return str(now)
 
+def contains(file_name):
+    '''Checks if an article exists, cheap enough for every link of a page.
+
+    See Storage.contains, call revalidate first to notice the articles \
+        changed by something else.
+
+    Arguments:
+        file_name (str): article name
+
+    Returns:
+        bool
+
+    '''
+
+    return storage.contains(file_name)
+
+def revalidate():
+    '''Notices the articles changed by something else, see Storage.revalidate.'''
+
+    storage.revalidate()
+
+def stat(file_name):
+    '''Returns the stored name, version and size of an article.
+
+    Arguments:
+        file_name (str): article name, the case is ignored
+
+    Returns:
+        tuple: (file name like 'Title.md', version, size) or None
+
+    '''
+
+    return storage.stat(file_name)
+
+def version(file_name):
+    '''Returns the version and size of an article, see Storage.version.
+
+    Arguments:
+        file_name (str): article name
+
+    Returns:
+        tuple: (version, size) or None if there is no such article
+
+    '''
+
+    return storage.version(file_name)
+
+def versions():
+    '''Returns the version and size of every article.
+
+    Returns:
+        dict: a dictionary of type {file_name: (version, size)}
+
+    '''
+
+    return storage.versions()
+
 def create_and_save(file_name, file_content):
     '''Creates a new article and saves it to directory.
     
@@ -29,12 +193,31 @@ def create_and_save(file_name, file_content):
     
     '''
     
-    path = os.path.join(BASE_DIR, 'data', 'mds', file_name+'.md')
-    with open(path, 'w') as f:
-        f.write(file_content)
+    with span('data_manager.create_and_save'):
+        storage.create_and_save(file_name, file_content)
+    notify('save', file_name, file_content)
+
+def save_many(articles):
+    '''Saves many articles at once, see create_and_save.
+
+    Arguments:
+        articles: a list of (file_name, file_content)
+
+    Returns:
+        int: the number of articles saved
+
+    '''
+
+    count = storage.save_many(articles)
+    for file_name, file_content in articles:
+        notify('save', file_name, file_content)
+    return count
 
 def get_articles_list():
-    '''Scans over the database and finds all of the article names.
+    '''Returns the file names of all articles, sorted by title.
+
+    The names come from the catalog. The directory is only scanned again \
+        when its mtime changed since the last scan.
     
     Arguments:
         None 
@@ -44,8 +227,21 @@ def get_articles_list():
     
     '''
     
-    path = os.path.join(BASE_DIR, 'data', 'mds')
-    return os.listdir(path)
+    with span('data_manager.get_articles_list'):
+        return storage.get_articles_list()
+
+def exists(file_name):
+    '''Checks if an article exists, ignoring the case of the name.
+
+    Arguments:
+        file_name (str): article name
+
+    Returns:
+        bool
+
+    '''
+
+    return storage.exists(file_name)
 
 def get(file_name):
     '''Reads the article content.
@@ -58,9 +254,8 @@ def get(file_name):
         
     '''
     
-    path = os.path.join(BASE_DIR, 'data', 'mds', file_name+'.md')
-    with open(path, 'r') as f:
-        return f.read()
+    with span('data_manager.get'):
+        return storage.get(file_name)
 
 def delete(file_name):
     '''Deletes an article from the database.
@@ -73,9 +268,9 @@ def delete(file_name):
     
     '''
 
-    path = os.path.join(BASE_DIR, 'data', 'mds', file_name+'.md')
-    dst = os.path.join(BASE_DIR, 'data', 'removed_mds', file_name+random_id()+'.md')
-    os.rename(path, dst)
+    with span('data_manager.delete'):
+        storage.delete(file_name)
+    notify('delete', file_name)
 
 def edit(file_name, file_content):
     '''Edits an article in the database.
@@ -88,8 +283,9 @@ def edit(file_name, file_content):
     
     '''
     
-    delete(file_name)
-    create_and_save(file_name, file_content)
+    with span('data_manager.edit'):
+        storage.edit(file_name, file_content)
+    notify('save', file_name, file_content)
 
 def check_data(file_name, file_content, action='create'):
     '''Checks that if create and save or edit and save can be performed.
@@ -115,8 +311,7 @@ def check_data(file_name, file_content, action='create'):
             'code': 1,
             'message': 'Article Name cannot be blank',
         }
-    all_articles = list(map(lambda x:x[:-3].lower(), get_articles_list()))
-    if action=='create' and file_name.lower() in all_articles:
+    if action=='create' and exists(file_name):
         return {
             'code': 2,
             'message': 'An article with the same name already exists. Do you still want to overwrite the existing article(yes) or edit the existing article?(no)',
@@ -1,32 +1,76 @@
+from itertools import count
+
 from tkinter import CURRENT
 
+# the link tags of all managers are numbered by one counter, so the tags of\
+# two managers on the same Text widget never clash
+_tag_numbers = count()
+
 class HyperlinkManager:
     '''This Class is used for making links in text area.
-    
-    For more details visit the following link. This class is taken from the \
+
+    For more details visit the following link. This class is based on the \
         following link
     # https://stackoverflow.com/questions/50327234/adding-link-to-text-in-text-widget-in-tkinter
 
+    Every link gets one tag and one action, whatever the length of its text:\
+        the Renderer calls add once per link and uses the returned tags for \
+        all of its text. A click is resolved through the link tag under the \
+        mouse. The tags of text which is deleted again (like a block of the \
+        preview) have to be removed, so their number follows the links \
+        shown and not all the links ever rendered.
+
+    Attributes:
+        text: The Text widget
+
+        links: A dictionary of type {tag: action}, in the order of add
+
+    Methods:
+        add: Adds a link and returns its tags.
+
+        remove: Removes links.
+
+        reset: Removes every link.
     '''
-    
+
     def __init__(self, text):
         self.text = text
         self.text.tag_config("hyper", foreground="blue", underline=1)
         self.text.tag_bind("hyper", "<Enter>", self._enter)
         self.text.tag_bind("hyper", "<Leave>", self._leave)
         self.text.tag_bind("hyper", "<Button-1>", self._click)
-        self.reset()
+        self.links = {}
 
     def reset(self):
-        self.links = {}
+        '''Removes every link of this manager, see remove.'''
+
+        self.remove(list(self.links))
 
     def add(self, action):
-        # add an action to the manager.  returns tags to use in
-        # associated text widget
-        tag = "hyper-%d" % len(self.links)
+        '''Adds a link.
+
+        Arguments:
+            action: A function called without arguments on a click
+
+        Returns:
+            tuple: the tags to give to the text of the link
+        '''
+
+        tag = "hyper-%d" % next(_tag_numbers)
         self.links[tag] = action
         return "hyper", tag
 
+    def remove(self, tags):
+        '''Removes links, the tags are deleted from the Text widget.
+
+        Arguments:
+            tags: the link tags, like the second tag returned by add
+        '''
+
+        tags = [tag for tag in tags if self.links.pop(tag, None) is not None]
+        if tags:
+            self.text.tag_delete(*tags)
+
     def _enter(self, event):
         self.text.config(cursor="hand2")
 
@@ -35,6 +79,6 @@ class HyperlinkManager:
 
     def _click(self, event):
         for tag in self.text.tag_names(CURRENT):
-            if tag[:6] == "hyper-":
+            if tag[:6] == "hyper-" and tag in self.links:
                 self.links[tag]()
                 return
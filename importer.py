@@ -0,0 +1,285 @@
+'''This module imports a tree of .md files into the wiki.
+
+    python importer.py SOURCE [--batch-size N] [--processes N] [--overwrite]\
+        [--restart]
+
+Every .md file below SOURCE becomes an article named after the file. The \
+    files are read and parsed on a process pool, which also fills the \
+    render cache, and the articles are written through data_manager in \
+    batches, so the catalog is updated once per batch.
+
+A file is not imported when data_manager.check_data would refuse it or ask \
+    first: a blank title, a blank content, or a title which already exists ignoring the case (unless \
+    --overwrite is given, then the existing article is replaced and keeps \
+    the case of its title). Two source files whose titles differ only in case\
+    are reported as a collision as well, the first one is imported.
+
+Finished batches are written to a journal in data/cache, so an interrupted \
+    import started again skips the files it already imported. --restart \
+    ignores the journal.
+
+'''
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import data_manager
+import render_cache
+from catalog import Catalog
+from pipeline import content_2_parsed_blocks
+
+JOURNAL_DIR = os.path.join(data_manager.BASE_DIR, 'data', 'cache', 'import')
+
+BATCH_SIZE = 500
+
+def find_files(source):
+    '''Returns the paths of the .md files below source, sorted.'''
+
+    paths = []
+    for root, directories, files in os.walk(source):
+        directories.sort()
+        for file_name in sorted(files):
+            if file_name.endswith('.md'):
+                paths.append(os.path.join(root, file_name))
+    return paths
+
+def prepare_file(path):
+    '''Reads and parses a source file, run on the process pool.
+
+    Returns:
+        tuple: (path, title, content, parsed blocks, size), content and \
+            parsed blocks are None and the error message is in the place of\
+            the parsed blocks when the file can not be read
+    '''
+
+    title = os.path.basename(path)[:-3]
+    try:
+        with open(path, 'r') as f:
+            content = f.read()
+    except (OSError, UnicodeDecodeError) as e:
+        return path, title, None, str(e), 0
+    return path, title, content, content_2_parsed_blocks(content), len(content.encode('utf-8', 'surrogatepass'))
+
+class Journal():
+    '''The source files already imported from a source directory.
+
+    Attributes:
+        path: path of the journal file, one JSON list [path, mtime_ns, size]\
+            per line
+
+        done: a dictionary of type {path: (mtime_ns, size)}
+    '''
+
+    def __init__(self, source):
+        key = hashlib.sha1(os.path.abspath(source).encode('utf-8', 'surrogatepass')).hexdigest()
+        self.path = os.path.join(JOURNAL_DIR, key+'.journal')
+        self.done = {}
+
+    def load(self):
+        '''Reads the journal, a partly written last line is ignored.'''
+
+        try:
+            with open(self.path, 'r') as f:
+                for line in f:
+                    try:
+                        path, mtime_ns, size = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.done[path] = (mtime_ns, size)
+        except FileNotFoundError:
+            pass
+
+    def is_done(self, path):
+        '''Checks if a file was imported and did not change since.'''
+
+        stat = os.stat(path)
+        return self.done.get(path)==(stat.st_mtime_ns, stat.st_size)
+
+    def add(self, paths):
+        '''Records a finished batch, the journal is flushed to disk.'''
+
+        os.makedirs(JOURNAL_DIR, exist_ok=True)
+        with open(self.path, 'a') as f:
+            for path in paths:
+                stat = os.stat(path)
+                self.done[path] = (stat.st_mtime_ns, stat.st_size)
+                f.write(json.dumps([path, stat.st_mtime_ns, stat.st_size])+'\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def clear(self):
+        '''Forgets every imported file.'''
+
+        self.done = {}
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+class Importer():
+    '''Imports the .md files of a source directory, see the module docstring.
+
+    Attributes:
+        source: the source directory
+
+        batch_size: number of articles written at once
+
+        processes: size of the process pool, default is the cpu count
+
+        overwrite: True to replace existing articles with the same title
+
+        journal: the Journal of source
+
+        result: counters, {'files', 'skipped', 'imported', 'bytes', \
+            'collisions', 'invalid', 'failed'}, the last three are lists of \
+            (path, reason)
+
+    Methods:
+        run: imports everything
+    '''
+
+    def __init__(self, source, batch_size=BATCH_SIZE, processes=None, overwrite=False, report=None):
+        self.source = source
+        self.batch_size = batch_size
+        self.processes = processes
+        self.overwrite = overwrite
+        self.report = report
+        self.journal = Journal(source)
+        self.result = {'files': 0, 'skipped': 0, 'imported': 0, 'bytes': 0, 'collisions': [], 'invalid': [], 'failed': []}
+        self.titles = {}
+
+    def check(self, path, title, content):
+        '''Returns why a file can not be imported, and the title to write.
+
+        An article which exists already with the title in another case is \
+            written under its existing title, so --overwrite replaces it \
+            instead of adding a second file.
+
+        Returns:
+            tuple: (reason, title) where reason is 'collision', 'invalid', \
+                'done' when the wiki already has the same article, or None
+        '''
+
+        key = Catalog.title_key(title)
+        if key in self.titles:
+            self.result['collisions'].append((path, f'same title as {self.titles[key]}'))
+            return 'collision', title
+        response = data_manager.check_data(title, content, 'create')
+        if response['code']==1:
+            self.result['invalid'].append((path, response['message']))
+            return 'invalid', title
+        if content.strip()=='':
+            # the app asks before saving a blank article, check_data only
+            # tells when the title is new (code 3)
+            self.result['invalid'].append((path, 'The article content is blank'))
+            return 'invalid', title
+        if response['code']==2:
+            stored = data_manager.stat(title)
+            if stored is not None:
+                title = stored[0][:-3]
+            if not self.overwrite:
+                if self.is_stored(title, content):
+                    # written by an import interrupted before its journal entry
+                    self.titles[key] = path
+                    return 'done', title
+                self.result['collisions'].append((path, 'an article with the same title exists'))
+                return 'collision', title
+        self.titles[key] = path
+        return None, title
+
+    @staticmethod
+    def is_stored(title, content):
+        '''Checks if the wiki already has an article with this content.'''
+
+        try:
+            return data_manager.get(title)==content
+        except (OSError, UnicodeDecodeError):
+            return False
+
+    def write_batch(self, batch):
+        '''Saves a batch of prepared files and stores their render cache.'''
+
+        data_manager.save_many([(title, content) for path, title, content, parsed_blocks, size in batch])
+        for path, title, content, parsed_blocks, size in batch:
+            version = data_manager.version(title)
+            if version is not None:
+                # None when the file went away since, then nothing is cached
+                render_cache.store(title, version, parsed_blocks)
+            self.result['imported'] += 1
+            self.result['bytes'] += size
+        self.journal.add([prepared[0] for prepared in batch])
+
+    def run(self):
+        '''Imports every file which was not imported before.
+
+        Returns:
+            dict: see result
+        '''
+
+        self.journal.load()
+        paths = []
+        for path in find_files(self.source):
+            self.result['files'] += 1
+            if self.journal.is_done(path):
+                self.result['skipped'] += 1
+            else:
+                paths.append(path)
+
+        started = time.perf_counter()
+        batch = []
+        with ProcessPoolExecutor(max_workers=self.processes) as executor:
+            for prepared in executor.map(prepare_file, paths, chunksize=32):
+                path, title, content, parsed_blocks, size = prepared
+                if content is None:
+                    self.result['failed'].append((path, parsed_blocks))
+                    continue
+                reason, title = self.check(path, title, content)
+                if reason=='done':
+                    self.result['skipped'] += 1
+                    self.journal.add([path])
+                if reason is not None:
+                    continue
+                batch.append((path, title, content, parsed_blocks, size))
+                if len(batch)>=self.batch_size:
+                    self.write_batch(batch)
+                    batch = []
+                    if self.report is not None:
+                        self.report(self.result, time.perf_counter()-started)
+        if batch:
+            self.write_batch(batch)
+        self.result['seconds'] = time.perf_counter() - started
+        return self.result
+
+def throughput(result, seconds):
+    '''Returns a line with the imported files and the throughput.'''
+
+    seconds = max(seconds, 1e-9)
+    return (f'{result["imported"]} files, {result["bytes"]/1e6:.1f} MB in {seconds:.2f} s: '
+            f'{result["imported"]/seconds:.0f} files/s, {result["bytes"]/1e6/seconds:.2f} MB/s')
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Imports a tree of .md files into the wiki.')
+    arg_parser.add_argument('source', help='directory of the .md files')
+    arg_parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    arg_parser.add_argument('--processes', type=int, default=None, help='size of the process pool')
+    arg_parser.add_argument('--overwrite', action='store_true', help='replace existing articles with the same title')
+    arg_parser.add_argument('--restart', action='store_true', help='ignore the files imported before')
+    args = arg_parser.parse_args()
+
+    importer = Importer(args.source, args.batch_size, args.processes, args.overwrite, report=lambda result, seconds: print(throughput(result, seconds)))
+    if args.restart:
+        importer.journal.clear()
+    result = importer.run()
+    print(throughput(result, result['seconds']))
+    print(f'{result["files"]} files found, {result["skipped"]} already imported')
+    for kind in ('collisions', 'invalid', 'failed'):
+        for path, reason in result[kind]:
+            print(f'{kind}: {path}: {reason}', file=sys.stderr)
+
+if __name__=='__main__':
+    main()
@@ -0,0 +1,297 @@
+'''This module measures where the time of the app goes.
+
+Code paths are wrapped in named spans, and counters are counted:
+
+    from instrumentation import span, count
+    with span('data_manager.get'):
+        ...
+    count('render_cache.hit')
+
+While instrumentation is enabled, every span adds its duration to a latency \
+    histogram of its name. The histograms and counters stay in memory and \
+    are written as JSON by dump, and at exit. While it is disabled, span \
+    returns one shared object doing nothing and count returns at once, so \
+    the instrumented code pays for a function call and a flag test.
+
+A single navigation or render can be run under cProfile: profile_next(name)\
+    arms the profiler for the next span of that name, the profile is saved \
+    to data/cache/profiles/<name>-<time>.prof when the span ends.
+
+It is enabled by the environment:
+    OWNWIKI_INSTRUMENT=1            enables the spans and counters
+    OWNWIKI_INSTRUMENT_OUT=path     where to dump at exit
+    OWNWIKI_PROFILE_NEXT=state.show profiles the first span of that name
+
+In the app, Ctrl+Shift+P profiles the next navigation and Ctrl+Shift+D \
+    dumps the statistics, see install_shortcuts.
+
+Spans also end on the worker threads (prefetch, search index, link graph), \
+    so the histograms, counters and armed names are only touched while \
+    holding lock.
+
+'''
+
+import atexit
+import cProfile
+import json
+import math
+import os
+import sys
+import threading
+import time
+
+DATA_DIR = os.path.join(os.getcwd(), 'data', 'cache')
+DUMP_PATH = os.path.join(DATA_DIR, 'instrumentation.json')
+PROFILES_DIR = os.path.join(DATA_DIR, 'profiles')
+
+# histogram buckets: bucket i holds durations up to 2**i microseconds
+BUCKETS = 32
+
+enabled = False
+histograms = {}
+counters = {}
+armed = set()
+lock = threading.Lock()
+
+class Histogram():
+    '''A latency histogram with power of two buckets.
+
+    Attributes:
+        count, total, minimum, maximum: of the recorded durations, in seconds
+
+        buckets: bucket i counts the durations up to 2**i microseconds
+    '''
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.minimum = math.inf
+        self.maximum = 0.0
+        self.buckets = [0] * BUCKETS
+
+    def add(self, seconds):
+        '''Records a duration.'''
+
+        self.count += 1
+        self.total += seconds
+        if seconds<self.minimum:
+            self.minimum = seconds
+        if seconds>self.maximum:
+            self.maximum = seconds
+        microseconds = int(seconds * 1e6)
+        self.buckets[min(microseconds.bit_length(), BUCKETS-1)] += 1
+
+    def percentile(self, fraction):
+        '''Returns the upper bound of the bucket holding a percentile, in seconds.'''
+
+        if self.count==0:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for i, bucket in enumerate(self.buckets):
+            seen += bucket
+            if seen>=rank:
+                return min((1 << i) / 1e6, self.maximum)
+        return self.maximum
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'total_ms': self.total * 1000,
+            'mean_ms': self.total / self.count * 1000 if self.count else 0,
+            'min_ms': self.minimum * 1000 if self.count else 0,
+            'max_ms': self.maximum * 1000,
+            'p50_ms': self.percentile(0.5) * 1000,
+            'p90_ms': self.percentile(0.9) * 1000,
+            'p99_ms': self.percentile(0.99) * 1000,
+            'buckets_us': {str(1 << i): bucket for i, bucket in enumerate(self.buckets) if bucket},
+        }
+
+class _NullSpan():
+    # returned by span while instrumentation is disabled
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+NULL_SPAN = _NullSpan()
+
+class Span():
+    '''Times a block of code into the histogram of its name.'''
+
+    __slots__ = ('name', 'started', 'profiler')
+
+    def __init__(self, name):
+        self.name = name
+        self.profiler = None
+
+    def __enter__(self):
+        if armed:
+            with lock:
+                profile = self.name in armed
+                armed.discard(self.name)
+            if profile:
+                self.profiler = cProfile.Profile()
+                self.profiler.enable()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.started
+        with lock:
+            histogram = histograms.get(self.name)
+            if histogram is None:
+                histograms[self.name] = histogram = Histogram()
+            histogram.add(elapsed)
+        if self.profiler is not None:
+            self.profiler.disable()
+            save_profile(self.name, self.profiler)
+        return False
+
+def span(name):
+    '''Returns a context manager timing the code inside it.
+
+    Arguments:
+        name (str): name of the span, like 'data_manager.get'
+
+    Returns:
+        a context manager
+    '''
+
+    if not enabled and not armed:
+        return NULL_SPAN
+    return Span(name)
+
+def count(name, amount=1):
+    '''Adds amount to the counter name.'''
+
+    if enabled:
+        with lock:
+            counters[name] = counters.get(name, 0) + amount
+
+def timed(name):
+    '''Decorator running a function inside span(name).'''
+
+    def decorator(function):
+        def wrapper(*args, **kwargs):
+            if not enabled and not armed:
+                return function(*args, **kwargs)
+            with Span(name):
+                return function(*args, **kwargs)
+        wrapper.__name__ = function.__name__
+        wrapper.__qualname__ = function.__qualname__
+        wrapper.__doc__ = function.__doc__
+        wrapper.__wrapped__ = function
+        return wrapper
+    return decorator
+
+def enable():
+    '''Starts recording spans and counters.'''
+
+    global enabled
+    enabled = True
+
+def disable():
+    '''Stops recording, the recorded statistics are kept.'''
+
+    global enabled
+    enabled = False
+
+def reset():
+    '''Forgets the recorded statistics.'''
+
+    with lock:
+        histograms.clear()
+        counters.clear()
+
+def profile_next(name):
+    '''Runs the next span called name under cProfile, see save_profile.'''
+
+    with lock:
+        armed.add(name)
+
+def save_profile(name, profiler):
+    '''Saves a profile to PROFILES_DIR, it can be read with pstats.
+
+    The path is reported on stderr, the span may have ended on a worker \
+        thread which can not show anything.
+
+    Returns:
+        str: path of the profile
+    '''
+
+    os.makedirs(PROFILES_DIR, exist_ok=True)
+    path = os.path.join(PROFILES_DIR, f'{name}-{time.strftime("%Y%m%d-%H%M%S")}.prof')
+    profiler.dump_stats(path)
+    print(f'profile of {name} saved to {path}', file=sys.stderr)
+    return path
+
+def snapshot():
+    '''Returns the statistics as a dictionary.'''
+
+    with lock:
+        spans = {name: histogram.to_dict() for name, histogram in sorted(histograms.items())}
+        counted = dict(sorted(counters.items()))
+    return {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'spans': spans,
+        'counters': counted,
+    }
+
+def dump(path=None):
+    '''Writes the statistics as JSON.
+
+    Arguments:
+        path (str): the file, DUMP_PATH by default
+
+    Returns:
+        str: the path written
+    '''
+
+    path = path or DUMP_PATH
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(snapshot(), f, indent=1)
+    return path
+
+def __dump_at_exit():
+    if enabled and (histograms or counters):
+        try:
+            dump(os.environ.get('OWNWIKI_INSTRUMENT_OUT'))
+        except OSError:
+            pass
+
+atexit.register(__dump_at_exit)
+
+def install_shortcuts(root):
+    '''Binds Ctrl+Shift+P (profile the next navigation) and Ctrl+Shift+D \
+        (dump the statistics) on a Tk root window.
+
+    What they did is shown in a message box.'''
+
+    from messages import show_message
+
+    def profile(event=None):
+        profile_next('state.show')
+        show_message('info', f'The next navigation will be profiled, the profile is saved in {PROFILES_DIR}')
+
+    def dump_now(event=None):
+        if not enabled:
+            enable()
+            show_message('info', 'Instrumentation enabled, dump again later to get statistics')
+            return
+        try:
+            path = dump()
+        except OSError as e:
+            show_message('error', f'The statistics could not be written: {e}')
+            return
+        show_message('info', f'Statistics written to {path}')
+
+    root.bind_all('<Control-Shift-KeyPress-P>', profile)
+    root.bind_all('<Control-Shift-KeyPress-D>', dump_now)
+
+if os.environ.get('OWNWIKI_INSTRUMENT', '') not in ('', '0'):
+    enable()
+if os.environ.get('OWNWIKI_PROFILE_NEXT'):
+    profile_next(os.environ['OWNWIKI_PROFILE_NEXT'])
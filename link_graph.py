@@ -0,0 +1,368 @@
+'''This module keeps the graph of the links between the articles.
+
+For every article the graph records the articles it links to (outgoing) and \
+    the articles linking to it (incoming), so the "what links here" list of \
+    an article and the links pointing to missing articles are found without \
+    opening any page. Like the search index, it is updated by data_manager \
+    whenever an article is saved or removed, stored in data/cache and \
+    reconciled with the storage by version and size on the next start.
+
+Loading and refreshing the graph reads every article changed since it was \
+    stored, so the app does it on a background thread (see start_loading) \
+    and the screens ask for the graph with get_graph(wait=False), which \
+    returns None until it is ready.
+
+Titles are compared case folded, the same way the catalog does.
+
+    python link_graph.py rebuild
+    python link_graph.py backlinks "Article Name"
+    python link_graph.py dangling
+
+'''
+
+import argparse
+import atexit
+import os
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+
+import data_manager
+from catalog import Catalog
+from parsers import PARSER_VERSION
+from pipeline import content_2_parsed_blocks
+
+GRAPH_PATH = os.path.join(data_manager.BASE_DIR, 'data', 'cache', 'link_graph.pickle')
+
+# has to be increased whenever the layout of the stored graph changes
+GRAPH_VERSION = 1
+
+def extract_links(content):
+    '''Returns the link targets of an article, in order, without duplicates.
+
+    Arguments:
+        content (str): article content
+
+    Returns:
+        tuple: the targets as they are written in the links
+    '''
+
+    targets = {}
+    for parsed_lines in content_2_parsed_blocks(content):
+        for line in parsed_lines:
+            for start, end, mask, href in line.runs:
+                if href is not None:
+                    targets[href] = None
+    return tuple(targets)
+
+class LinkGraph():
+    '''The links between the articles in both directions.
+
+    Attributes:
+        outgoing: a dictionary of type {title key: (title, version, size, \
+            tuple of targets)}
+
+        incoming: a dictionary of type {title key: set of titles linking to it}
+
+        dirty: True if the graph changed since it was loaded or saved
+
+    Methods:
+        update: records the links of an article, replacing the old ones
+
+        remove: removes the links of an article
+
+        links: the targets an article links to
+
+        backlinks: the articles linking to an article
+
+        dangling: the targets of an article which do not exist
+
+        refresh: updates the articles which changed according to a storage
+
+        save: writes the graph to a file
+
+        load: reads a graph from a file
+    '''
+
+    def __init__(self):
+        self.outgoing = {}
+        self.incoming = {}
+        self.dirty = False
+
+    def __len__(self):
+        return len(self.outgoing)
+
+    @staticmethod
+    def key(title):
+        '''Returns the key of a title, see Catalog.title_key.'''
+
+        return Catalog.title_key(title)
+
+    def update(self, title, content, version=None, size=None):
+        '''Records the links of an article, replacing the old ones.
+
+        Arguments:
+            title (str): article name
+            content (str): article content
+            version, size: see Storage.version, used by refresh
+
+        Returns:
+            None
+        '''
+
+        self.set_links(title, version, size, extract_links(content))
+
+    def set_links(self, title, version, size, targets):
+        '''Same as update, for links already extracted by extract_links.'''
+
+        self.remove(title)
+        self.outgoing[self.key(title)] = (title, version, size, targets)
+        for target in targets:
+            sources = self.incoming.get(self.key(target))
+            if sources is None:
+                self.incoming[self.key(target)] = sources = set()
+            sources.add(title)
+        self.dirty = True
+
+    def remove(self, title):
+        '''Removes the links of an article. Links to it are kept.'''
+
+        entry = self.outgoing.pop(self.key(title), None)
+        if entry is None:
+            return
+        for target in entry[3]:
+            sources = self.incoming.get(self.key(target))
+            if sources is not None:
+                sources.discard(entry[0])
+                if not sources:
+                    del self.incoming[self.key(target)]
+        self.dirty = True
+
+    def links(self, title):
+        '''Returns the targets an article links to.'''
+
+        entry = self.outgoing.get(self.key(title))
+        return entry[3] if entry is not None else ()
+
+    def backlinks(self, title):
+        '''Returns the titles of the articles linking to an article, sorted.'''
+
+        return sorted(self.incoming.get(self.key(title), ()), key=self.key)
+
+    def dangling(self, title, storage):
+        '''Returns the targets of an article which are not in the storage.'''
+
+        return [target for target in self.links(title) if not storage.contains(target)]
+
+    def all_dangling(self, storage):
+        '''Returns every link to a missing article.
+
+        Returns:
+            dict: a dictionary of type {title: list of missing targets}
+        '''
+
+        result = {}
+        for title, version, size, targets in self.outgoing.values():
+            missing = [target for target in targets if not storage.contains(target)]
+            if missing:
+                result[title] = missing
+        return result
+
+    def refresh(self, storage, versions=None):
+        '''Updates the articles which are new or changed according to storage.
+
+        Articles which are not in the storage any more are removed.
+
+        Arguments:
+            storage: a storage.Storage
+            versions: the result of storage.versions(), taken here if None
+
+        Returns:
+            int: the number of articles read again
+        '''
+
+        if versions is None:
+            versions = storage.versions()
+        keys = set()
+        count = 0
+        for file_name, (version, size) in versions.items():
+            title = file_name[:-3]
+            keys.add(self.key(title))
+            entry = self.outgoing.get(self.key(title))
+            if entry is not None and entry[0]==title and entry[1]==version and entry[2]==size:
+                continue
+            try:
+                content = storage.get(title)
+            except (OSError, UnicodeDecodeError):
+                continue
+            self.update(title, content, version, size)
+            count += 1
+        for title, *rest in [entry for key, entry in self.outgoing.items() if key not in keys]:
+            self.remove(title)
+        return count
+
+    def save(self, path=GRAPH_PATH):
+        '''Writes the graph to a file, replacing it atomically.'''
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path+'.tmp', 'wb') as f:
+            pickle.dump({
+                'version': (GRAPH_VERSION, PARSER_VERSION),
+                'outgoing': self.outgoing,
+                'incoming': self.incoming,
+            }, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path+'.tmp', path)
+        self.dirty = False
+
+    @classmethod
+    def load(cls, path=GRAPH_PATH):
+        '''Reads a graph written by save.
+
+        A file which can not be read or is outdated is deleted, the graph is \
+            then built again by refresh.
+
+        Returns:
+            LinkGraph: the graph, empty if the file is missing or outdated
+        '''
+
+        graph = cls()
+        try:
+            with open(path, 'rb') as f:
+                data = pickle.load(f)
+            if data['version']==(GRAPH_VERSION, PARSER_VERSION):
+                graph.outgoing = data['outgoing']
+                graph.incoming = data['incoming']
+                return graph
+        except FileNotFoundError:
+            return graph
+        except Exception:
+            # a damaged or foreign pickle fails in many ways
+            pass
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return cls()
+
+_graph = None
+
+# the future of load while the graph is loading, and the changes of the
+# articles made meanwhile, applied once it is loaded
+_loading = None
+_pending = []
+
+def load(versions):
+    '''Loads the stored graph and refreshes it, runs on a background thread.
+
+    Arguments:
+        versions: the result of data_manager.versions()
+
+    Returns:
+        LinkGraph: the graph
+    '''
+
+    graph = LinkGraph.load()
+    graph.refresh(data_manager.storage, versions)
+    return graph
+
+def start_loading():
+    '''Starts loading the link graph of the wiki on a background thread.
+
+    The versions of the articles are taken on the calling thread, the \
+        worker only reads the articles. Nothing is done if the graph is \
+        loaded or loading already.
+    '''
+
+    global _loading
+    if _graph is not None or _loading is not None:
+        return
+    _pending.clear()
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='link_graph')
+    _loading = executor.submit(load, data_manager.versions())
+    executor.shutdown(wait=False)
+
+def get_graph(wait=True):
+    '''Returns the link graph of the wiki, loading it on first use.
+
+    Arguments:
+        wait (bool): if False, None is returned while the graph is loading \
+            instead of waiting for it
+
+    Returns:
+        LinkGraph: the graph, or None
+
+    Raises:
+        Exception: what the loading raised, it is tried again on the next \
+            call
+    '''
+
+    global _graph, _loading
+    if _graph is None:
+        start_loading()
+        if not wait and not _loading.done():
+            return None
+        loading, _loading = _loading, None
+        graph = loading.result()
+        for change in _pending:
+            apply_change(graph, *change)
+        _pending.clear()
+        _graph = graph
+        atexit.register(save)
+    return _graph
+
+def save():
+    '''Writes the link graph of the wiki if it changed.'''
+
+    if _graph is not None and _graph.dirty:
+        try:
+            _graph.save()
+        except OSError:
+            pass
+
+def apply_change(graph, action, file_name, file_content):
+    '''Applies a change of an article to graph, see on_article_change.'''
+
+    if action=='delete':
+        graph.remove(file_name)
+    else:
+        graph.update(file_name, file_content, *(data_manager.version(file_name) or (None, None)))
+
+def on_article_change(action, file_name, file_content):
+    '''Keeps the graph up to date, subscribed to data_manager.'''
+
+    if _graph is not None:
+        apply_change(_graph, action, file_name, file_content)
+    elif _loading is not None:
+        # the worker may have read the article before the change
+        _pending.append((action, file_name, file_content))
+    # not loaded at all, refresh will notice the change by its version
+
+data_manager.subscribe(on_article_change)
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Shows the links between the articles.')
+    subparsers = arg_parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('rebuild', help='build the graph from scratch')
+    backlinks_parser = subparsers.add_parser('backlinks', help='list the articles linking to an article')
+    backlinks_parser.add_argument('title')
+    subparsers.add_parser('dangling', help='list the links to missing articles')
+    args = arg_parser.parse_args()
+
+    global _graph
+    if args.command=='rebuild':
+        _graph = LinkGraph()
+        count = _graph.refresh(data_manager.storage)
+        _graph.save()
+        print(f'{count} articles, {len(_graph.incoming)} link targets')
+        return
+
+    graph = get_graph()
+    if args.command=='backlinks':
+        for title in graph.backlinks(args.title):
+            print(title)
+    else:
+        for title, missing in sorted(graph.all_dangling(data_manager.storage).items()):
+            print(f'{title}: {", ".join(missing)}')
+    save()
+
+if __name__=='__main__':
+    main()
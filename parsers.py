@@ -20,12 +20,23 @@ This module consist of a function which takes a markdown string as input and \
     ]
 Every new parser has to be added to the InlineParser class's list_of_parsers
 
+The parse method itself does not run the Parser4* pipeline any more. It uses \
+    InlineTokenizer which scans the line a single time and emits formatting \
+    spans (start, end, attribute, href) over the text without the markers. \
+    spans_2_chars turns these spans back to the list of chars shown above.
+
 
 '''
 
 from abc import ABC, abstractmethod
 import re 
 
+from instrumentation import span
+
+# has to be increased whenever the output of parse changes, parsed lines which
+# were stored with an other version are parsed again
+PARSER_VERSION = 1
+
 class StringParser(ABC):
     '''This abstract class has to be implemented by parsers.
     
@@ -415,6 +426,173 @@ class Parser4Link(StringParser):
             
             self.remove_char_at(text_opened_at-1)
 
+# every attribute a parsed char can have, the position is the bit in a mask
+ATTRIBUTES = ('bold', 'italic', 'underline', 'link', 'inline_code', 'h1', 'h2', 'bulleted_list')
+ATTRIBUTE_BITS = {attr: 1<<position for position, attr in enumerate(ATTRIBUTES)}
+
+class ParsedLine():
+    '''A parsed line stored as its text plus a list of attribute runs.
+
+    A run is a tuple (start, end, mask, href). It says that text[start:end]\
+        has the attributes whose bits are set in mask (see ATTRIBUTE_BITS) \
+        and, for links, the target article href. The runs are contiguous, \
+        cover the whole text and two neighbouring runs never have the same \
+        mask and href.
+
+    This takes a few bytes per run instead of one dictionary per character.
+
+    Attributes:
+        text: the line without the markdown markers
+
+        runs: list of (start, end, mask, href) tuples
+
+    Methods:
+        from_spans: builds a ParsedLine from the output of tokenize
+
+        from_chars: builds a ParsedLine from a parsed list of chars
+
+        to_chars: returns the parsed list of chars
+
+        sliced: returns the ParsedLine of text[start:end]
+
+        attributes: names of the attributes set in a mask
+    '''
+
+    __slots__ = ('text', 'runs')
+
+    def __init__(self, text, runs):
+        self.text = text
+        self.runs = runs
+
+    @classmethod
+    def from_spans(cls, text, spans):
+        '''Builds a ParsedLine from the spans returned by tokenize.
+
+        Arguments:
+            text: the text returned by tokenize
+            spans: list of (start, end, attribute, href) tuples
+
+        Returns:
+            ParsedLine
+        '''
+
+        if not text:
+            return cls(text, [])
+        if not spans:
+            return cls(text, [(0, len(text), 0, None)])
+
+        # position -> list of (bit, href) switched on / off at that position
+        opening = {}
+        closing = {}
+        for start, end, attr, href in spans:
+            if start<end:
+                opening.setdefault(start, []).append((ATTRIBUTE_BITS[attr], href))
+                closing.setdefault(end, []).append((ATTRIBUTE_BITS[attr], href))
+
+        runs = []
+        mask = 0
+        href = None
+        run_start = 0
+        for position in sorted(set(opening) | set(closing) | {0, len(text)}):
+            if position>run_start:
+                cls.__append_run(runs, run_start, position, mask, href)
+                run_start = position
+            for bit, link in closing.get(position, ()):
+                mask &= ~bit
+                if link is not None:
+                    href = None
+            for bit, link in opening.get(position, ()):
+                mask |= bit
+                if link is not None:
+                    href = link
+        return cls(text, runs)
+
+    @classmethod
+    def from_chars(cls, chars):
+        '''Builds a ParsedLine from a parsed list of chars.
+
+        Arguments:
+            chars: list of dictionaries of type {'char': char, 'bold': True}
+
+        Returns:
+            ParsedLine
+        '''
+
+        runs = []
+        for position, char in enumerate(chars):
+            mask = 0
+            for attr, bit in ATTRIBUTE_BITS.items():
+                if char.get(attr):
+                    mask |= bit
+            cls.__append_run(runs, position, position+1, mask, char.get('href'))
+        return cls(''.join(char['char'] for char in chars), runs)
+
+    @staticmethod
+    def __append_run(runs, start, end, mask, href):
+        if runs and runs[-1][1]==start and runs[-1][2]==mask and runs[-1][3]==href:
+            runs[-1] = (runs[-1][0], end, mask, href)
+        else:
+            runs.append((start, end, mask, href))
+
+    @staticmethod
+    def attributes(mask):
+        '''Names of the attributes set in mask, in the order of ATTRIBUTES.'''
+
+        return [attr for attr in ATTRIBUTES if mask & ATTRIBUTE_BITS[attr]]
+
+    def to_chars(self):
+        '''Returns the parsed list of chars of this line.
+
+        Arguments:
+            None
+
+        Returns:
+            list: list of dictionaries of type {'char': char, 'bold': True}
+        '''
+
+        chars = []
+        for start, end, mask, href in self.runs:
+            attrs = self.attributes(mask)
+            for char in self.text[start:end]:
+                parsed_char = {'char': char}
+                for attr in attrs:
+                    parsed_char[attr] = True
+                if href is not None:
+                    parsed_char['href'] = href
+                chars.append(parsed_char)
+        return chars
+
+    def sliced(self, start, end):
+        '''Returns the ParsedLine of text[start:end].
+
+        Arguments:
+            start: first position to keep
+            end: position after the last one to keep
+
+        Returns:
+            ParsedLine
+        '''
+
+        start, end, _ = slice(start, end).indices(len(self.text))
+        runs = []
+        for run_start, run_end, mask, href in self.runs:
+            run_start = max(run_start, start)
+            run_end = min(run_end, end)
+            if run_start<run_end:
+                runs.append((run_start-start, run_end-start, mask, href))
+        return ParsedLine(self.text[start:end], runs)
+
+    def __len__(self):
+        return len(self.text)
+
+    def __eq__(self, other):
+        if not isinstance(other, ParsedLine):
+            return NotImplemented
+        return self.text==other.text and self.runs==other.runs
+
+    def __repr__(self):
+        return f'ParsedLine({self.text!r}, {self.runs!r})'
+
 class InlineParsers():
     '''Every parser has to be registered to this class. 
     
@@ -429,6 +607,8 @@ class InlineParsers():
 
         parse: actually make calls to the parsers and returns parsed list of \
             chars
+
+        parse_line: same as parse but returns a ParsedLine
     '''
 
     def __init__(self, string):
@@ -471,6 +651,18 @@ class InlineParsers():
             self.chars = temp.chars
         return self.chars
 
+    def parse_line(self):
+        '''Same as parse but returns the result as a ParsedLine.
+
+        Arguments:
+            None
+
+        Returns:
+            ParsedLine: the parsed line
+        '''
+
+        return ParsedLine.from_chars(self.parse())
+
     def pretty_print(self, chars, i=0):
         for index, char in enumerate(chars):
             print(f'{index+i:>2} |', end='')
@@ -532,22 +724,261 @@ class InlineParsers():
             self.pretty_print(self.chars[i: i+length], i)
             print()
 
+class InlineTokenizer():
+    '''Scans a line once and emits the formatting spans found in it.
+
+    This is the inline engine behind parse. Instead of running the line \
+        through every Parser4* class, it walks the string from left to right\
+        a single time. Line level markers ('# ', '## ', '* ') are stripped \
+        from the front, every other marker opens a span when a valid closing\
+        marker exists ahead of it, and the markers themselves never reach \
+        the output text.
+
+    The closing rules are the ones of the Parser4* patterns, for example a \
+        bold span needs '**', a non blank character, a non blank character\
+        before the closing '**' and a character after it which is not '*'.
+
+    The output differs from the Parser4* pipeline, which runs one regex pass\
+        after the other over what the previous pass left, in these cases:
+        inline code: the pipeline drops the first character of the code and\
+            keeps the opening '`' ('`monospace`' gives '`' and 'onospace').
+        repeated matches: the pipeline formats the first occurrence of a \
+            matched text (str.find) even when the match is a later one.
+        crossing spans: a later pass may open a span inside an earlier one \
+            and close it after it ('**four`th** line 5`' gets inline code on\
+            'h line 5'). Here spans only nest, a marker whose closer lies \
+            past the end of the span around it stays literal.
+        runs of stars: the bold pass takes two stars of a run like '***' \
+            or '\\***' and the italic pass then pairs the stars left over, \
+            also across other spans ('\\***one**\\*' gives an italic '\\' \
+            after a bold italic 'one'). Here a star next to another star is \
+            never an italic marker, so these stars stay literal.
+        Backslashes escape nothing in both.
+
+    Attributes:
+        string: the raw line to be tokenized
+
+    Methods:
+        tokenize: scans the line and returns the text and the spans
+    '''
+
+    # marker -> (span attribute, length of the opening and closing marker)
+    inline_markers = {
+        '**': ('bold', 2),
+        '*': ('italic', 1),
+        '_': ('underline', 1),
+        '`': ('inline_code', 1),
+    }
+
+    def __init__(self, string):
+        self.string = string
+        self.__memo = {}
+
+    def __find_closer(self, marker, start, bound):
+        '''Finds the closing marker of an inline span.
+
+        Arguments:
+            marker: one of the keys of inline_markers
+            start: first position where the closing marker may start
+            bound: the closing marker has to end at or before this position
+
+        Returns:
+            int: position of the closing marker or None
+        '''
+
+        memo = self.__memo.get(marker)
+        if memo is not None and memo[1]==bound and memo[0]<=start:
+            found = memo[2]
+            if found is None or found>=start:
+                return found
+
+        string = self.string
+        length = len(string)
+        size = len(marker)
+        char = marker[0]
+        found = None
+        j = string.find(marker, start, bound)
+        while j!=-1:
+            follower = j + size
+            if string[j-1].isspace():
+                pass
+            elif size==1 and char=='*' and (string[j-1]=='*' or (follower<bound and string[follower]=='*')):
+                # one half of a '**' pair is never an italic marker
+                pass
+            elif follower<length and (follower==bound or string[follower]!=char):
+                found = j
+                break
+            j = string.find(marker, j+1, bound)
+        self.__memo[marker] = (start, bound, found)
+        return found
+
+    def __find_link(self, start, bound):
+        '''Finds the '](' and ')' of a link whose text starts at start.
+
+        Returns:
+            tuple: (position of '](', position of ')') or None
+        '''
+
+        memo = self.__memo.get('[')
+        if memo is not None and memo[0]<=start and (memo[1] is None or memo[1][0]>=start):
+            found = memo[1]
+        else:
+            found = None
+            middle = self.string.find('](', start)
+            if middle!=-1:
+                closed_at = self.string.find(')', middle+2)
+                if closed_at!=-1:
+                    found = (middle, closed_at)
+            self.__memo['['] = (start, found)
+        if found is None or found[1]>=bound:
+            return None
+        return found
+
+    def tokenize(self):
+        '''Scans the line and returns the text and the spans.
+
+        Arguments:
+            None
+
+        Returns:
+            tuple: (text, spans) where text is the line without the markdown\
+                markers and spans is a list of (start, end, attribute, href)\
+                tuples over text. href is None for everything but links.
+        '''
+
+        string = self.string
+        length = len(string)
+        line_attrs = []
+        i = 0
+        if string.startswith('# ', i):
+            line_attrs.append('h1')
+            i += 2
+        if string.startswith('## ', i):
+            line_attrs.append('h2')
+            i += 3
+        if string.startswith('* ', i):
+            line_attrs.append('bulleted_list')
+            i += 2
+
+        pieces = []
+        spans = []
+        out_len = 0
+        literal_from = i
+        # open spans: [attribute, closer position, closer length, start in text, href]
+        stack = []
+        bound = length
+        while i<length:
+            if stack and i==bound:
+                pieces.append(string[literal_from:i])
+                out_len += i - literal_from
+                attr, _, closer_len, started_at, href = stack.pop()
+                spans.append((started_at, out_len, attr, href))
+                i += closer_len
+                literal_from = i
+                bound = stack[-1][1] if stack else length
+                continue
+
+            char = string[i]
+            opened = None
+            if char=='[':
+                if not any(frame[0]=='link' for frame in stack):
+                    link = self.__find_link(i+1, bound)
+                    if link is not None:
+                        middle, closed_at = link
+                        opened = ['link', middle, closed_at+1-middle, 0, string[middle+2:closed_at]], 1
+            elif char in '*_`':
+                marker = '**' if string.startswith('**', i) else char
+                attr, size = self.inline_markers[marker]
+                content_at = i + size
+                if content_at<bound and not string[content_at].isspace() and not any(frame[0]==attr for frame in stack):
+                    closer = self.__find_closer(marker, content_at+1, bound)
+                    if closer is not None:
+                        opened = [attr, closer, size, 0, None], size
+                elif marker=='**':
+                    # '**' followed by a blank is two literal stars
+                    i += 1
+
+            if opened is None:
+                i += 1
+                continue
+            pieces.append(string[literal_from:i])
+            out_len += i - literal_from
+            frame, size = opened
+            frame[3] = out_len
+            stack.append(frame)
+            bound = frame[1]
+            i += size
+            literal_from = i
+
+        pieces.append(string[literal_from:])
+        out_len += length - literal_from
+        for attr in line_attrs:
+            spans.append((0, out_len, attr, None))
+        return ''.join(pieces), spans
+
+def tokenize(string):
+    '''Scans the string once and returns its text and formatting spans.
+
+    Arguments:
+        string: a str to be tokenized
+
+    Returns:
+        tuple: (text, spans), see InlineTokenizer.tokenize
+
+    '''
+
+    return InlineTokenizer(string).tokenize()
+
+def spans_2_chars(text, spans):
+    '''Converts the output of tokenize to the parsed list of chars.
+
+    Arguments:
+        text: the text returned by tokenize
+        spans: the spans returned by tokenize
+
+    Returns:
+        list: list of dictionaries of type {'char': char, 'bold': True, ...}
+
+    '''
+
+    chars = [{'char': char} for char in text]
+    for start, end, attr, href in spans:
+        for char in chars[start:end]:
+            char[attr] = True
+            if href is not None:
+                char['href'] = href
+    return chars
+
 def parse(string):
-    '''This method registers the parser to the Inline parsers, parse the string.
-    
+    '''Parses the string with the single pass InlineTokenizer.
+
+    The result has the same shape as the output of the Parser4* pipeline \
+        registered in InlineParsers.
+
     Arguments:
         string: a str to be parsed
-    
+
     Returns:
         list: list of parsed chars
-    
+
     '''
-    
-    inline_parsers = InlineParsers(string)
-    parsers = [Parser4Bold, Parser4Italic, Parser4Underline, Parser4InlineCode, Parser4Heading1, Parser4Heading2, Parser4BulletedList, Parser4Link]
-    for parser in parsers:
-        inline_parsers.add_parser(parser)
-    parsed_chars = inline_parsers.parse()
-    return parsed_chars
 
+    with span('parsers.parse'):
+        return spans_2_chars(*tokenize(string))
+
+def parse_line(string):
+    '''Parses the string to a ParsedLine.
+
+    Same as parse but the result is kept as text plus attribute runs instead\
+        of one dictionary per character.
+
+    Arguments:
+        string: a str to be parsed
+
+    Returns:
+        ParsedLine: the parsed line
+
+    '''
 
+    with span('parsers.parse_line'):
+        return ParsedLine.from_spans(*tokenize(string))
@@ -0,0 +1,280 @@
+'''This module turns the raw content of an article into parsed lines.
+
+It holds the steps of the Renderer which do not need a Tk widget:
+    content -> blocks -> sanitized blocks -> lines -> ParsedLines
+
+The sanitizing steps are generators: content_2_sanitized_lines walks the \
+    content once and yields its logical lines one after another, so neither\
+    the time nor the memory grow faster than the content, and no more than \
+    the longest logical line is held at a time besides the content itself.
+
+The Renderer uses these functions for the Text widget, and everything which \
+    has to parse articles without a display (the render cache, for example)\
+    uses them directly. Parsed lines and blocks are kept in the caches of \
+    the cache module.
+
+'''
+
+from itertools import groupby
+from operator import itemgetter
+
+from parsers import parse_line
+from cache import line_cache, block_cache
+
+# the line prefixes which start a list item or a heading
+LIST_ITEM = '* '
+HEADINGS = ('# ', '## ')
+
+# lines holding only this were removed by the old sanitizer, which used it \
+# to mark the joined lines, so they still are
+SENTINEL = 'THIS_LINE_TO_BE_DELETED'
+
+def content_2_blocks(content):
+    '''Divides raw content to blocks to texts.
+
+    Arguments:
+        content: the raw content of an article
+
+    Returns:
+        list: the raw blocks
+
+    '''
+
+    return content.split('\n\n')
+
+def iter_lines(text):
+    '''Yields the lines of text, like text.split('\\n') without the list.'''
+
+    start = 0
+    end = text.find('\n')
+    while end>=0:
+        yield text[start:end]
+        start = end + 1
+        end = text.find('\n', start)
+    yield text[start:]
+
+def iter_blocks(content):
+    '''Yields the raw blocks of content, like content_2_blocks without the list.'''
+
+    start = 0
+    end = content.find('\n\n')
+    while end>=0:
+        yield content[start:end]
+        start = end + 2
+        end = content.find('\n\n', start)
+    yield content[start:]
+
+def content_2_block_lines(content):
+    '''Yields the lines of content with the number of the block they are in.
+
+    The blocks are the ones of content_2_blocks, found without splitting \
+        the content: an empty line between two line breaks separates two \
+        blocks, unless the line break before it ended the previous separator.
+
+    Arguments:
+        content: the raw content of an article
+
+    Returns:
+        generator: (block number, line) tuples, without the separators
+    '''
+
+    block_num = 0
+    # the first line can not be a separator, nor the line after one
+    after_separator = True
+    lines = iter_lines(content)
+    line = next(lines)
+    for following in lines:
+        if line=='' and not after_separator:
+            block_num += 1
+            after_separator = True
+        else:
+            yield block_num, line
+            after_separator = False
+        line = following
+    yield block_num, line
+
+def is_paragraph_line(line):
+    '''Checks if a line is joined with the lines around it when sanitizing.'''
+
+    return line.strip()!='' and not line.startswith((LIST_ITEM,) + HEADINGS)
+
+def join_list_items(lines):
+    '''Joins every list item with the line after it.
+
+    The line is not joined when it starts a list item or a heading itself.\
+        Lines holding only the SENTINEL are dropped, like the old sanitizer \
+        did.
+
+    Arguments:
+        lines: iterable of the raw lines of a block
+
+    Returns:
+        generator: the lines
+    '''
+
+    item = None # a list item waiting for the line after it
+    for line in lines:
+        if item is not None:
+            if not (line.startswith(LIST_ITEM) or line.startswith(HEADINGS)):
+                yield item + ' ' + line
+                item = None
+                continue
+            yield item
+            item = None
+        if line.startswith(LIST_ITEM):
+            item = line
+        elif line!=SENTINEL:
+            yield line
+    if item is not None:
+        yield item
+
+def join_paragraph_lines(lines):
+    '''Joins every run of consecutive paragraph lines to one line.
+
+    The old sanitizer joined the lines from the last one backwards, and a \
+        line like '#' which becomes a heading once the line after it is \
+        joined to it was not joined with the line before it any more. Such \
+        lines are held back until it is known whether they are joined with \
+        the line after them, so the result stays the same.
+
+    Arguments:
+        lines: iterable of lines, see join_list_items
+
+    Returns:
+        generator: the logical lines
+    '''
+
+    paragraph = []
+    held = [] # consecutive paragraph lines which may turn into a heading
+
+    def release(joined_with_next):
+        # finds from the last held line backwards which held lines are joined
+        # with the line before them
+        nonlocal paragraph
+        joined = []
+        for _ in held:
+            joined_with_next = not joined_with_next
+            joined.append(joined_with_next)
+        for line, joined_with_previous in zip(held, reversed(joined)):
+            if not joined_with_previous and paragraph:
+                yield ' '.join(paragraph)
+                paragraph = []
+            paragraph.append(line)
+        held.clear()
+
+    for line in lines:
+        if not is_paragraph_line(line):
+            yield from release(False)
+            if paragraph:
+                yield ' '.join(paragraph)
+                paragraph = []
+            yield line
+        elif not is_paragraph_line(line + ' '):
+            held.append(line)
+        else:
+            yield from release(True)
+            paragraph.append(line)
+    yield from release(False)
+    if paragraph:
+        yield ' '.join(paragraph)
+
+def sanitize_lines(lines):
+    '''Removes the unnecessary line breaks b/w the raw lines of a block.
+
+    Arguments:
+        lines: iterable of the raw lines of a block
+
+    Returns:
+        generator: the lines which can be parsed independently, one empty \
+            line if no line is left
+    '''
+
+    empty = True
+    for line in join_paragraph_lines(join_list_items(lines)):
+        empty = False
+        yield line
+    if empty:
+        yield ''
+
+def block_2_sanitized_block(block):
+    '''Remove unnecessary line breaks b/w the lines.
+
+    Arguments:
+        block: A string having unnecessary line breaks.
+
+    Returns:
+        str: the block where every line can be parsed independently.
+
+    '''
+
+    return '\n'.join(sanitize_lines(iter_lines(block)))
+
+def content_2_sanitized_lines(content):
+    '''Yields the lines of the sanitized content in one pass.
+
+    The lines are the ones of the sanitized blocks joined by an empty line,\
+        the same as '\\n\\n'.join(sanitized blocks).split('\\n').
+
+    Arguments:
+        content: the raw content of an article
+
+    Returns:
+        generator: the logical lines
+    '''
+
+    for block_num, block_lines in groupby(content_2_block_lines(content), key=itemgetter(0)):
+        if block_num>0:
+            yield ''
+        yield from sanitize_lines(line for _, line in block_lines)
+
+def _parse_line(line):
+    parsed_line = parse_line(line+' ')
+    return parsed_line.sliced(0, len(parsed_line)-1)
+
+def line_2_parsed_line(line):
+    '''Parses the line to a ParsedLine.
+
+    A blank is added to the line before parsing, so that a marker at the end\
+        of the line can be closed, and it is removed from the result. The \
+        result is kept in the shared line cache.
+
+    Arguments:
+        line: An raw string
+
+    Returns:
+        ParsedLine: the parsed line without the added blank.
+
+    '''
+
+    return line_cache.get_or_compute(line, _parse_line)
+
+def _parse_block(block):
+    return tuple(line_2_parsed_line(line) for line in sanitize_lines(iter_lines(block)))
+
+def block_2_parsed_lines(block):
+    '''Sanitizes a raw block and parses each of its lines.
+
+    The result is kept in the shared block cache.
+
+    Arguments:
+        block (str): A block of the content, see content_2_blocks.
+
+    Returns:
+        tuple: the ParsedLine of every line of the sanitized block.
+
+    '''
+
+    return block_cache.get_or_compute(block, _parse_block)
+
+def content_2_parsed_blocks(content):
+    '''Parses the whole content.
+
+    Arguments:
+        content: the raw content of an article
+
+    Returns:
+        list: for every block the tuple of its ParsedLines
+
+    '''
+
+    return [block_2_parsed_lines(block) for block in iter_blocks(content)]
@@ -0,0 +1,241 @@
+'''This module reads and parses the articles the user is likely to open next.
+
+While an article is read, the articles it links to are parsed on a worker \
+    thread, so following one of its links usually finds the parsed blocks \
+    ready in memory instead of reading and parsing the file (or loading it \
+    from the render cache) on the Tk main loop.
+
+The work ahead is bounded: at most max_links articles and max_bytes bytes \
+    of article files per page, and at most max_entries articles and \
+    max_cache_bytes bytes kept overall. A prefetched article is checked \
+    against its version (see data_manager.version) before it is used, so an\
+    article changed in the meantime is parsed again.
+
+The Prefetcher counts the articles it prefetched which were opened (used) \
+    and the ones which were dropped without being opened (wasted):
+
+    from prefetch import Prefetcher
+    prefetcher = Prefetcher()
+    prefetcher.prefetch('Article Name')
+    parsed_blocks = prefetcher.get_parsed_blocks('Linked Article')
+    print(prefetcher.report())
+
+'''
+
+import atexit
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import data_manager
+import link_graph
+import render_cache
+from catalog import Catalog
+from instrumentation import count, span
+
+def fetch(article_name):
+    '''Reads and parses an article, runs on the worker thread.
+
+    Arguments:
+        article_name (str): article name
+
+    Returns:
+        tuple: ((version, size) of the article before it was read, parsed \
+            blocks)
+    '''
+
+    with span('prefetch.fetch'):
+        version = data_manager.version(article_name)
+        if version is None:
+            raise FileNotFoundError(f'no article named {article_name!r}')
+        return version, render_cache.get_parsed_blocks(article_name)
+
+class Prefetcher():
+    '''Parses the articles linked from the current one in the background.
+
+    Attributes:
+        max_links: maximum number of articles prefetched for a page
+
+        max_bytes: maximum size of the articles prefetched for a page
+
+        max_entries: maximum number of prefetched articles kept
+
+        max_cache_bytes: maximum size of the articles kept
+
+        entries: an OrderedDict of type {title key: (future, size)}, least \
+            recently prefetched first
+
+        stats: a dictionary of type {'requested': int, 'used': int, \
+            'wasted': int, 'cancelled': int}
+
+    Methods:
+        prefetch: starts prefetching the articles linked from an article
+
+        get_parsed_blocks: returns the parsed blocks of an article, \
+            prefetched if possible
+
+        discard: drops a prefetched article
+
+        report: describes how many prefetched articles were used
+
+        close: drops every prefetched article and stops the worker
+    '''
+
+    def __init__(self, max_links=5, max_bytes=256*1024, max_entries=20, max_cache_bytes=2*1024*1024):
+        self.max_links = max_links
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.max_cache_bytes = max_cache_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.stats = {'requested': 0, 'used': 0, 'wasted': 0, 'cancelled': 0}
+        self.executor = None
+        atexit.register(self.close)
+
+    def prefetch(self, article_name, skip=None):
+        '''Starts prefetching the articles linked from an article.
+
+        The links are taken in the order they appear in the article. The \
+            ones still waiting for the worker from earlier pages are \
+            cancelled, so the worker starts with the links of this page. \
+            Nothing is prefetched while the link graph is loading.
+
+        Arguments:
+            article_name (str): the article which is read now
+
+            skip: a function (title) -> bool, True for articles which do not \
+                need to be prefetched (for example because they are already \
+                rendered)
+
+        Returns:
+            list: the titles which are prefetched
+        '''
+
+        try:
+            graph = link_graph.get_graph(wait=False)
+        except Exception:
+            # prefetching is only a guess, the view screen shows the failure
+            graph = None
+        if graph is None:
+            return []
+        titles = []
+        keys = set()
+        budget = self.max_bytes
+        for target in graph.links(article_name):
+            if len(titles)>=self.max_links:
+                break
+            key = Catalog.title_key(target)
+            if key in keys or key==Catalog.title_key(article_name):
+                continue
+            if skip is not None and skip(target):
+                continue
+            entry = data_manager.stat(target)
+            if entry is None:
+                continue
+            file_name, version, size = entry
+            if size>budget:
+                continue
+            budget -= size
+            keys.add(key)
+            titles.append((key, file_name[:-3], size))
+
+        for key in list(self.entries):
+            if key not in keys and self.entries[key][0].cancel():
+                self.discard(key)
+
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='prefetch')
+        for key, title, size in titles:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                continue
+            self.entries[key] = (self.executor.submit(fetch, title), size)
+            self.bytes += size
+            self.stats['requested'] += 1
+        while len(self.entries)>self.max_entries or self.bytes>self.max_cache_bytes:
+            self.discard(next(iter(self.entries)))
+        return [title for key, title, size in titles]
+
+    def discard(self, key):
+        '''Drops a prefetched article, counting it as wasted or cancelled.'''
+
+        future, size = self.entries.pop(key)
+        self.bytes -= size
+        if future.cancel():
+            self.stats['cancelled'] += 1
+            count('prefetch.cancelled')
+        else:
+            self.stats['wasted'] += 1
+            count('prefetch.wasted')
+
+    def take(self, article_name):
+        '''Removes a prefetched article and returns its parsed blocks.
+
+        Waits if the worker is parsing the article right now. An article \
+            still waiting for the worker is cancelled instead, since the \
+            caller can parse it sooner itself.
+
+        Arguments:
+            article_name (str): article name
+
+        Returns:
+            list: the parsed blocks, or None if the article was not \
+                prefetched, failed or changed since
+        '''
+
+        key = Catalog.title_key(article_name)
+        if key not in self.entries:
+            return None
+        future, size = self.entries[key]
+        if not future.running() and not future.done():
+            self.discard(key)
+            return None
+        del self.entries[key]
+        self.bytes -= size
+        try:
+            version, parsed_blocks = future.result()
+        except Exception:
+            parsed_blocks = None
+        else:
+            if data_manager.version(article_name)!=version:
+                parsed_blocks = None
+        if parsed_blocks is None:
+            self.stats['wasted'] += 1
+            count('prefetch.wasted')
+        else:
+            self.stats['used'] += 1
+            count('prefetch.used')
+        return parsed_blocks
+
+    def get_parsed_blocks(self, article_name):
+        '''Returns the parsed blocks of an article, prefetched if possible.
+
+        Arguments:
+            article_name (str): article name
+
+        Returns:
+            list: for every block the tuple of its ParsedLines
+
+        Raises:
+            OSError: if the article does not exist
+        '''
+
+        parsed_blocks = self.take(article_name)
+        if parsed_blocks is None:
+            parsed_blocks = render_cache.get_parsed_blocks(article_name)
+        return parsed_blocks
+
+    def report(self):
+        '''Describes how many prefetched articles were used and wasted.'''
+
+        stats = self.stats
+        return f"{stats['requested']} prefetched, {stats['used']} used, {stats['wasted']} wasted, "\
+            f"{stats['cancelled']} cancelled, {len(self.entries)} pending"
+
+    def close(self):
+        '''Drops every prefetched article and stops the worker.'''
+
+        while self.entries:
+            self.discard(next(iter(self.entries)))
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
@@ -0,0 +1,419 @@
+'''This module keeps the live preview panes up to date.
+
+The preview of the create and edit screens used to be deleted and rendered \
+    again from scratch on every key stroke. The PreviewRenderer remembers the\
+    blocks (see Renderer.content_2_blocks) it rendered last time and only \
+    renders again the blocks which changed, so the cost of an update depends \
+    on the size of the edit and not on the size of the article.
+
+The PreviewWorker moves the parsing of the changed blocks to a worker \
+    thread. Only the insertion into the Text widget runs on the Tk main loop.
+
+The PreviewScheduler decides when the preview is updated. Key strokes only \
+    mark the preview dirty, and the update runs at most once per interval \
+    with whatever text the editor holds at that moment.
+
+'''
+
+import queue
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from tkinter import END
+
+from renderer import Renderer
+
+# milliseconds between two updates of the preview at most
+PREVIEW_INTERVAL = 100
+
+# milliseconds between two checks for parsed blocks coming from the worker
+POLL_INTERVAL = 20
+
+# one worker thread parses the previews of all screens
+_executor = None
+
+def get_executor():
+    '''Returns the executor running the preview parsing jobs.'''
+
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='preview')
+    return _executor
+
+class PreviewRenderer():
+    '''Renders the content to a Text widget block by block.
+
+    Every rendered block starts with a mark in the Text widget. A block other\
+        than the last one ends with the '\\n\\n' separating it from the \
+        next block, so the marks split the text into independent regions and\
+        only the region of the last block can be empty. On update the new \
+        blocks are compared to the old ones, the regions of the changed \
+        blocks are deleted and only the new blocks are rendered in their \
+        place. The link tags of the deleted blocks are removed with them.
+
+    Attributes:
+        textarea: A Text widget where the preview is rendered.
+
+        state: A state object to which screens are attached.
+
+        renderer: The Renderer used for rendering single blocks.
+
+        blocks: The raw blocks rendered at the moment.
+
+        marks: The name of the mark at the start of every rendered block.
+
+        links: The link tags of every rendered block, see HyperlinkManager.
+
+    Methods:
+        diff: Finds the range of blocks which changed.
+
+        prepare: Splits the content and finds the blocks which changed.
+
+        parse_blocks: Parses blocks, safe to run outside the Tk main thread.
+
+        apply: Replaces the changed blocks of the textarea.
+
+        update: Renders the new content, re-rendering only changed blocks.
+
+        clear: Removes everything rendered by the preview.
+    '''
+
+    insert_mark = 'preview-insert'
+
+    def __init__(self, textarea, state):
+        self.textarea = textarea
+        self.state = state
+        self.renderer = Renderer(textarea, '', state)
+        self.renderer.index = self.insert_mark
+        self.blocks = []
+        self.marks = []
+        self.links = []
+        self.mark_count = 0
+
+    def diff(self, blocks):
+        '''Finds the range of blocks which changed.
+
+        Arguments:
+            blocks: The new list of raw blocks.
+
+        Returns:
+            tuple: (start, old_stop, new_stop) meaning that self.blocks[start:\
+                old_stop] has to be replaced by blocks[start:new_stop].
+        '''
+
+        old_blocks = self.blocks
+        # the last block has no separator after it, so it can never be kept
+        # from the start of the old blocks
+        limit = min(len(old_blocks), len(blocks)) - 1
+        start = 0
+        while start<limit and old_blocks[start]==blocks[start]:
+            start += 1
+
+        limit = min(len(old_blocks), len(blocks)) - start
+        common = 0
+        while common<limit and old_blocks[-1-common]==blocks[-1-common]:
+            common += 1
+        return start, len(old_blocks) - common, len(blocks) - common
+
+    def prepare(self, content):
+        '''Splits the content into blocks and compares them to the rendered ones.
+
+        Arguments:
+            content (str): The raw content of the editor.
+
+        Returns:
+            tuple: (blocks, start, old_stop, new_stop), see diff. This is the\
+                job handed to parse_blocks and apply.
+        '''
+
+        blocks = content.split('\n\n')
+        return (blocks,) + self.diff(blocks)
+
+    def parse_blocks(self, blocks):
+        '''Sanitizes and parses blocks without touching the textarea.
+
+        Arguments:
+            blocks: list of raw blocks
+
+        Returns:
+            list: for every block the list of its ParsedLines
+        '''
+
+        return [self.renderer.block_2_parsed_lines(block) for block in blocks]
+
+    def apply(self, job, parsed_blocks):
+        '''Replaces the changed blocks of the textarea with the parsed ones.
+
+        The textarea has to be in 'normal' state.
+
+        Arguments:
+            job: the tuple returned by prepare
+            parsed_blocks: parse_blocks(blocks[start:new_stop])
+
+        Returns:
+            None
+        '''
+
+        blocks, start, old_stop, new_stop = job
+        if start==old_stop and start==new_stop:
+            return
+
+        textarea = self.textarea
+        if start<len(self.marks):
+            stop_index = self.marks[old_stop] if old_stop<len(self.marks) else 'end-1c'
+            textarea.delete(self.marks[start], stop_index)
+            for mark in self.marks[start:old_stop]:
+                textarea.mark_unset(mark)
+            for tags in self.links[start:old_stop]:
+                self.renderer.hyperlink.remove(tags)
+            insert_index = self.marks[old_stop] if old_stop<len(self.marks) else 'end-1c'
+        else:
+            insert_index = 'end-1c'
+        textarea.mark_set(self.insert_mark, insert_index)
+
+        # new marks have left gravity while their block is rendered, so that
+        # they stay in front of it, and right gravity afterwards, so that a
+        # block inserted at their position later ends up in front of them
+        new_marks = []
+        new_links = []
+        links = self.renderer.hyperlink.links
+        for block_num, parsed_lines in zip(range(start, new_stop), parsed_blocks):
+            self.mark_count += 1
+            mark = f'preview-block-{self.mark_count}'
+            textarea.mark_set(mark, self.insert_mark)
+            textarea.mark_gravity(mark, 'left')
+            new_marks.append(mark)
+            link_count = len(links)
+            self.renderer.render_parsed_lines(parsed_lines)
+            # the links of the block are the last ones added
+            new_links.append(list(islice(reversed(links), len(links) - link_count)))
+            if block_num<len(blocks)-1:
+                textarea.insert(self.insert_mark, '\n\n')
+        for mark in new_marks:
+            textarea.mark_gravity(mark, 'right')
+        textarea.mark_unset(self.insert_mark)
+
+        self.blocks = blocks
+        self.marks[start:old_stop] = new_marks
+        self.links[start:old_stop] = new_links
+
+    def update(self, content):
+        '''Renders the new content, re-rendering only changed blocks.
+
+        This runs prepare, parse_blocks and apply one after another on the \
+            calling thread. The textarea has to be in 'normal' state.
+
+        Arguments:
+            content (str): The raw content of the editor.
+
+        Returns:
+            tuple: (start, old_stop, new_stop), see diff.
+        '''
+
+        job = self.prepare(content)
+        blocks, start, old_stop, new_stop = job
+        self.apply(job, self.parse_blocks(blocks[start:new_stop]))
+        return start, old_stop, new_stop
+
+    def clear(self):
+        '''Removes everything rendered by the preview.'''
+
+        self.textarea.delete('1.0', END)
+        for mark in self.marks:
+            self.textarea.mark_unset(mark)
+        self.renderer.hyperlink.reset()
+        self.blocks = []
+        self.marks = []
+        self.links = []
+
+class PreviewScheduler():
+    '''Coalesces preview updates instead of rendering on every key stroke.
+
+    mark_dirty is bound to the editor events. The first call schedules a \
+        render with after(interval) followed by after_idle, the next calls \
+        until that render runs are dropped. The render callback reads the \
+        editor itself, so it always renders the latest text.
+
+    Attributes:
+        widget: A widget whose after/after_idle methods are used.
+
+        render: A callable doing the actual update of the preview.
+
+        interval: Milliseconds between two renders at most.
+
+        requests: Number of mark_dirty calls.
+
+        renders: Number of renders which actually ran.
+
+    Methods:
+        mark_dirty: Requests an update of the preview.
+
+        flush: Renders now if an update is pending.
+
+        cancel: Drops the pending update.
+
+        stats: Returns the counters of the scheduler.
+    '''
+
+    def __init__(self, widget, render, interval=PREVIEW_INTERVAL):
+        self.widget = widget
+        self.render = render
+        self.interval = interval
+        self.pending = None
+        self.requests = 0
+        self.renders = 0
+
+    def mark_dirty(self, event=None):
+        '''Requests an update of the preview.
+
+        Arguments:
+            event: An event, automatically passed by the invoked function
+
+        Returns:
+            None
+        '''
+
+        self.requests += 1
+        if self.pending is None:
+            self.pending = self.widget.after(self.interval, self.__when_idle)
+
+    def __when_idle(self):
+        self.pending = self.widget.after_idle(self.__run)
+
+    def __run(self):
+        self.pending = None
+        self.renders += 1
+        self.render()
+
+    def flush(self):
+        '''Renders now if an update is pending.'''
+
+        if self.pending is not None:
+            self.cancel()
+            self.__run()
+
+    def cancel(self):
+        '''Drops the pending update, for example when the screen is hidden.'''
+
+        if self.pending is not None:
+            self.widget.after_cancel(self.pending)
+            self.pending = None
+
+    def stats(self):
+        '''Returns the counters of the scheduler.
+
+        Returns:
+            dict: {'requests': int, 'renders': int, 'skipped': int}
+        '''
+
+        return {
+            'requests': self.requests,
+            'renders': self.renders,
+            'skipped': self.requests - self.renders,
+        }
+
+class PreviewWorker():
+    '''Parses the preview on a worker thread and applies it on the main loop.
+
+    Every submitted text gets a new generation number. The diff against the \
+        rendered blocks is done on the main thread, the changed blocks are \
+        parsed by the worker, and the result is put on a queue which the main\
+        loop polls with after. A result whose generation is not the latest \
+        one belongs to an outdated text and is discarded without being \
+        applied. The worker also stops parsing as soon as its job is outdated.
+
+    Attributes:
+        preview: The PreviewRenderer of the preview pane.
+
+        generation: The generation of the latest submitted text.
+
+        applied: Number of results applied to the preview.
+
+        discarded: Number of outdated results which were thrown away.
+
+    Methods:
+        submit: Parses the text in the background and renders it when done.
+
+        cancel: Makes all pending results outdated and stops polling.
+
+        stats: Returns the counters of the worker.
+    '''
+
+    def __init__(self, preview, poll_interval=POLL_INTERVAL):
+        self.preview = preview
+        self.poll_interval = poll_interval
+        self.results = queue.Queue()
+        self.generation = 0
+        self.outstanding = 0
+        self.polling = None
+        self.applied = 0
+        self.discarded = 0
+
+    def submit(self, content):
+        '''Parses the text in the background and renders it when done.
+
+        Arguments:
+            content (str): The raw content of the editor.
+
+        Returns:
+            None
+        '''
+
+        self.generation += 1
+        generation = self.generation
+        job = self.preview.prepare(content)
+        blocks, start, old_stop, new_stop = job
+        self.outstanding += 1
+        future = get_executor().submit(self.__parse, generation, blocks[start:new_stop])
+        future.add_done_callback(lambda future: self.results.put((generation, job, future)))
+        if self.polling is None:
+            self.polling = self.preview.textarea.after(self.poll_interval, self.__poll)
+
+    def __parse(self, generation, blocks):
+        # runs on the worker thread
+        parsed_blocks = []
+        for block in blocks:
+            if generation!=self.generation:
+                return None
+            parsed_blocks.append(self.preview.renderer.block_2_parsed_lines(block))
+        return parsed_blocks
+
+    def __poll(self):
+        self.polling = None
+        while True:
+            try:
+                generation, job, future = self.results.get_nowait()
+            except queue.Empty:
+                break
+            self.outstanding -= 1
+            if generation!=self.generation:
+                self.discarded += 1
+                continue
+            parsed_blocks = future.result()
+            textarea = self.preview.textarea
+            textarea.config(state='normal')
+            self.preview.apply(job, parsed_blocks)
+            textarea.config(state='disabled')
+            self.applied += 1
+        if self.outstanding>0:
+            self.polling = self.preview.textarea.after(self.poll_interval, self.__poll)
+
+    def cancel(self):
+        '''Makes all pending results outdated and stops polling.'''
+
+        self.generation += 1
+        if self.polling is not None:
+            self.preview.textarea.after_cancel(self.polling)
+            self.polling = None
+
+    def stats(self):
+        '''Returns the counters of the worker.
+
+        Returns:
+            dict: {'generation': int, 'applied': int, 'discarded': int}
+        '''
+
+        return {
+            'generation': self.generation,
+            'applied': self.applied,
+            'discarded': self.discarded,
+        }
@@ -0,0 +1,198 @@
+'''This module keeps the parsed articles on disk between runs of the app.
+
+Opening an article means reading its .md file, sanitizing its blocks and \
+    parsing every line. The result only changes when the file or the parser\
+    changes, so it is stored in data/cache/render next to data/mds. A cache \
+    file starts with a header holding the version and size of the article \
+    (see Storage.version) and the parser version it was made with, \
+    followed by the parsed \
+    blocks (text and attribute runs of every line) marshalled and \
+    compressed with zlib. An entry whose header does not match the article \
+    any more is parsed again and overwritten.
+
+The cache of the whole wiki can be pre-warmed from the command line:
+    python render_cache.py warm
+    python render_cache.py clear
+
+'''
+
+import argparse
+import hashlib
+import marshal
+import os
+import struct
+import zlib
+
+import data_manager
+from instrumentation import count, span
+from parsers import ParsedLine, PARSER_VERSION
+from pipeline import content_2_parsed_blocks
+
+CACHE_DIR = os.path.join(data_manager.BASE_DIR, 'data', 'cache', 'render')
+
+# has to be increased whenever the layout of the cache files changes
+FORMAT_VERSION = 1
+
+# magic, format version, parser version, article version, size in bytes
+HEADER = struct.Struct('<4sHHqq')
+MAGIC = b'OWRC'
+
+stats = {'hits': 0, 'misses': 0, 'stores': 0}
+
+def cache_path(article_name):
+    '''Returns the path of the cache file of an article.
+
+    Article names can contain any character, so the file is named after a \
+        hash of the name.
+
+    Arguments:
+        article_name (str): article name
+
+    Returns:
+        str: path of the cache file
+    '''
+
+    digest = hashlib.sha1(article_name.encode('utf-8')).hexdigest()
+    return os.path.join(CACHE_DIR, digest+'.bin')
+
+def load(article_name, version):
+    '''Reads the parsed blocks of an article from the cache.
+
+    Arguments:
+        article_name (str): article name
+        version: (version, size) of the article, see data_manager.version
+
+    Returns:
+        list: the parsed blocks or None when there is no valid entry
+    '''
+
+    try:
+        with open(cache_path(article_name), 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    if len(data)<HEADER.size:
+        return None
+    if HEADER.unpack_from(data)!=(MAGIC, FORMAT_VERSION, PARSER_VERSION) + tuple(version):
+        return None
+    try:
+        blocks = marshal.loads(zlib.decompress(data[HEADER.size:]))
+    except (ValueError, EOFError, TypeError, zlib.error):
+        return None
+    return [tuple(ParsedLine(text, list(runs)) for text, runs in block) for block in blocks]
+
+def store(article_name, version, parsed_blocks):
+    '''Writes the parsed blocks of an article to the cache.
+
+    The file is written next to its final place and then renamed, so a \
+        reader never sees half of it. Failing to write the cache is not an \
+        error, the article is just parsed again next time.
+
+    Arguments:
+        article_name (str): article name
+        version: (version, size) of the article the blocks were parsed from
+        parsed_blocks: list of tuples of ParsedLines
+
+    Returns:
+        None
+    '''
+
+    blocks = tuple(tuple((line.text, tuple(line.runs)) for line in block) for block in parsed_blocks)
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, PARSER_VERSION, *version)
+    path = cache_path(article_name)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(path+'.tmp', 'wb') as f:
+            f.write(header + zlib.compress(marshal.dumps(blocks), 6))
+        os.replace(path+'.tmp', path)
+        stats['stores'] += 1
+    except OSError:
+        pass
+
+def invalidate(article_name):
+    '''Removes the cache entry of an article if there is one.'''
+
+    try:
+        os.remove(cache_path(article_name))
+    except OSError:
+        pass
+
+def get_parsed_blocks(article_name):
+    '''Returns the parsed blocks of an article, from the cache if possible.
+
+    Arguments:
+        article_name (str): article name
+
+    Returns:
+        list: for every block the tuple of its ParsedLines
+
+    Raises:
+        OSError: if the article does not exist
+    '''
+
+    with span('render_cache.get_parsed_blocks'):
+        version = data_manager.version(article_name)
+        if version is None:
+            raise FileNotFoundError(f'no article named {article_name!r}')
+        parsed_blocks = load(article_name, version)
+        if parsed_blocks is not None:
+            stats['hits'] += 1
+            count('render_cache.hit')
+            return parsed_blocks
+
+        stats['misses'] += 1
+        count('render_cache.miss')
+        content = data_manager.get(article_name)
+        parsed_blocks = content_2_parsed_blocks(content)
+        # only store when the article did not change while it was being read
+        if data_manager.version(article_name)==version:
+            store(article_name, version, parsed_blocks)
+        return parsed_blocks
+
+def warm():
+    '''Parses every article of the wiki whose cache entry is missing or stale.
+
+    Returns:
+        dict: {'articles': int, 'parsed': int, 'failed': int}
+    '''
+
+    result = {'articles': 0, 'parsed': 0, 'failed': 0}
+    for file_name in data_manager.get_articles_list():
+        if not file_name.endswith('.md'):
+            continue
+        result['articles'] += 1
+        misses = stats['misses']
+        try:
+            get_parsed_blocks(file_name[:-3])
+        except (OSError, UnicodeDecodeError):
+            result['failed'] += 1
+            continue
+        result['parsed'] += stats['misses'] - misses
+    return result
+
+def clear():
+    '''Removes every entry of the cache.
+
+    Returns:
+        int: the number of removed entries
+    '''
+
+    removed = 0
+    if os.path.isdir(CACHE_DIR):
+        for file_name in os.listdir(CACHE_DIR):
+            os.remove(os.path.join(CACHE_DIR, file_name))
+            removed += 1
+    return removed
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Manages the render cache of the articles.')
+    arg_parser.add_argument('command', choices=['warm', 'clear'], help='warm: parse every stale article, clear: remove the cache')
+    args = arg_parser.parse_args()
+    if args.command=='warm':
+        result = warm()
+        print(f"{result['articles']} articles, {result['parsed']} parsed, {result['failed']} failed")
+    else:
+        print(f'{clear()} entries removed')
+
+if __name__=='__main__':
+    main()
@@ -4,14 +4,29 @@ The Renderer class takes raw content of the markdown file. Then removes the \
     unnecessary line breaks by creates a sanitized content in which per\
     line can be parsed independently. 
 
+ProgressiveRender renders already parsed blocks a time slice at a time, so\
+    a long article shows its first screenful at once and the rest is added\
+    while the UI stays responsive.
+
 '''
 
 from tkinter import * 
 from tkinter import Text
-from tkinter import font 
 from functools import partial
+import time
+
 from hyperlink_manager import HyperlinkManager
-from parsers import parse 
+from instrumentation import span
+from styles import style_registry
+from parsers import parse, ParsedLine, ATTRIBUTE_BITS
+from pipeline import block_2_sanitized_block, content_2_sanitized_lines, line_2_parsed_line, block_2_parsed_lines
+
+# lines rendered before the screen is shown, about one screenful
+FIRST_SCREEN_LINES = 60
+
+# milliseconds spent rendering per slice, and the delay between the slices
+SLICE_MS = 15
+SLICE_DELAY = 1
 
 class Renderer():
     '''The Renderer class takes raw content of the markdown file. 
@@ -25,6 +40,12 @@ class Renderer():
         content: A string to be parsed.
 
         state: A state object to which screens are attached.
+
+        index: The Text index where the rendered text is inserted. END by \
+            default, a mark can be used to render in the middle of the text.
+
+        link_exists: None, or a function (title) -> bool. Links for which it\
+            returns False are shown with the 'missing-link' tag.
     
     Methods:
         create_tag: Creates tags for proper styling.
@@ -40,10 +61,20 @@ class Renderer():
 
         line_2_parsed_chars: Parsed the line to parsed list of chars.
 
+        line_2_parsed_line: Parses the line to a ParsedLine.
+
         render_content: Adds the parsed list of chars to the textarea.
 
         render_line: Adds the parsed line to the textarea.
 
+        block_2_parsed_lines: Sanitizes a block and parses its lines.
+
+        render_parsed_lines: Adds already parsed lines to the textarea.
+
+        render_parsed_blocks: Adds already parsed blocks to the textarea.
+
+        render_block: Adds a single raw block to the textarea.
+
         render: Renders the complete content.
 
     '''
@@ -56,9 +87,15 @@ class Renderer():
         self.sanitized_content = ''
         self.sanitized_blocks = []
         self.lines = []
+        self.index = END
+        self.link_exists = None
+        self.textarea.tag_config('missing-link', foreground='red')
         
     def create_tag(self, attrs):
         '''Creates tags for proper styling.
+
+        The font and the tag configuration come from the shared style \
+            registry, so they are only made once per Text widget.
         
         Arguments:
             attrs: list of strings specifying the styles for a character
@@ -68,22 +105,7 @@ class Renderer():
 
         '''
 
-        my_font = font.Font(self.textarea, self.textarea.cget('font'))
-        attrs.sort()
-        for attr in attrs:
-            if attr=='bold':
-                my_font.configure(weight="bold")
-            elif attr=='italic':
-                my_font.configure(slant='italic')
-            elif attr=='underline':
-                my_font.configure(underline=True)
-            elif attr=='h1':
-                my_font.configure(size=24)
-            elif attr=='h2':
-                my_font.configure(size=20)
-        tag = '_'.join(attrs) 
-        self.textarea.tag_configure(tag, font=my_font)
-        return tag
+        return style_registry.tag_for(self.textarea, attrs)
 
     def content_2_blocks(self):
         '''Divides raw content to blocks to texts.
@@ -106,35 +128,11 @@ class Renderer():
             block: A string having unnecessary line breaks.
 
         Returns:
-            None
+            str: the block where every line can be parsed independently.
 
         '''
 
-        lines = block.split('\n')
-        to_delete = False 
-        for line_num, line in enumerate(lines):
-            if to_delete:
-                lines[line_num] = 'THIS_LINE_TO_BE_DELETED'
-                to_delete = False 
-            elif line_num+1<len(lines) and line.startswith('* ') and not lines[line_num+1].startswith('* ') and not lines[line_num+1].startswith('# ') and not lines[line_num+1].startswith('## '):
-                lines[line_num] = lines[line_num] + ' ' + lines[line_num+1]
-                to_delete = True
-
-        lines = list(filter(lambda x: x!='THIS_LINE_TO_BE_DELETED', lines))
-
-        for line_num in range(len(lines)-1, 0, -1):
-            next = lines[line_num-1]
-            current = lines[line_num]
-            l1 = ['* ', '# ']
-            l2 = ['## ']
-
-            if current.strip()!='' and next.strip()!='' and (current[:2] not in l1) and (current[:3] not in l2) and (next[:2] not in l1) and (next[:3] not in l2):
-                lines[line_num-1 ] = lines[line_num-1] + ' ' + lines[line_num]
-                lines[line_num] = 'THIS_LINE_TO_BE_DELETED'
-
-        lines = list(filter(lambda x: x!='THIS_LINE_TO_BE_DELETED', lines))
-
-        return '\n'.join(lines) 
+        return block_2_sanitized_block(block)
 
     def sanitized_blocks_2_sanitized_content(self):
         '''Joins the sanitized blocks to make\
@@ -175,8 +173,28 @@ class Renderer():
 
         return parse(line)
 
+    def line_2_parsed_line(self, line):
+        '''Parses the line to a ParsedLine.
+
+        A blank is added to the line before parsing, so that a marker at the\
+            end of the line can be closed, and it is removed from the result.\
+            The result is kept in the shared line cache.
+
+        Arguments:
+            line: An raw string
+
+        Returns:
+            ParsedLine: the parsed line without the added blank.
+
+        '''
+
+        return line_2_parsed_line(line)
+
     def render_content(self):
         '''Adds the parsed list of chars to the textarea.
+
+        The lines come one by one from pipeline.content_2_sanitized_lines, \
+            the sanitized content is never built as a whole.
         
         Arguments:
             None
@@ -186,51 +204,129 @@ class Renderer():
 
         '''
 
-        blocks = self.content_2_blocks()
-        for block in blocks:
-            self.sanitized_blocks.append(self.block_2_sanitized_block(block))
-        self.sanitized_blocks_2_sanitized_content()
-        self.content_2_lines()
-        temp_list = []
-        for line in self.lines:
-            temp_list.append(line)
-            temp_list.append('\n')
-        self.lines = temp_list[:-1]
-
-        for line in self.lines:
+        for line_num, line in enumerate(content_2_sanitized_lines(self.content)):
+            if line_num>0:
+                self.render_line('\n')
             self.render_line(line)
 
     def render_line(self, line):
         '''Adds the parsed line to the textarea.
+
+        Consecutive characters with the same styling are grouped in runs and\
+            the whole line is inserted with a single insert call, so the \
+            number of Tcl calls depends on the number of runs.
         
         Arguments:
-            line (str): An unparsed string which is to be rendered to screen.
+            line (str): An unparsed string which is to be rendered to screen.\
+                A ParsedLine is rendered as it is.
 
         Returns:
             None
 
         '''
 
-        if line=='\n':
-            self.textarea.insert(END, '\n')
-        else:
-            line = self.line_2_parsed_chars(line+' ')[:-1]
-            if len(line)>0 and line[0].get('bulleted_list'):
-                self.textarea.insert(END, '    ' + u'\u2022' + ' ')
-            for char in line:
-                if char.get('link'):
-                    # new_file_name = os.path.join(self.app_state.base_dir, 'md', char['href'])
-                    new_heading = char['href']
-                    self.textarea.insert(END, char['char'], self.hyperlink.add(partial(self.app_state.show, {'screen_name':'view_screen', 'article_name': new_heading})))
+        with span('renderer.render_line'):
+            if line=='\n':
+                self.textarea.insert(self.index, '\n')
+                return
+
+            if not isinstance(line, ParsedLine):
+                line = self.line_2_parsed_line(line)
+            # one insert per line: insert(END, text1, tags1, text2, tags2, ...)
+            chunks = []
+            if len(line.runs)>0 and line.runs[0][2] & ATTRIBUTE_BITS['bulleted_list']:
+                chunks.extend(('    ' + u'\u2022' + ' ', ()))
+            # consecutive runs with the same href are the text of one link,
+            # which gets one link tag and one action
+            link_href = None
+            for start, end, mask, href in line.runs:
+                tags = ()
+                if mask:
+                    tags = (self.create_tag(ParsedLine.attributes(mask)),)
+                if href is not None:
+                    if href!=link_href:
+                        # new_file_name = os.path.join(self.app_state.base_dir, 'md', char['href'])
+                        new_heading = href
+                        link_href = href
+                        link_tags = self.hyperlink.add(partial(self.app_state.show, {'screen_name':'view_screen', 'article_name': new_heading}))
+                        if self.link_exists is not None and not self.link_exists(href):
+                            link_tags += ('missing-link',)
+                    tags = link_tags[:2] + tags + link_tags[2:]
                 else:
-                    self.textarea.insert(END, char['char'])
-                attrs = [ 'bold', 'italic', 'underline', 'link', 'inline_code', 'h1', 'h2', 'bulleted_list' ]
-                # attrs = attrs[:3]
-                char_attrs = []
-                for attr in attrs:
-                    if char.get(attr):
-                        char_attrs.append(attr)
-                self.textarea.tag_add(self.create_tag(char_attrs), 'end -2 chars', 'end -1 chars') 
+                    link_href = None
+                chunks.extend((line.text[start:end], tags))
+            if chunks:
+                self.textarea.insert(self.index, *chunks)
+
+    def block_2_parsed_lines(self, block):
+        '''Sanitizes a raw block and parses each of its lines.
+
+        This does not touch the textarea, so it can run outside of the Tk \
+            main thread. The result is kept in the shared block cache.
+
+        Arguments:
+            block (str): A block of the content, see content_2_blocks.
+
+        Returns:
+            tuple: the ParsedLine of every line of the sanitized block.
+
+        '''
+
+        return block_2_parsed_lines(block)
+
+    def render_parsed_lines(self, parsed_lines):
+        '''Adds already parsed lines to the textarea, separated by newlines.
+
+        Arguments:
+            parsed_lines: ParsedLines, see block_2_parsed_lines.
+
+        Returns:
+            None
+
+        '''
+
+        for line_num, line in enumerate(parsed_lines):
+            if line_num>0:
+                self.render_line('\n')
+            self.render_line(line)
+
+    def render_parsed_blocks(self, parsed_blocks):
+        '''Adds already parsed blocks to the textarea.
+
+        The blocks are separated by an empty line, the output is the same as\
+            render_content for the content the blocks were parsed from.
+
+        Arguments:
+            parsed_blocks: list of tuples of ParsedLines, see \
+                pipeline.content_2_parsed_blocks.
+
+        Returns:
+            None
+
+        '''
+
+        with span('renderer.render_parsed_blocks'):
+            for block_num, parsed_lines in enumerate(parsed_blocks):
+                if block_num>0:
+                    self.render_line('\n')
+                    self.render_line('\n')
+                self.render_parsed_lines(parsed_lines)
+
+    def render_block(self, block):
+        '''Adds a single raw block to the textarea.
+
+        The block is sanitized and its lines are rendered one after another,\
+            exactly as render_content renders them inside the whole content.
+
+        Arguments:
+            block (str): A block of the content, see content_2_blocks.
+
+        Returns:
+            None
+
+        '''
+
+        self.render_parsed_lines(self.block_2_parsed_lines(block))
 
     def render(self):
         '''Renders the complete content.
@@ -244,5 +340,93 @@ class Renderer():
         '''
 
         self.render_content()
-                              
 
+
+class ProgressiveRender():
+    '''Renders parsed blocks in bounded time slices scheduled with after.
+
+    render_first renders about a screenful at once. start then renders the \
+        rest, SLICE_MS at a time, giving the Tk event loop a turn between \
+        the slices. The text widget is left disabled between the slices.
+
+    Attributes:
+        renderer: the Renderer of the text widget
+
+        parsed_blocks: the blocks to render, see \
+            pipeline.content_2_parsed_blocks
+
+        rendered: the number of blocks rendered so far
+
+        on_progress: None, or a function (rendered, total) called after \
+            every slice
+
+        slices: the number of slices run, for statistics
+
+    Methods:
+        render_first: renders the first screenful
+
+        start: schedules the rest
+
+        cancel: stops rendering
+
+        done: checks if every block was rendered
+    '''
+
+    def __init__(self, renderer, parsed_blocks, on_progress=None):
+        self.renderer = renderer
+        self.textarea = renderer.textarea
+        self.parsed_blocks = parsed_blocks
+        self.rendered = 0
+        self.on_progress = on_progress
+        self.slices = 0
+        self.pending = None
+
+    def done(self):
+        '''Checks if every block was rendered.'''
+
+        return self.rendered>=len(self.parsed_blocks)
+
+    def __render_next(self):
+        parsed_lines = self.parsed_blocks[self.rendered]
+        if self.rendered>0:
+            self.renderer.render_line('\n')
+            self.renderer.render_line('\n')
+        self.renderer.render_parsed_lines(parsed_lines)
+        self.rendered += 1
+        return len(parsed_lines)
+
+    def render_first(self, max_lines=FIRST_SCREEN_LINES):
+        '''Renders blocks until about max_lines lines are in the widget.'''
+
+        lines = 0
+        while not self.done() and lines<max_lines:
+            lines += self.__render_next()
+
+    def start(self):
+        '''Schedules the blocks which are not rendered yet.'''
+
+        if self.on_progress is not None:
+            self.on_progress(self.rendered, len(self.parsed_blocks))
+        if not self.done():
+            self.pending = self.textarea.after(SLICE_DELAY, self.__slice)
+
+    def __slice(self):
+        self.pending = None
+        self.slices += 1
+        deadline = time.perf_counter() + SLICE_MS / 1000
+        with span('renderer.slice'):
+            self.textarea.config(state='normal')
+            while not self.done() and time.perf_counter()<deadline:
+                self.__render_next()
+            self.textarea.config(state='disabled')
+        if self.on_progress is not None:
+            self.on_progress(self.rendered, len(self.parsed_blocks))
+        if not self.done():
+            self.pending = self.textarea.after(SLICE_DELAY, self.__slice)
+
+    def cancel(self):
+        '''Stops rendering, the pending slice is not run.'''
+
+        if self.pending is not None:
+            self.textarea.after_cancel(self.pending)
+            self.pending = None
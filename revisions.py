@@ -0,0 +1,366 @@
+'''This module keeps the old versions of the articles.
+
+Every edit used to move the whole article to data/removed_mds and write a \
+    new file, so an article edited fifty times left fifty nearly identical \
+    copies. The RevisionStore keeps every version once, by the sha1 of its \
+    content, in data/revisions/objects. A version is stored either as a \
+    zlib compressed snapshot or as a line delta against the version before\
+    it, whichever is smaller. A snapshot is forced every SNAPSHOT_INTERVAL \
+    versions, so rebuilding any version applies at most that many deltas. \
+    Saving the same content twice in a row records nothing.
+
+The list of versions of every article is kept in data/revisions/history.
+
+    python revisions.py log "Article Name"
+    python revisions.py show "Article Name" N
+    python revisions.py import-removed [--directory data/removed_mds]
+    python revisions.py stats
+
+'''
+
+import argparse
+import hashlib
+import marshal
+import os
+import re
+import sys
+import time
+import zlib
+from datetime import datetime
+from difflib import SequenceMatcher
+
+from cache import LRUCache
+
+# a snapshot is stored at least every SNAPSHOT_INTERVAL versions of a chain
+SNAPSHOT_INTERVAL = 16
+
+# versions rebuilt from deltas are kept in memory
+CONTENT_CACHE_ENTRIES = 64
+CONTENT_CACHE_BYTES = 16 * 1024 * 1024
+
+SNAPSHOT = 0
+DELTA = 1
+
+def content_id(content):
+    '''Returns the id of a version: the sha1 of its content.'''
+
+    return hashlib.sha1(content.encode('utf-8', 'surrogatepass')).hexdigest()
+
+def line_delta(base_lines, lines):
+    '''Returns the operations turning base_lines into lines.
+
+    Arguments:
+        base_lines, lines: lists of lines, with their line breaks
+
+    Returns:
+        list: (start, end) tuples copying base_lines[start:end] and lists of\
+            new lines, in order
+    '''
+
+    # an edit usually changes a few lines in the middle, the common head and\
+    # tail are copied without going through the quadratic matcher
+    limit = min(len(base_lines), len(lines))
+    head = 0
+    while head<limit and base_lines[head]==lines[head]:
+        head += 1
+    tail = 0
+    while tail<limit-head and base_lines[-1-tail]==lines[-1-tail]:
+        tail += 1
+
+    operations = []
+    if head:
+        operations.append((0, head))
+    matcher = SequenceMatcher(None, base_lines[head:len(base_lines)-tail], lines[head:len(lines)-tail], autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag=='equal':
+            operations.append((head+i1, head+i2))
+        elif j2>j1:
+            operations.append(lines[head+j1:head+j2])
+    if tail:
+        operations.append((len(base_lines)-tail, len(base_lines)))
+    return operations
+
+def apply_delta(base_lines, operations):
+    '''Returns the lines made by applying a line_delta to base_lines.'''
+
+    lines = []
+    for operation in operations:
+        if isinstance(operation, tuple):
+            lines.extend(base_lines[operation[0]:operation[1]])
+        else:
+            lines.extend(operation)
+    return lines
+
+class RevisionStore():
+    '''Content addressed storage of the versions of the articles.
+
+    Objects are files objects/<2 chars>/<38 chars> of the sha1 of the \
+        content, holding a compressed marshal of (SNAPSHOT, text) or \
+        (DELTA, base id, depth, operations), where depth is the number of \
+        deltas to apply from the nearest snapshot.
+
+    Attributes:
+        directory: the directory of the store
+
+        snapshot_interval: maximum depth of a delta chain
+
+        contents: an LRUCache of rebuilt versions, {id: content}
+
+    Methods:
+        put: stores a version and returns its id
+
+        get: returns the content of a version
+
+        record: adds a version to the history of an article
+
+        record_delete: records that an article was removed
+
+        history: returns the versions of an article
+
+        titles: returns the titles having a history
+    '''
+
+    def __init__(self, directory, snapshot_interval=SNAPSHOT_INTERVAL):
+        self.directory = directory
+        self.snapshot_interval = snapshot_interval
+        self.contents = LRUCache(CONTENT_CACHE_ENTRIES, CONTENT_CACHE_BYTES, lambda key, value: sys.getsizeof(value))
+
+    def object_path(self, object_id):
+        '''Returns the path of the file of an object.'''
+
+        return os.path.join(self.directory, 'objects', object_id[:2], object_id[2:])
+
+    def history_path(self, title):
+        '''Returns the path of the history of an article, the case is ignored.'''
+
+        key = hashlib.sha1(title.casefold().encode('utf-8', 'surrogatepass')).hexdigest()
+        return os.path.join(self.directory, 'history', key)
+
+    @staticmethod
+    def __write(path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path+'.tmp', 'wb') as f:
+            f.write(zlib.compress(marshal.dumps(data), 6))
+        os.replace(path+'.tmp', path)
+
+    @staticmethod
+    def __read(path):
+        with open(path, 'rb') as f:
+            return marshal.loads(zlib.decompress(f.read()))
+
+    def __depth(self, object_id):
+        record = self.__read(self.object_path(object_id))
+        return record[2] if record[0]==DELTA else 0
+
+    def put(self, content, base_id=None):
+        '''Stores a version, as a delta against base_id if that is smaller.
+
+        Arguments:
+            content (str): the content of the version
+            base_id (str): id of the version it was made from, or None
+
+        Returns:
+            str: the id of the version
+        '''
+
+        object_id = content_id(content)
+        path = self.object_path(object_id)
+        if os.path.exists(path):
+            return object_id
+
+        record = (SNAPSHOT, content)
+        if base_id is not None and base_id!=object_id:
+            try:
+                depth = self.__depth(base_id) + 1
+            except (OSError, ValueError, EOFError, zlib.error):
+                depth = self.snapshot_interval
+            if depth<self.snapshot_interval:
+                base_lines = self.get(base_id).splitlines(keepends=True)
+                operations = line_delta(base_lines, content.splitlines(keepends=True))
+                delta = (DELTA, base_id, depth, operations)
+                if len(marshal.dumps(delta))<len(marshal.dumps(record)):
+                    record = delta
+        self.__write(path, record)
+        self.contents.put(object_id, content)
+        return object_id
+
+    def get(self, object_id):
+        '''Returns the content of a version.
+
+        Raises:
+            OSError: if there is no such version
+        '''
+
+        content = self.contents.get(object_id)
+        if content is not None:
+            return content
+        # walk back to the nearest snapshot or cached version
+        chain = []
+        current = object_id
+        while True:
+            content = self.contents.get(current)
+            if content is not None:
+                break
+            record = self.__read(self.object_path(current))
+            if record[0]==SNAPSHOT:
+                content = record[1]
+                break
+            chain.append(record[3])
+            current = record[1]
+        lines = content.splitlines(keepends=True)
+        for operations in reversed(chain):
+            lines = apply_delta(lines, operations)
+        content = ''.join(lines)
+        self.contents.put(object_id, content)
+        return content
+
+    def history(self, title):
+        '''Returns the versions of an article, oldest first.
+
+        Returns:
+            list: (timestamp, id, action) tuples, action is 'save' or \
+                'delete' and id is None for 'delete'
+        '''
+
+        try:
+            return list(self.__read(self.history_path(title))[1])
+        except (OSError, ValueError, EOFError, zlib.error):
+            return []
+
+    def __append(self, title, entry):
+        history = self.history(title)
+        history.append(entry)
+        self.__write(self.history_path(title), (title, history))
+
+    def latest(self, title):
+        '''Returns the id of the last saved version of an article, or None.'''
+
+        for timestamp, object_id, action in reversed(self.history(title)):
+            if object_id is not None:
+                return object_id
+        return None
+
+    def record(self, title, content, timestamp=None):
+        '''Adds a version to the history of an article.
+
+        Nothing is recorded when the content did not change since the last \
+            version.
+
+        Arguments:
+            title (str): article name
+            content (str): the new content
+            timestamp (float): time of the change, now by default
+
+        Returns:
+            str: the id of the version, or None if nothing was recorded
+        '''
+
+        history = self.history(title)
+        last = history[-1] if history else None
+        if last is not None and last[2]=='save' and last[1]==content_id(content):
+            return None
+        object_id = self.put(content, self.latest(title))
+        self.__append(title, (timestamp or time.time(), object_id, 'save'))
+        return object_id
+
+    def record_delete(self, title, timestamp=None):
+        '''Records that an article was removed.'''
+
+        self.__append(title, (timestamp or time.time(), None, 'delete'))
+
+    def titles(self):
+        '''Returns the titles of all articles having a history.'''
+
+        directory = os.path.join(self.directory, 'history')
+        if not os.path.isdir(directory):
+            return []
+        titles = []
+        for file_name in os.listdir(directory):
+            if not file_name.endswith('.tmp'):
+                titles.append(self.__read(os.path.join(directory, file_name))[0])
+        return sorted(titles, key=str.casefold)
+
+    def stats(self):
+        '''Counts the objects of the store.
+
+        Returns:
+            dict: {'snapshots': int, 'deltas': int, 'bytes': int}
+        '''
+
+        result = {'snapshots': 0, 'deltas': 0, 'bytes': 0}
+        for root, directories, files in os.walk(os.path.join(self.directory, 'objects')):
+            for file_name in files:
+                path = os.path.join(root, file_name)
+                result['bytes'] += os.path.getsize(path)
+                kind = self.__read(path)[0]
+                result['snapshots' if kind==SNAPSHOT else 'deltas'] += 1
+        return result
+
+# names of data/removed_mds files: <title><random_id>.md
+REMOVED_NAME = re.compile(r'^(.*?)(\d{4}-\d{2}-\d{2}\d{6}(?:\.\d+)?)\.md$')
+
+def import_removed(store, directory):
+    '''Adds the copies of a removed_mds directory to the histories.
+
+    Arguments:
+        store: a RevisionStore
+        directory: the removed_mds directory, its files are not changed
+
+    Returns:
+        dict: {'files': int, 'recorded': int, 'bytes': int}
+    '''
+
+    copies = []
+    for file_name in os.listdir(directory):
+        match = REMOVED_NAME.match(file_name)
+        if match is None:
+            continue
+        stamp = match.group(2)
+        moment = datetime.strptime(stamp, '%Y-%m-%d%H%M%S.%f' if '.' in stamp else '%Y-%m-%d%H%M%S')
+        copies.append((moment.timestamp(), match.group(1), file_name))
+
+    result = {'files': 0, 'recorded': 0, 'bytes': 0}
+    for timestamp, title, file_name in sorted(copies):
+        path = os.path.join(directory, file_name)
+        with open(path, 'r', errors='replace') as f:
+            content = f.read()
+        result['files'] += 1
+        result['bytes'] += os.path.getsize(path)
+        if store.record(title, content, timestamp) is not None:
+            result['recorded'] += 1
+    return result
+
+def main():
+    data_dir = os.path.join(os.getcwd(), 'data')
+    arg_parser = argparse.ArgumentParser(description='Shows the old versions of the articles.')
+    arg_parser.add_argument('--store', default=os.path.join(data_dir, 'revisions'), help='directory of the revision store')
+    subparsers = arg_parser.add_subparsers(dest='command', required=True)
+    log_parser = subparsers.add_parser('log', help='list the versions of an article')
+    log_parser.add_argument('title')
+    show_parser = subparsers.add_parser('show', help='print a version of an article')
+    show_parser.add_argument('title')
+    show_parser.add_argument('number', type=int, help='number of the version as listed by log')
+    import_parser = subparsers.add_parser('import-removed', help='add the copies of removed_mds to the histories')
+    import_parser.add_argument('--directory', default=os.path.join(data_dir, 'removed_mds'))
+    subparsers.add_parser('stats', help='count the stored objects')
+    args = arg_parser.parse_args()
+
+    store = RevisionStore(args.store)
+    if args.command=='log':
+        for number, (timestamp, object_id, action) in enumerate(store.history(args.title)):
+            print(f'{number:4} {datetime.fromtimestamp(timestamp):%Y-%m-%d %H:%M:%S} {action:<6} {object_id or ""}')
+    elif args.command=='show':
+        timestamp, object_id, action = store.history(args.title)[args.number]
+        if object_id is None:
+            sys.exit(f'version {args.number} is a removal')
+        sys.stdout.write(store.get(object_id))
+    elif args.command=='import-removed':
+        result = import_removed(store, args.directory)
+        stats = store.stats()
+        print(f'{result["recorded"]} versions recorded from {result["files"]} files ({result["bytes"]} bytes), '
+              f'store: {stats["snapshots"]} snapshots, {stats["deltas"]} deltas, {stats["bytes"]} bytes')
+    else:
+        print(store.stats())
+
+if __name__=='__main__':
+    main()
@@ -5,16 +5,24 @@ To make s new screen, the 'Screen' class must be implemented. For more details \
 
 '''
 
-import os
+import time
+from collections import OrderedDict
 from functools import partial
 from abc import ABC, abstractmethod
 
 from tkinter import *
 
 import data_manager
-from renderer import Renderer
+import link_graph
+import search_index
+from catalog import Catalog
+from renderer import Renderer, ProgressiveRender
+from preview import PreviewRenderer, PreviewScheduler, PreviewWorker
 from messages import show_message, askquestion
 
+# milliseconds between two checks for the end of a background load, like the
+# link graph for the backlinks or the search index
+LOADING_POLL = 100
 
 class Screen(ABC):
     '''This is a abstract class. Every Screen has to implement this class.
@@ -42,9 +50,18 @@ class Screen(ABC):
         add_element: adds element to screen_elements list
         show: shows the screen
         make_screen_elements: make the tk widgets for screen and packs them
+        reuse_screen_elements: decides if a retained screen is shown again \
+            with the widgets it already has
         hide: hides a screen
+        destroy_screen_elements: destroys the widgets of the screen
+
+    A screen with retained = True keeps its widgets when it is hidden (they \
+        are only unpacked) and show packs them again when \
+        reuse_screen_elements says they are still good.
     '''
 
+    retained = False
+
     def __init__(self, root, state, title="", heading="", is_active=False):
         '''Inits Screen with arguments root, state title, heading and is_active.
 
@@ -141,7 +158,11 @@ class Screen(ABC):
         '''
 
         self.set_active(True)
-        value = self.make_screen_elements(options)
+        if self.retained and self.reuse_screen_elements(options):
+            value = None
+        else:
+            self.destroy_screen_elements()
+            value = self.make_screen_elements(options)
         if value is None or value==1:
             for element in self.screen_elements:
                 element['element'].pack(**element['pack_options']) 
@@ -163,15 +184,38 @@ class Screen(ABC):
         '''
         pass 
 
+    def reuse_screen_elements(self, options=None):
+        '''Checks if the widgets of a retained screen can be shown again.
+
+        Called by show instead of make_screen_elements on retained screens. \
+            When it returns False the widgets are made again.
+
+        Arguments:
+            options: see show
+        Returns:
+            bool
+        '''
+
+        return False
+
     def hide(self):
         '''This hides the screen.
         
         First it sets the screen to in-active. Then unpack the elements from \
             the screen then destroys the elements and then sets screen elements\
-            list to empty list.       
+            list to empty list. A retained screen only unpacks them.
         '''
 
         self.set_active(False)
+        if self.retained:
+            for element in self.screen_elements:
+                element['element'].pack_forget()
+            return
+        self.destroy_screen_elements()
+
+    def destroy_screen_elements(self):
+        '''Unpacks and destroys the widgets of the screen.'''
+
         for element in self.screen_elements:
             try:
                 element['element'].pack_forget()
@@ -182,63 +226,254 @@ class Screen(ABC):
 
 class ListScreen(Screen):
     '''This screen lists out all of the available articles.
+
+    The list is virtualized. Whatever the size of the wiki, only the rows \
+        visible in the canvas exist, as canvas text items. They are moved and \
+        given new titles as the list scrolls, and a click is mapped back to \
+        the article from its position.
+
+    The screen is retained: coming back to it shows the same widgets, at the\
+        same scroll position, unless an article was added or removed.
     
     For more details see base class 
 
     Methods:
         set_file_paths: This method, when called, scans over the database\
             and returns all of the articles available
+
+        row_text: the text shown on a row
+
+        refresh_rows: puts the visible rows at their place
     '''
 
+    retained = True
+
+    row_height = 36
+    row_font = 'comicsansms 18'
+    # padding of the list inside the canvas
+    pad_x = 70
+    pad_y = 20
+
     def __init__(self, root, state, title, heading, is_active=False):
         super().__init__(root=root, state=state, title=title, heading=heading, is_active=is_active)
 
     def _on_mousewheel(self, event):
         self.canvas.yview_scroll(int(-1*(event.delta/120)), "units")
 
+    def _on_scroll(self, first, last):
+        self.yscrollbar.set(first, last)
+        self.refresh_rows()
+
+    def _on_configure(self, event):
+        rows = event.height // self.row_height + 2
+        while len(self.rows)<rows:
+            self.rows.append(self.canvas.create_text(self.pad_x, 0, anchor='nw', font=self.row_font, state='hidden', tags=('row',)))
+        width = max(event.width, 1)
+        self.canvas.configure(scrollregion=(0, 0, width, 2*self.pad_y + self.row_count()*self.row_height))
+        self.first_row = None
+        self.refresh_rows()
+
+    def _on_click(self, event):
+        index = int((self.canvas.canvasy(event.y) - self.pad_y) // self.row_height)
+        if 0<=index<len(self.current_md_files):
+            self.state.show({'screen_name':'view_screen', 'article_name': self.current_md_files[index][:-3]})
+        elif index==len(self.current_md_files):
+            self.state.show({'screen_name': 'create_screen'})
+
+    def reuse_screen_elements(self, options=None):
+        '''The list is shown again as it is when no article was added or removed.'''
+
+        if not self.screen_elements or data_manager.get_articles_list()!=self.current_md_files:
+            return False
+        self.set_title(self.heading)
+        return True
+
     def set_file_paths(self):
         '''Scans over the database and returns all of the articles available.'''
 
         self.current_md_files = data_manager.get_articles_list()
 
+    def row_count(self):
+        '''Number of rows: every article plus the create new article link.'''
+
+        return len(self.current_md_files) + 1
+
+    def row_text(self, index):
+        '''Returns the text shown on the row at index.'''
+
+        if index<len(self.current_md_files):
+            return f'{index+1}. {self.current_md_files[index][:-3].title()}'
+        return u'\u2022' + '  Create New Article'
+
+    def refresh_rows(self):
+        '''Puts the rows of the canvas on the articles visible right now.
+
+        Nothing is done if the first visible article did not change since \
+            the last call.
+        '''
+
+        first = max(0, int((self.canvas.canvasy(0) - self.pad_y) // self.row_height))
+        if first==self.first_row:
+            return
+        self.first_row = first
+        for slot, item in enumerate(self.rows):
+            index = first + slot
+            if index<self.row_count():
+                self.canvas.coords(item, self.pad_x, self.pad_y + index*self.row_height)
+                self.canvas.itemconfigure(item, text=self.row_text(index), state='normal')
+            else:
+                self.canvas.itemconfigure(item, state='hidden')
+
     def make_screen_elements(self, options=None):
         '''See Base Class Method'''
 
         self.set_title(self.heading)
+        self.set_file_paths()
+        self.rows = []
+        self.first_row = None
+
         self.wrapper = LabelFrame(self.root)
         self.canvas = Canvas(self.wrapper)
         self.yscrollbar = Scrollbar(self.wrapper, orient='vertical', command=self.canvas.yview)
-        self.canvas.configure(yscrollcommand=self.yscrollbar.set)
-        self.canvas.bind("<Configure>", lambda e: self.canvas.configure(scrollregion=self.canvas.bbox('all')))
+        self.canvas.configure(yscrollcommand=self._on_scroll, yscrollincrement=self.row_height)
+        self.canvas.bind("<Configure>", self._on_configure)
         self.canvas.bind("<MouseWheel>", self._on_mousewheel)
-
+        self.canvas.tag_bind('row', '<Button-1>', self._on_click)
 
         self.heading_label = Label(self.root, text=self.heading, font='comicsansms 22 bold')
         self.add_element(element=self.heading_label, pack_options={'side': TOP, 'pady': 10})
 
-        self.frame = Frame(self.canvas, padx=70, pady=20)
-        self.canvas.create_window((0,0), window=self.frame, anchor='nw')
+        self.search_button = Button(self.root, text='Search', padx=10, pady=5, font='comicsansms 10')
+        self.search_button.bind('<Button-1>', partial(self.state.show, {'screen_name': 'search_screen'}))
+        self.add_element(element=self.search_button, pack_options={'side': TOP, 'pady': 5})
 
         self.add_element(element=self.canvas, pack_options={'side':LEFT, 'fill':BOTH, 'expand':True})
         self.add_element(element=self.yscrollbar, pack_options={'fill':Y, 'side':RIGHT})
+        self.add_element(element=self.wrapper, pack_options={'fill':BOTH, 'ipadx':20, 'ipady':20, 'expand':True})
 
-        # self.add_element(element=self.frame, pack_options={'side':LEFT, 'anchor':'nw', 'fill':Y, 'ipadx':20, 'ipady':20})
+class SearchScreen(Screen):
+    '''This screen searches the articles with the full text index.
 
-        self.view_links = []
-        self.set_file_paths()
+    The results are listed best first, a click on a result opens the article.\
+        The query can be given in options as {'query': ...}.
 
-        for index, md_file in enumerate(self.current_md_files):
-            label = Label(self.frame, text=f'{index+1}. {md_file[:-3].title()}', font='comicsansms 18')
-            self.view_links.append(label)
-            label.bind('<Button-1>', partial(self.state.show, {'screen_name':'view_screen', 'article_name': md_file[:-3]}))
-            self.add_element(element=label, pack_options={'anchor':'w'})
-        
-        self.create_link = Label(self.frame, text=u'\u2022' + '  Create New Article', font='comicsansms 18')
-        self.create_link.bind('<Button-1>', partial(self.state.show, {'screen_name': 'create_screen'}))
+    While the search index is loading in the background the query entry and\
+        the Search button are disabled and 'Index loading...' is shown.
+
+    For more details see base class and the search_index module.
+
+    Methods:
+        search: runs the query in the entry and lists the results
+
+        enable_when_ready: enables the search once the index is loaded
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+    def search(self, event=None):
+        '''Runs the query in the entry and lists the results.'''
 
-        self.add_element(element=self.create_link, pack_options={'anchor':'w'})
+        if self.loading:
+            return
+        index = self.enable_when_ready()
+        if index is None:
+            return
+        query = self.query_entry.get()
+        started = time.perf_counter()
+        results = index.search(query)
+        elapsed = (time.perf_counter() - started) * 1000
+        self.results = [title for title, score in results]
+        self.results_list.delete(0, END)
+        for index, title in enumerate(self.results):
+            self.results_list.insert(END, f'{index+1}. {title.title()}')
+        self.status_label.config(text=f'{len(self.results)} results in {elapsed:.1f} ms' if query.strip() else '')
+
+    def enable_when_ready(self):
+        '''Enables the search once the index is loaded.
+
+        While the index is loading, this is called again every LOADING_POLL \
+            milliseconds until it is ready or the screen is hidden.
+
+        Returns:
+            SearchIndex: the index, or None if it can not be used yet
+        '''
+
+        if not self.status_label.winfo_exists():
+            return None
+        try:
+            index = search_index.get_index(wait=False)
+        except Exception:
+            self.status_label.config(text='The search index is not available.')
+            return None
+        if index is None:
+            if not self.loading:
+                self.loading = True
+                self.query_entry.config(state='disabled')
+                self.search_button.config(state='disabled')
+                self.status_label.config(text='Index loading...')
+            self.root.after(LOADING_POLL, self.enable_when_ready)
+            return None
+        if self.loading:
+            self.loading = False
+            self.query_entry.config(state='normal')
+            self.search_button.config(state='normal')
+            self.status_label.config(text='')
+            self.query_entry.focus_set()
+            # a query given in the options waited for the index
+            if self.query_entry.get().strip():
+                self.search()
+        return index
+
+    def __open_result(self, event):
+        selection = self.results_list.curselection()
+        if selection:
+            self.state.show({'screen_name': 'view_screen', 'article_name': self.results[selection[0]]})
+
+    def make_screen_elements(self, options=None):
+        '''See Base Class.'''
+
+        options = options or {}
+        self.set_title(self.heading)
+        self.results = []
+        self.loading = False
+
+        self.frame = Frame(self.root, bg='white', padx=50, pady=10, borderwidth=1, relief=GROOVE)
+        self.heading_label = Label(self.frame, text=self.heading, font='comicsansms 22 bold', bg='white')
+        self.query_entry = Entry(self.frame, font='comicsansms 15')
+        self.query_entry.insert(0, options.get('query', ''))
+        self.query_entry.bind('<Return>', self.search)
+
+        self.home_button = Button(self.frame, text='Home', padx=10, pady=5, font='comicsansms 10')
+        self.home_button.bind('<Button-1>', partial(self.state.show, {'screen_name': 'list_screen'}))
+
+        self.search_button = Button(self.frame, text='Search', padx=10, pady=5, font='comicsansms 10')
+        self.search_button.bind('<Button-1>', self.search)
+
+        self.status_label = Label(self.frame, text='', font='comicsansms 10', bg='white')
+
+        self.wrapper = LabelFrame(self.root)
+        self.results_list = Listbox(self.wrapper, font='comicsansms 15', activestyle='none', borderwidth=0)
+        self.yscrollbar = Scrollbar(self.wrapper, orient='vertical', command=self.results_list.yview)
+        self.results_list.configure(yscrollcommand=self.yscrollbar.set)
+        self.results_list.bind('<<ListboxSelect>>', self.__open_result)
+
+        self.add_element(element=self.frame, pack_options={'fill':X})
+        self.add_element(element=self.heading_label, pack_options={})
+        self.add_element(element=self.query_entry, pack_options={'fill':X, 'pady':10, 'ipadx':10, 'ipady':10})
+        self.add_element(element=self.home_button, pack_options={'side':LEFT})
+        self.add_element(element=self.search_button, pack_options={'side':LEFT, 'padx':10})
+        self.add_element(element=self.status_label, pack_options={'side':LEFT})
+        self.add_element(element=self.results_list, pack_options={'side':LEFT, 'fill':BOTH, 'expand':True})
+        self.add_element(element=self.yscrollbar, pack_options={'fill':Y, 'side':RIGHT})
         self.add_element(element=self.wrapper, pack_options={'fill':BOTH, 'ipadx':20, 'ipady':20, 'expand':True})
 
+        self.query_entry.focus_set()
+        if options.get('query'):
+            self.search()
+        else:
+            self.enable_when_ready()
+
 class CreateScreen(Screen):
     '''This screen opens a editor to the user for creating new article.
     
@@ -348,12 +583,46 @@ class ViewScreen(Screen):
     
     For more details see base class.
 
+    Below the article, the articles linking to it are listed (from the link \
+        graph) and links to articles which do not exist are shown in red. \
+        While the link graph is loading in the background, 'Backlinks \
+        loading...' is shown instead and the list is filled in once it is \
+        ready.
+
+    A long article is rendered progressively: the first screenful before \
+        the screen is shown, the rest in time slices (see ProgressiveRender)\
+        with the progress shown next to the buttons. The parsed blocks come \
+        from the prefetcher of the state when the article was prefetched.
+
     Methods:
         get_article_content: picks up the article from the database
+
+        has_page: checks if the rendered widgets of an article are kept
+
+        show_progress: shows how much of the article is rendered
+
+        make_backlinks_frame: makes the list of articles linking to this one
+
+        show_backlinks: fills the list of articles linking to this one
     '''
 
+    # at most this many backlinks are listed
+    max_backlinks = 20
+
+    # rendered articles kept for going back to them
+    retained = True
+    max_pages = 8
+
+    # the articles linked from the shown one are parsed ahead, see State
+    prefetch_links = True
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self.pages = OrderedDict() # items: article key -> attributes of a rendered article
+        self.page_key = None
+        self.progressive = None
+        if self.retained:
+            data_manager.subscribe(self.on_article_change)
     
     def __delete(self, event):
         file_name = self.heading.replace('Read Article - ', '')
@@ -370,9 +639,151 @@ class ViewScreen(Screen):
         Returns: 
             None    
         '''
-        file_src = os.path.join(self.state.base_dir, 'data', 'mds', article_name+'.md')
-        with open(file_src, 'r') as f:
-            return f.read()
+        return data_manager.get(article_name)
+
+    def show_progress(self, rendered, total):
+        '''Shows how much of the article is rendered, nothing once it is done.'''
+
+        self.progress_label.config(text='' if rendered>=total else f'Rendering... {rendered*100//total}%')
+
+    # attributes which make up a rendered article
+    page_attributes = ('screen_elements', 'heading', 'text', 'progressive', 'progress_label', 'backlinks_frame')
+
+    def hide(self):
+        '''Stops rendering the rest of the article and keeps it, see base class.
+
+        The widgets of the article are unpacked and kept in the pages LRU, \
+            the least recently shown article beyond max_pages is destroyed.
+        '''
+
+        if getattr(self, 'progressive', None) is not None:
+            self.progressive.cancel()
+        if self.retained and self.page_key is not None and self.screen_elements:
+            self.set_active(False)
+            for element in self.screen_elements:
+                element['element'].pack_forget()
+            self.pages[self.page_key] = {name: getattr(self, name) for name in self.page_attributes}
+            self.pages.move_to_end(self.page_key)
+            while len(self.pages)>self.max_pages:
+                self.destroy_page(self.pages.popitem(last=False)[1])
+        else:
+            self.set_active(False)
+            self.destroy_screen_elements()
+        self.screen_elements = []
+        self.progressive = None
+        self.page_key = None
+
+    def reuse_screen_elements(self, options=None):
+        '''Shows a kept article again, with its widgets as they are.'''
+
+        page = self.pages.pop(Catalog.title_key(options.get('article_name', '')), None)
+        if page is None:
+            return False
+        for name, value in page.items():
+            setattr(self, name, value)
+        self.page_key = Catalog.title_key(options.get('article_name', ''))
+        self.set_title(self.heading)
+        # goes on where it stopped if the article was hidden while rendering
+        self.progressive.start()
+        return True
+
+    def has_page(self, article_name):
+        '''Checks if the rendered widgets of an article are kept.'''
+
+        return Catalog.title_key(article_name) in self.pages
+
+    @staticmethod
+    def destroy_page(page):
+        '''Destroys the widgets of a kept article.'''
+
+        for element in page['screen_elements']:
+            element['element'].destroy()
+
+    def on_article_change(self, action, file_name, file_content):
+        '''Forgets the kept articles a change makes outdated, subscribed to \
+            data_manager.
+
+        Those are the changed article, the articles linking to it (their \
+            links to it may turn red or back), and the articles it links to \
+            or was listed as a backlink of (their backlinks change). The \
+            links come from the link graph, while it is not loaded every \
+            kept article is dropped. The one shown now is destroyed when it \
+            is hidden.
+        '''
+
+        key = Catalog.title_key(file_name)
+        try:
+            graph = link_graph.get_graph(wait=False)
+        except Exception:
+            graph = None
+        if graph is None:
+            stale = set(self.pages)
+            stale.add(self.page_key)
+        else:
+            stale = {key}
+            stale.update(Catalog.title_key(title) for title in graph.backlinks(file_name))
+            stale.update(Catalog.title_key(title) for title in graph.links(file_name))
+            pages = dict(self.pages)
+            if self.page_key is not None:
+                pages[self.page_key] = {'backlinks_frame': self.backlinks_frame}
+            stale.update(page_key for page_key, page in pages.items() if key in page['backlinks_frame'].backlink_keys)
+        for page_key in stale:
+            page = self.pages.pop(page_key, None)
+            if page is not None:
+                self.destroy_page(page)
+        if self.page_key in stale:
+            self.page_key = None
+
+    def make_backlinks_frame(self, article_name):
+        '''Makes the frame listing the articles which link to article_name.
+
+        Returns:
+            Frame: the frame, filled by show_backlinks
+        '''
+
+        frame = Frame(self.root, bg='white', padx=50, pady=5, borderwidth=1, relief=GROOVE)
+        # the keys of the articles listed, see on_article_change
+        frame.backlink_keys = set()
+        self.show_backlinks(frame, article_name)
+        return frame
+
+    def show_backlinks(self, frame, article_name):
+        '''Fills frame with a clickable label per article linking here.
+
+        If the link graph is still loading, a note is shown and this is \
+            called again every LOADING_POLL milliseconds until the graph is \
+            ready or the frame is destroyed. A failure of the graph is shown \
+            in the frame, the article itself is still readable.
+        '''
+
+        if not frame.winfo_exists():
+            return
+        for child in frame.winfo_children():
+            child.destroy()
+        try:
+            graph = link_graph.get_graph(wait=False)
+            if graph is not None:
+                backlinks = graph.backlinks(article_name)
+                missing = graph.dangling(article_name, data_manager.storage)
+        except Exception:
+            Label(frame, text='Backlinks are not available.', font='comicsansms 10', bg='white').pack(side=LEFT)
+            return
+        if graph is None:
+            Label(frame, text='Backlinks loading...', font='comicsansms 10', bg='white').pack(side=LEFT)
+            self.root.after(LOADING_POLL, self.show_backlinks, frame, article_name)
+            return
+
+        frame.backlink_keys = {Catalog.title_key(title) for title in backlinks}
+        text = 'Linked from:' if backlinks else 'No article links here.'
+        Label(frame, text=text, font='comicsansms 10', bg='white').pack(side=LEFT)
+        for title in backlinks[:self.max_backlinks]:
+            label = Label(frame, text=title.title(), font='comicsansms 10 underline', fg='blue', bg='white', cursor='hand2')
+            label.bind('<Button-1>', partial(self.state.show, {'screen_name': 'view_screen', 'article_name': title}))
+            label.pack(side=LEFT, padx=5)
+        if len(backlinks)>self.max_backlinks:
+            Label(frame, text=f'and {len(backlinks)-self.max_backlinks} more', font='comicsansms 10', bg='white').pack(side=LEFT)
+        if missing:
+            Label(frame, text=f'{len(missing)} link(s) to missing articles', font='comicsansms 10', fg='red', bg='white').pack(side=RIGHT)
     
     def make_screen_elements(self, options=None):
         '''See Base Class.'''
@@ -380,37 +791,49 @@ class ViewScreen(Screen):
         self.set_heading(f'Read Article - {options.get("article_name")}')
         self.set_title(f'Read Article - {options.get("article_name")}')
 
-        self.text = Text(self.root, font='comicsansms 15', padx=50, pady=20)
         try:
-            self.text_string = self.get_article_content(options.get('article_name'))
-            # self.text.insert(END, self.text_string)
-            Renderer(self.text, self.text_string, self.state).render()
-            self.text.config(state='disabled')
+            parsed_blocks = self.state.prefetcher.get_parsed_blocks(options.get('article_name'))
+        except (OSError, UnicodeDecodeError):
+            show_message('Error', f"There is no article named '{options.get('article_name')}'")
+            self.state.show({'screen_name': 'create_screen', 'article_name':options.get('article_name')})
+            return -1
 
-            self.frame = Frame(self.root, bg='white', padx=50, pady=10, borderwidth=1, relief=GROOVE)
+        self.text = Text(self.root, font='comicsansms 15', padx=50, pady=20)
+        data_manager.revalidate()
+        renderer = Renderer(self.text, '', self.state)
+        renderer.link_exists = data_manager.contains
+        # the first screenful now, the rest after the screen is shown
+        self.progressive = ProgressiveRender(renderer, parsed_blocks, on_progress=self.show_progress)
+        self.progressive.render_first()
+        self.text.config(state='disabled')
 
-            self.heading_label = Label(self.frame, text=self.heading.title(), font='comicsansms 22 bold', bg='white')
+        self.backlinks_frame = self.make_backlinks_frame(options.get('article_name'))
 
-            self.home_button = Button(self.frame, text='Home', padx=10, pady=5, font='comicsansms 10')
-            self.home_button.bind('<Button-1>', partial(self.state.show, {'screen_name': 'list_screen'}))
+        self.frame = Frame(self.root, bg='white', padx=50, pady=10, borderwidth=1, relief=GROOVE)
 
-            self.edit_button = Button(self.frame, text='Edit', padx=10, pady=5, font='comicsansms 10')
-            self.edit_button.bind('<Button-1>', partial(self.state.show, {'screen_name':'edit_screen', 'article_name':self.heading.replace('Read Article - ', '')}))
+        self.heading_label = Label(self.frame, text=self.heading.title(), font='comicsansms 22 bold', bg='white')
 
-            self.delete_button = Button(self.frame, text='Remove', padx=10, pady=5, font='comicsansms 10')
-            self.delete_button.bind('<Button-1>', self.__delete)
+        self.home_button = Button(self.frame, text='Home', padx=10, pady=5, font='comicsansms 10')
+        self.home_button.bind('<Button-1>', partial(self.state.show, {'screen_name': 'list_screen'}))
 
-            self.add_element(element=self.frame, pack_options={'fill':BOTH})
-            self.add_element(element=self.heading_label, pack_options={})
-            self.add_element(element=self.home_button, pack_options={'side':LEFT})
-            self.add_element(element=self.edit_button, pack_options={'side':LEFT, 'padx':10})
-            self.add_element(element=self.delete_button, pack_options={'side':LEFT})
-            self.add_element(element=self.text, pack_options={'expand':True, 'fill':BOTH})
+        self.edit_button = Button(self.frame, text='Edit', padx=10, pady=5, font='comicsansms 10')
+        self.edit_button.bind('<Button-1>', partial(self.state.show, {'screen_name':'edit_screen', 'article_name':self.heading.replace('Read Article - ', '')}))
 
-        except Exception as e:
-            show_message('Error', f"There is no article named '{options.get('article_name')}'")
-            self.state.show({'screen_name': 'create_screen', 'article_name':options.get('article_name')})
-            return -1
+        self.delete_button = Button(self.frame, text='Remove', padx=10, pady=5, font='comicsansms 10')
+        self.delete_button.bind('<Button-1>', self.__delete)
+
+        self.progress_label = Label(self.frame, text='', font='comicsansms 10', bg='white')
+
+        self.add_element(element=self.frame, pack_options={'fill':BOTH})
+        self.add_element(element=self.heading_label, pack_options={})
+        self.add_element(element=self.home_button, pack_options={'side':LEFT})
+        self.add_element(element=self.edit_button, pack_options={'side':LEFT, 'padx':10})
+        self.add_element(element=self.delete_button, pack_options={'side':LEFT})
+        self.add_element(element=self.progress_label, pack_options={'side':LEFT, 'padx':10})
+        self.add_element(element=self.backlinks_frame, pack_options={'side':BOTTOM, 'fill':X})
+        self.add_element(element=self.text, pack_options={'expand':True, 'fill':BOTH})
+        self.progressive.start()
+        self.page_key = Catalog.title_key(options.get('article_name'))
 
 class EditScreen(CreateScreen):
     '''This screen opens a editor to the user for creating new article.
@@ -441,9 +864,7 @@ class EditScreen(CreateScreen):
     def get_article_content(self, article_name):
         '''See base class.'''
         
-        file_src = os.path.join(self.state.base_dir, 'data', 'mds', article_name+'.md')
-        with open(file_src, 'r') as f:
-            return f.read()
+        return data_manager.get(article_name)
 
     def make_screen_elements(self, options=None):
         '''See base class.'''
@@ -466,22 +887,38 @@ class CreateViewScreen(CreateScreen, ViewScreen):
     Methods:
         change_event_handler: this method is called whenever there is any \
             change in the editor
+
+        hide: drops the pending preview update and hides the screen
     '''
 
+    # the preview is not kept and its links are not prefetched, see ViewScreen
+    retained = False
+    prefetch_links = False
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)       
 
     def change_event_handler(self, event=None):
         '''this method is called whenever there is any change in the editor.
         
-        Every time this method is called, the preview pane is rerendered with\
-            the newly parsed content. This happens synchronously.
+        Every time this method is called, the preview pane is updated with\
+            the newly parsed content. Only the blocks which changed since the\
+            last call are rendered again. They are parsed on a worker thread\
+            and inserted back on the Tk main loop, a result for an outdated\
+            text is discarded. The editor events do not call it directly, they go through the \
+            preview scheduler which calls it at most once per interval.
 
         '''
-        self.view_text.config(state='normal')
-        self.view_text.delete("1.0", "end")
-        Renderer(self.view_text, self.edit_text.get("1.0", "end-1c"), self.state).render()
-        self.view_text.config(state='disabled')
+        self.preview_worker.submit(self.edit_text.get("1.0", "end-1c"))
+
+    def hide(self):
+        '''Drops the pending preview update and hides the screen.'''
+
+        if getattr(self, 'preview_scheduler', None) is not None:
+            self.preview_scheduler.cancel()
+        if getattr(self, 'preview_worker', None) is not None:
+            self.preview_worker.cancel()
+        super().hide()
     
     def make_screen_elements(self, options=None):
         '''See Base Class.'''
@@ -495,6 +932,8 @@ class CreateViewScreen(CreateScreen, ViewScreen):
         self.edit_text = Text(self.edit_frame, font='comicsansms 15', padx=50, pady=20)
         self.text = self.edit_text
         self.view_text = Text(self.view_frame, font='comicsansms 15', padx=50, pady=20)
+        self.preview = PreviewRenderer(self.view_text, self.state)
+        self.preview_worker = PreviewWorker(self.preview)
         self.change_event_handler()
         self.view_text.config(state='disabled')
 
@@ -514,8 +953,9 @@ class CreateViewScreen(CreateScreen, ViewScreen):
         self.save_button = Button(self.frame, text='Save', padx=10, pady=5, font='comicsansms 10')
         self.save_button.bind('<Button-1>', self.save)
 
-        self.edit_text.bind("<KeyPress>", self.change_event_handler)
-        self.edit_text.bind("<KeyRelease>", self.change_event_handler)
+        self.preview_scheduler = PreviewScheduler(self.view_text, self.change_event_handler)
+        self.edit_text.bind("<KeyPress>", self.preview_scheduler.mark_dirty)
+        self.edit_text.bind("<KeyRelease>", self.preview_scheduler.mark_dirty)
 
         self.add_element(element=self.frame, pack_options={'fill':X})
         self.add_element(element=self.title_label, pack_options={})
@@ -538,8 +978,14 @@ class EditViewScreen(EditScreen, ViewScreen):
     Methods:
         change_event_handler: this method is called whenever there is any \
             change in the editor
+
+        hide: drops the pending preview update and hides the screen
     '''
 
+    # the preview is not kept and its links are not prefetched, see ViewScreen
+    retained = False
+    prefetch_links = False
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
@@ -547,10 +993,16 @@ class EditViewScreen(EditScreen, ViewScreen):
     def change_event_handler(self, event=None):
         '''See Base Class.'''
 
-        self.view_text.config(state='normal')
-        self.view_text.delete("1.0", "end")
-        Renderer(self.view_text, self.edit_text.get("1.0", "end-1c"), self.state).render()
-        self.view_text.config(state='disabled')
+        self.preview_worker.submit(self.edit_text.get("1.0", "end-1c"))
+
+    def hide(self):
+        '''Drops the pending preview update and hides the screen.'''
+
+        if getattr(self, 'preview_scheduler', None) is not None:
+            self.preview_scheduler.cancel()
+        if getattr(self, 'preview_worker', None) is not None:
+            self.preview_worker.cancel()
+        super().hide()
 
     
     def make_screen_elements(self, options=None):
@@ -565,12 +1017,10 @@ class EditViewScreen(EditScreen, ViewScreen):
         self.edit_text = Text(self.edit_frame, font='comicsansms 15', padx=50, pady=20)
         self.text = self.edit_text
         self.view_text = Text(self.view_frame, font='comicsansms 15', padx=50, pady=20)
-        self.view_text.config(state='normal')
-        self.view_text.delete("1.0", "end")
+        self.preview = PreviewRenderer(self.view_text, self.state)
+        self.preview_worker = PreviewWorker(self.preview)
         self.edit_text.insert(END, data_manager.get(options['article_name']))
-        Renderer(self.view_text, data_manager.get(options['article_name']), self.state).render()
-        self.view_text.config(state='disabled')
-        self.view_text.config(state='disabled')
+        self.change_event_handler()
 
         self.set_title(f'Edit Article - {options["article_name"]}')
         self.title_label = Label(self.frame, text='Enter Title: ', font='comicsansms 22 bold', bg='white')
@@ -590,8 +1040,9 @@ class EditViewScreen(EditScreen, ViewScreen):
         self.save_button = Button(self.frame, text='Save', padx=10, pady=5, font='comicsansms 10')
         self.save_button.bind('<Button-1>', self.save)
 
-        self.edit_text.bind("<KeyPress>", self.change_event_handler)
-        self.edit_text.bind("<KeyRelease>", self.change_event_handler)
+        self.preview_scheduler = PreviewScheduler(self.view_text, self.change_event_handler)
+        self.edit_text.bind("<KeyPress>", self.preview_scheduler.mark_dirty)
+        self.edit_text.bind("<KeyRelease>", self.preview_scheduler.mark_dirty)
 
         self.add_element(element=self.frame, pack_options={'fill':X})
         self.add_element(element=self.title_label, pack_options={})
@@ -0,0 +1,487 @@
+'''This module keeps a full text index of the articles for searching.
+
+The index maps every term to the articles it appears in, together with the \
+    positions of the term in the article (term -> {article: positions}). It \
+    is kept up to date while the app runs, data_manager tells it about every\
+    saved or removed article, and it is stored in data/cache so that it does\
+    not have to be built again on the next start. Articles changed behind \
+    the back of the app are found by comparing the version and size \
+    recorded for them with the storage and are indexed again.
+
+Results are ranked with BM25, with a bonus for query terms found in the \
+    title. All terms of a query have to be found in an article, and a part \
+    of the query in double quotes has to be found as a phrase.
+
+Loading and refreshing the index can take long on a big wiki, so the app \
+    does it on a background thread (see start_loading) and the search screen\
+    asks for the index with get_index(wait=False), which returns None until \
+    it is ready.
+
+Building the index from scratch runs on all cores:
+    python search_index.py rebuild [--processes N]
+    python search_index.py search "some query"
+
+'''
+
+import argparse
+import atexit
+import heapq
+import math
+import multiprocessing
+import os
+import pickle
+import re
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import data_manager
+
+INDEX_PATH = os.path.join(data_manager.BASE_DIR, 'data', 'cache', 'search_index.pickle')
+
+# has to be increased whenever the layout of the stored index changes
+INDEX_VERSION = 2
+
+# when more articles than this have to be indexed, a process pool is used
+PARALLEL_THRESHOLD = 200
+
+# number of articles read from the storage before they go to the pool
+READ_BATCH = 1024
+
+# the pool is started from a background thread of the app, and forking a
+# process with threads (and a live Tk connection) is unsafe, so the workers
+# start as new interpreters
+POOL_START_METHOD = 'spawn'
+
+TERM_PATTERN = re.compile(r'[^\W_]+')
+
+# BM25 parameters and the bonus of a query term found in the title
+K1 = 1.2
+B = 0.75
+TITLE_BOOST = 2.0
+
+def tokenize(text):
+    '''Returns the case folded terms of a text, in order.'''
+
+    return TERM_PATTERN.findall(text.casefold())
+
+def term_positions(text):
+    '''Returns the positions of every term of a text.
+
+    Arguments:
+        text (str): the text to be indexed
+
+    Returns:
+        tuple: (number of terms, {term: array of positions})
+    '''
+
+    positions = {}
+    terms = tokenize(text)
+    for position, term in enumerate(terms):
+        term_array = positions.get(term)
+        if term_array is None:
+            positions[term] = term_array = array('I')
+        term_array.append(position)
+    return len(terms), positions
+
+def index_article(article):
+    '''Tokenizes an article, used by the process pool.
+
+    Arguments:
+        article (tuple): (title, version, size, content)
+
+    Returns:
+        tuple: (title, version, size, number of terms, positions)
+    '''
+
+    title, version, size, content = article
+    length, positions = term_positions(content)
+    return title, version, size, length, positions
+
+def read_articles(storage, stale):
+    '''Reads the stale articles from the storage, skipping unreadable ones.
+
+    Arguments:
+        storage: a storage.Storage
+        stale: a list of (title, version, size)
+
+    Returns:
+        generator: (title, version, size, content) for every article
+    '''
+
+    for title, version, size in stale:
+        try:
+            content = storage.get(title)
+        except (OSError, UnicodeDecodeError):
+            continue
+        yield title, version, size, content
+
+class SearchIndex():
+    '''An inverted index of the articles with positions.
+
+    Attributes:
+        postings: a dictionary of type {term: {title: array of positions}}
+
+        documents: a dictionary of type {title: (version, size, number of \
+            terms, tuple of distinct terms, frozenset of title terms)}
+
+        total_length: the number of terms of all articles
+
+        dirty: True if the index changed since it was loaded or saved
+
+    Methods:
+        add: indexes an article, replacing what was indexed for it before
+
+        remove: removes an article from the index
+
+        search: returns the ranked titles matching a query
+
+        refresh: indexes the articles which changed according to a storage
+
+        save: writes the index to a file
+
+        load: reads an index from a file
+    '''
+
+    def __init__(self):
+        self.postings = {}
+        self.documents = {}
+        self.total_length = 0
+        self.dirty = False
+
+    def __len__(self):
+        return len(self.documents)
+
+    def add(self, title, content, version=None, size=None):
+        '''Indexes an article, replacing what was indexed for it before.
+
+        Arguments:
+            title (str): article name
+            content (str): article content
+            version, size: see Storage.version, used by refresh
+
+        Returns:
+            None
+        '''
+
+        length, positions = term_positions(content)
+        self.add_positions(title, version, size, length, positions)
+
+    def add_positions(self, title, version, size, length, positions):
+        '''Same as add, for an article already tokenized by term_positions.'''
+
+        self.remove(title)
+        for term, term_array in positions.items():
+            postings = self.postings.get(term)
+            if postings is None:
+                self.postings[term] = postings = {}
+            postings[title] = term_array
+        self.documents[title] = (version, size, length, tuple(positions), frozenset(tokenize(title)))
+        self.total_length += length
+        self.dirty = True
+
+    def remove(self, title):
+        '''Removes an article from the index if it is there.'''
+
+        document = self.documents.pop(title, None)
+        if document is None:
+            return
+        for term in document[3]:
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(title, None)
+                if not postings:
+                    del self.postings[term]
+        self.total_length -= document[2]
+        self.dirty = True
+
+    @staticmethod
+    def parse_query(query):
+        '''Splits a query into its terms and its quoted phrases.
+
+        Returns:
+            tuple: (list of terms, list of phrases as lists of terms)
+        '''
+
+        phrases = [tokenize(phrase) for phrase in re.findall(r'"([^"]*)"', query)]
+        phrases = [phrase for phrase in phrases if len(phrase)>1]
+        terms = tokenize(query.replace('"', ' '))
+        return list(dict.fromkeys(terms)), phrases
+
+    def __has_phrase(self, title, phrase):
+        starts = set(self.postings[phrase[0]][title])
+        for offset, term in enumerate(phrase[1:], start=1):
+            starts &= {position - offset for position in self.postings[term][title]}
+            if not starts:
+                return False
+        return True
+
+    def search(self, query, limit=50):
+        '''Returns the titles of the articles matching a query, best first.
+
+        Arguments:
+            query (str): words, "quoted phrases" have to match as a phrase
+            limit (int): maximum number of results
+
+        Returns:
+            list: list of (title, score) tuples
+        '''
+
+        terms, phrases = self.parse_query(query)
+        if not terms or any(term not in self.postings for term in terms):
+            return []
+
+        # intersect starting from the rarest term
+        terms_by_df = sorted(terms, key=lambda term: len(self.postings[term]))
+        candidates = set(self.postings[terms_by_df[0]])
+        for term in terms_by_df[1:]:
+            candidates.intersection_update(self.postings[term])
+            if not candidates:
+                return []
+        for phrase in phrases:
+            candidates = {title for title in candidates if self.__has_phrase(title, phrase)}
+
+        count = len(self.documents)
+        average_length = self.total_length / count if count else 1
+        documents = self.documents
+        scores = {}
+        for term in terms:
+            postings = self.postings[term]
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for title in candidates:
+                frequency = len(postings[title])
+                document = documents[title]
+                score = idf * frequency * (K1 + 1) / (frequency + K1 * (1 - B + B * document[2] / average_length))
+                if term in document[4]:
+                    score += idf * TITLE_BOOST
+                scores[title] = scores.get(title, 0) + score
+        # only the best limit results are ordered, not every candidate
+        return heapq.nsmallest(limit, scores.items(), key=lambda item: (-item[1], item[0].casefold()))
+
+    def refresh(self, storage, processes=None, versions=None):
+        '''Indexes the articles which are new or changed according to storage.
+
+        Articles which are not in the storage any more are removed. When many\
+            articles have to be indexed they are read from the storage in \
+            batches and tokenized on a process pool.
+
+        Arguments:
+            storage: a storage.Storage
+            processes: size of the process pool, default is the cpu count
+            versions: the result of storage.versions(), taken here if None
+
+        Returns:
+            int: the number of articles indexed again
+        '''
+
+        if versions is None:
+            versions = storage.versions()
+        titles = set()
+        stale = []
+        for file_name, (version, size) in versions.items():
+            title = file_name[:-3]
+            titles.add(title)
+            document = self.documents.get(title)
+            if document is None or document[0]!=version or document[1]!=size:
+                stale.append((title, version, size))
+        for title in [title for title in self.documents if title not in titles]:
+            self.remove(title)
+
+        if len(stale)>PARALLEL_THRESHOLD:
+            context = multiprocessing.get_context(POOL_START_METHOD)
+            with ProcessPoolExecutor(max_workers=processes, mp_context=context) as executor:
+                for start in range(0, len(stale), READ_BATCH):
+                    articles = list(read_articles(storage, stale[start:start+READ_BATCH]))
+                    for result in executor.map(index_article, articles, chunksize=64):
+                        self.add_positions(*result)
+        else:
+            for article in read_articles(storage, stale):
+                self.add_positions(*index_article(article))
+        return len(stale)
+
+    def save(self, path=INDEX_PATH):
+        '''Writes the index to a file, replacing it atomically.'''
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path+'.tmp', 'wb') as f:
+            pickle.dump({
+                'version': INDEX_VERSION,
+                'postings': self.postings,
+                'documents': self.documents,
+                'total_length': self.total_length,
+            }, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path+'.tmp', path)
+        self.dirty = False
+
+    @classmethod
+    def load(cls, path=INDEX_PATH):
+        '''Reads an index written by save.
+
+        A file which can not be read or is outdated is deleted, the index is \
+            then built again by refresh.
+
+        Returns:
+            SearchIndex: the index, empty if the file is missing or outdated
+        '''
+
+        index = cls()
+        try:
+            with open(path, 'rb') as f:
+                data = pickle.load(f)
+            if data['version']==INDEX_VERSION:
+                index.postings = data['postings']
+                index.documents = data['documents']
+                index.total_length = data['total_length']
+                return index
+        except FileNotFoundError:
+            return index
+        except Exception:
+            # a damaged or foreign pickle fails in many ways
+            pass
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return cls()
+
+_index = None
+
+# the future of load while the index is loading, and the changes of the
+# articles made meanwhile, applied once it is loaded
+_loading = None
+_pending = []
+
+def load(versions):
+    '''Loads the stored index and refreshes it, runs on a background thread.
+
+    Arguments:
+        versions: the result of data_manager.versions()
+
+    Returns:
+        SearchIndex: the index
+    '''
+
+    index = SearchIndex.load()
+    index.refresh(data_manager.storage, versions=versions)
+    return index
+
+def start_loading():
+    '''Starts loading the index of the wiki on a background thread.
+
+    The versions of the articles are taken on the calling thread, the \
+        worker only reads the articles (and starts the process pool when \
+        many changed). Nothing is done if the index is loaded or loading \
+        already.
+    '''
+
+    global _loading
+    if _index is not None or _loading is not None:
+        return
+    _pending.clear()
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='search_index')
+    _loading = executor.submit(load, data_manager.versions())
+    executor.shutdown(wait=False)
+
+def get_index(wait=True):
+    '''Returns the index of the wiki, loading it on first use.
+
+    Arguments:
+        wait (bool): if False, None is returned while the index is loading \
+            instead of waiting for it
+
+    Returns:
+        SearchIndex: the index, or None
+
+    Raises:
+        Exception: what the loading raised, it is tried again on the next \
+            call
+    '''
+
+    global _index, _loading
+    if _index is None:
+        start_loading()
+        if not wait and not _loading.done():
+            return None
+        loading, _loading = _loading, None
+        index = loading.result()
+        for change in _pending:
+            apply_change(index, *change)
+        _pending.clear()
+        _index = index
+        atexit.register(save)
+    return _index
+
+def save():
+    '''Writes the index of the wiki if it changed.'''
+
+    if _index is not None and _index.dirty:
+        try:
+            _index.save()
+        except OSError:
+            pass
+
+def search(query, limit=50):
+    '''Searches the wiki, see SearchIndex.search.'''
+
+    return get_index().search(query, limit)
+
+def apply_change(index, action, file_name, file_content):
+    '''Applies a change of an article to index, see on_article_change.'''
+
+    if action=='delete':
+        index.remove(file_name)
+    else:
+        index.add(file_name, file_content, *(data_manager.version(file_name) or (None, None)))
+
+def on_article_change(action, file_name, file_content):
+    '''Keeps the index up to date, subscribed to data_manager.'''
+
+    if _index is not None:
+        apply_change(_index, action, file_name, file_content)
+    elif _loading is not None:
+        # the worker may have read the article before the change
+        _pending.append((action, file_name, file_content))
+    # not loaded at all, refresh will notice the change by its version
+
+data_manager.subscribe(on_article_change)
+
+def rebuild(processes=None):
+    '''Builds the index of the wiki from scratch and saves it.
+
+    Returns:
+        SearchIndex: the new index
+    '''
+
+    global _index
+    index = SearchIndex()
+    index.refresh(data_manager.storage, processes=processes)
+    index.save()
+    _index = index
+    return index
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Manages the full text index of the articles.')
+    subparsers = arg_parser.add_subparsers(dest='command', required=True)
+    rebuild_parser = subparsers.add_parser('rebuild', help='build the index from scratch')
+    rebuild_parser.add_argument('--processes', type=int, default=None, help='size of the process pool')
+    search_parser = subparsers.add_parser('search', help='search the index')
+    search_parser.add_argument('query')
+    search_parser.add_argument('--limit', type=int, default=20)
+    args = arg_parser.parse_args()
+
+    if args.command=='rebuild':
+        started = time.perf_counter()
+        index = rebuild(args.processes)
+        print(f'{len(index)} articles, {len(index.postings)} terms indexed in {time.perf_counter()-started:.2f} s')
+    else:
+        index = get_index()
+        started = time.perf_counter()
+        results = index.search(args.query, args.limit)
+        elapsed = (time.perf_counter() - started) * 1000
+        for title, score in results:
+            print(f'{score:8.3f}  {title}')
+        print(f'{len(results)} results in {elapsed:.2f} ms')
+        save()
+
+if __name__=='__main__':
+    main()
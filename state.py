@@ -7,41 +7,117 @@ All of the screen has to be registered to the State class object.
 
 from tkinter import * 
 
+from instrumentation import span
+from prefetch import Prefetcher
+
 class State():
     '''All of the screen has to registered to the state class object.
     
     All of the showing and hiding of the screens will be happened through this\
         state object.
 
+    Every shown screen is recorded in the history, so the user can go back \
+        and forward like in a browser. A screen shown while another one is \
+        being shown (like the create screen shown instead of a missing \
+        article) replaces the entry of the screen it was shown from.
+
+    A screen can be registered with a function making it instead of the \
+        screen itself. It is then made the first time it is shown, so the \
+        screens which are never opened cost nothing at startup.
+
+    When a screen with prefetch_links set shows an article, the articles it \
+        links to are parsed in the background by the prefetcher, see the \
+        prefetch module.
+
     Attributes:
         base_dir: An path object indicating the root directory of the project.
 
-        screens: List of screens
+        screens: A dictionary of type {name: screen}, see add_screen
+
+        current: The name of the shown screen or None
+
+        history: List of the options of the shown screens, oldest first
+
+        position: Index of the shown screen in the history
+
+        prefetcher: A Prefetcher object
     
     Methods:
         add_screen: Adds screen to the screen list
 
+        get_screen: Returns a screen, making it if needed.
+
         show: Calls the show method of a screen.
 
+        back: Shows the previous screen of the history.
+
+        forward: Shows the next screen of the history.
+
     '''
 
+    # oldest entries of the history are forgotten beyond this
+    max_history = 100
+
     def __init__(self, base_dir):
         self.base_dir = base_dir
-        self.screens = [] # items: {'name': str (unique), 'screen': ptr2screen_obj}
+        self.screens = {} # items: name (unique) -> {'name': str, 'screen': ptr2screen_obj}
+        self.current = None
+        self.history = [] # items: options passed to show
+        self.position = -1
+        self.showing = 0
+        self.prefetcher = Prefetcher()
 
     def add_screen(self, screen):
         '''Adds screen to the screen list.
         
         Arguments:
-            screen: A screen object
+            screen: A dictionary of type {'name': str, 'screen': screen object}\
+                or {'name': str, 'make': function returning the screen object}
         
         Returns:
             None
 
         '''
-        self.screens.append(screen)
+        self.screens[screen['name']] = screen
 
-    def show(self, options=None, event=None):
+    def get_screen(self, name):
+        '''Returns the screen registered as name, making it if needed.
+
+        Arguments:
+            name: The name the screen was registered with
+
+        Returns:
+            The screen object or None if there is no such screen
+        '''
+
+        screen = self.screens.get(name)
+        if screen is None:
+            return None
+        if screen.get('screen') is None:
+            with span('state.make.'+name):
+                screen['screen'] = screen['make']()
+        return screen['screen']
+
+    def record(self, options):
+        '''Adds the options of a shown screen to the history.
+
+        The entries after the current position are dropped, like the forward\
+            history of a browser when a new page is opened.
+        '''
+
+        if self.showing:
+            # shown by the screen being shown, it takes the place of that one
+            self.history[self.position] = options
+            return
+        del self.history[self.position+1:]
+        if self.history and self.history[-1]==options:
+            return
+        self.history.append(options)
+        if len(self.history)>self.max_history:
+            del self.history[0]
+        self.position = len(self.history)-1
+
+    def show(self, options=None, event=None, record=True):
         '''Call the show method a the specified screen.
 
         Arguments:
@@ -49,14 +125,42 @@ class State():
                 {'screen_name': string, 'file_name':a string specifying article}
 
             event: An event, automatically passed by the invoked function
+
+            record: False if the screen is shown from the history
         '''
 
-        screen_to_show = None 
-        for screen in self.screens:
-            if screen['name']==options.get('screen_name'):
-                screen_to_show = screen 
-                screen['screen'].hide()
-            else:
-                screen['screen'].hide()
-        if screen_to_show is not None:
-            screen_to_show.get('screen').show(options)
\ No newline at end of file
+        with span('state.show'):
+            screen_to_show = self.screens.get(options.get('screen_name'))
+            if screen_to_show is not None:
+                self.get_screen(screen_to_show['name'])
+            if record:
+                self.record(dict(options))
+            with span('state.hide'):
+                if self.current is not None:
+                    self.screens[self.current]['screen'].hide()
+            self.current = None
+            if screen_to_show is not None:
+                self.current = screen_to_show['name']
+                self.showing += 1
+                try:
+                    with span('show.'+screen_to_show['name']):
+                        screen_to_show.get('screen').show(options)
+                finally:
+                    self.showing -= 1
+                screen = screen_to_show['screen']
+                if getattr(screen, 'prefetch_links', False) and self.current==screen_to_show['name'] and not self.showing:
+                    self.prefetcher.prefetch(options.get('article_name', ''), skip=getattr(screen, 'has_page', None))
+
+    def back(self, event=None):
+        '''Shows the previous screen of the history, if there is one.'''
+
+        if self.position>0:
+            self.position -= 1
+            self.show(self.history[self.position], record=False)
+
+    def forward(self, event=None):
+        '''Shows the next screen of the history, if there is one.'''
+
+        if self.position<len(self.history)-1:
+            self.position += 1
+            self.show(self.history[self.position], record=False)
@@ -0,0 +1,592 @@
+'''This module contains the storage backends of the articles.
+
+data_manager does not touch the disk itself, it calls a Storage. Two \
+    backends exist:
+    DirectoryStorage: one .md file per article in data/mds, the old \
+        versions in the revision store of data/revisions (see the revisions\
+        module). This is the layout the app always had, and the one it runs\
+        on.
+    SqliteStorage: a single SQLite database in WAL mode, the old versions \
+        in a table of their own and an FTS5 table for full text search.
+
+data_manager picks the backend from the OWNWIKI_STORAGE environment \
+    variable, 'directory' (the default) or 'sqlite'.
+
+The articles of one backend are copied to another with:
+    python storage.py migrate [--source DIR] [--db PATH]
+    python storage.py migrate --reverse [--source DIR] [--db PATH]
+
+'''
+
+import argparse
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+
+from catalog import Catalog
+from revisions import RevisionStore
+
+# the encoding of the article files, a byte which is not valid in it (like in
+# files written on Windows in cp1252) is read as U+FFFD
+ENCODING = 'utf-8'
+
+class Storage(ABC):
+    '''The interface of a place where the articles are kept.
+
+    Articles are identified by their name, the case of the name is ignored \
+        when looking them up. Lists of articles are file names like \
+        'Title.md', sorted by case folded title, as the screens expect.
+
+    Methods:
+        create_and_save: saves an article, replacing one with the same name
+
+        get: returns the content of an article
+
+        get_articles_list: returns the file names of all articles
+
+        exists: checks if an article exists
+
+        contains: checks if an article exists, for many lookups in a row
+
+        stat: returns the stored name, version and size of an article
+
+        version: returns the version and size of an article
+
+        versions: returns the version and size of every article
+
+        revalidate: notices the changes made by something else
+
+        delete: removes an article, keeping a copy of it
+
+        edit: replaces an article, keeping a copy of the old version
+
+        save_many: saves many articles at once
+
+        close: releases the resources of the backend
+
+        load_snapshot, save_snapshot, scan, reconcile: start from the list \
+            of articles saved at the previous exit, see DirectoryStorage
+
+    A version is an integer which changes whenever the article is saved, \
+        like the mtime of a file. Together with the size it tells the \
+        caches built from an article (render cache, search index, link \
+        graph) whether they are still valid.
+    '''
+
+    @abstractmethod
+    def create_and_save(self, file_name, file_content):
+        '''Saves an article, replacing one with the same name.'''
+
+    @abstractmethod
+    def get(self, file_name):
+        '''Returns the content of an article.
+
+        Raises:
+            OSError: if there is no such article
+        '''
+
+    @abstractmethod
+    def get_articles_list(self):
+        '''Returns the file names of all articles, sorted by title.'''
+
+    @abstractmethod
+    def exists(self, file_name):
+        '''Checks if an article exists, ignoring the case of the name.'''
+
+    def contains(self, file_name):
+        '''Checks if an article exists, ignoring the case of the name.
+
+        Unlike exists this may answer from what the backend read last, so \
+            it is cheap enough to be called for every link of a page. Call \
+            revalidate first to notice the changes made by something else.
+        '''
+
+        return self.exists(file_name)
+
+    @abstractmethod
+    def stat(self, file_name):
+        '''Returns the stored name, version and size of an article.
+
+        Returns:
+            tuple: (file name like 'Title.md' in the case it is stored with,\
+                version, size in bytes) or None if there is no such article
+        '''
+
+    def version(self, file_name):
+        '''Returns the version and size of an article, see stat.
+
+        Returns:
+            tuple: (version, size) or None if there is no such article
+        '''
+
+        stat = self.stat(file_name)
+        return None if stat is None else stat[1:]
+
+    @abstractmethod
+    def versions(self):
+        '''Returns the version and size of every article.
+
+        Returns:
+            dict: a dictionary of type {file_name: (version, size)}
+        '''
+
+    def revalidate(self):
+        '''Notices the changes made by something else since the last call.'''
+
+    @abstractmethod
+    def delete(self, file_name):
+        '''Removes an article, keeping a copy of it.'''
+
+    def edit(self, file_name, file_content):
+        '''Replaces an article, keeping a copy of the old version.'''
+
+        self.delete(file_name)
+        self.create_and_save(file_name, file_content)
+
+    def save_many(self, articles):
+        '''Saves many articles, an iterable of (file_name, file_content).
+
+        Returns:
+            int: the number of articles saved
+        '''
+
+        count = 0
+        for file_name, file_content in articles:
+            self.create_and_save(file_name, file_content)
+            count += 1
+        return count
+
+    def close(self):
+        '''Releases the resources of the backend.'''
+
+    def load_snapshot(self, path):
+        '''Loads the list of articles saved by save_snapshot.
+
+        Returns:
+            bool: True if it was loaded, then reconcile has to follow
+        '''
+
+        return False
+
+    def save_snapshot(self, path):
+        '''Saves the list of articles for the next start.'''
+
+    def scan(self):
+        '''Reads what reconcile needs, safe to run outside the Tk main thread.'''
+
+        return None
+
+    def reconcile(self, scanned=None):
+        '''Replaces the list loaded by load_snapshot by the result of scan.
+
+        Returns:
+            bool: True if the list of articles changed
+        '''
+
+        return False
+
+class DirectoryStorage(Storage):
+    '''One .md file per article in a directory.
+
+    The files are written in ENCODING and read with errors='replace', so \
+        an article in another encoding is shown instead of failing.
+
+    The list of articles is kept by a Catalog, see the catalog module. Every\
+        saved version goes to a RevisionStore. Before an article is changed\
+        the version on disk is recorded too, in case it was written by \
+        something else, an unchanged version costs nothing.
+
+    Attributes:
+        directory: the directory holding the .md files
+
+        revisions: the RevisionStore of the old versions
+
+        catalog: the Catalog of directory
+    '''
+
+    def __init__(self, directory, revisions):
+        self.directory = directory
+        self.revisions = revisions
+        self.catalog = Catalog(directory)
+
+    def path(self, file_name):
+        '''Returns the path of the file holding an article.'''
+
+        return os.path.join(self.directory, file_name+'.md')
+
+    def __write(self, file_name, file_content):
+        # written next to its place and renamed, an interrupted save never
+        # leaves half of an article
+        path = self.path(file_name)
+        with open(path+'.tmp', 'w', encoding=ENCODING) as f:
+            f.write(file_content)
+        os.replace(path+'.tmp', path)
+
+    def __record_current(self, file_name):
+        try:
+            with open(self.path(file_name), 'r', encoding=ENCODING, errors='replace') as f:
+                content = f.read()
+        except FileNotFoundError:
+            return
+        self.revisions.record(file_name, content)
+
+    def create_and_save(self, file_name, file_content):
+        self.__record_current(file_name)
+        self.__write(file_name, file_content)
+        if self.catalog.directory_mtime_ns is not None:
+            self.catalog.add(file_name+'.md')
+        self.revisions.record(file_name, file_content)
+
+    def save_many(self, articles):
+        # the catalog is updated once for the whole batch
+        file_names = []
+        for file_name, file_content in articles:
+            self.__record_current(file_name)
+            self.__write(file_name, file_content)
+            self.revisions.record(file_name, file_content)
+            file_names.append(file_name+'.md')
+        if self.catalog.directory_mtime_ns is not None:
+            self.catalog.add_many(file_names)
+        return len(file_names)
+
+    def get(self, file_name):
+        with open(self.path(file_name), 'r', encoding=ENCODING, errors='replace') as f:
+            return f.read()
+
+    def get_articles_list(self):
+        self.catalog.revalidate()
+        return self.catalog.file_names()
+
+    def exists(self, file_name):
+        self.catalog.revalidate()
+        return self.catalog.contains(file_name)
+
+    def contains(self, file_name):
+        if self.catalog.directory_mtime_ns is None:
+            self.catalog.load()
+        return self.catalog.contains(file_name)
+
+    def stat(self, file_name):
+        if self.catalog.directory_mtime_ns is None:
+            self.catalog.load()
+        entry = self.catalog.get(file_name)
+        stored_name = entry[0] if entry is not None else file_name+'.md'
+        try:
+            stat = os.stat(os.path.join(self.directory, stored_name))
+        except OSError:
+            return None
+        return stored_name, stat.st_mtime_ns, stat.st_size
+
+    def versions(self):
+        self.catalog.revalidate()
+        return dict(self.catalog.files)
+
+    def revalidate(self):
+        self.catalog.revalidate()
+
+    def delete(self, file_name):
+        self.__record_current(file_name)
+        os.remove(self.path(file_name))
+        self.revisions.record_delete(file_name)
+        if self.catalog.directory_mtime_ns is not None:
+            self.catalog.remove(file_name+'.md')
+
+    def edit(self, file_name, file_content):
+        if not os.path.exists(self.path(file_name)):
+            raise FileNotFoundError(f'no article named {file_name!r}')
+        self.create_and_save(file_name, file_content)
+
+    def load_snapshot(self, path):
+        return self.catalog.load_snapshot(path)
+
+    def save_snapshot(self, path):
+        # a catalog which was never scanned or not reconciled yet is not saved
+        if self.catalog.directory_mtime_ns is None or self.catalog.snapshot:
+            return
+        self.catalog.save_snapshot(path)
+
+    def scan(self):
+        return self.catalog.scan()
+
+    def reconcile(self, scanned=None):
+        return self.catalog.reconcile(scanned)
+
+class SqliteStorage(Storage):
+    '''All articles in one SQLite database.
+
+    The database runs in WAL mode, so reading never waits for a save. \
+        Titles are unique ignoring the case: every article has a title_key \
+        column holding Catalog.title_key(title), which is what lookups \
+        compare, so the case is ignored the same way as by the catalog and \
+        not only for ASCII letters like COLLATE NOCASE would. When the \
+        SQLite library has FTS5, the articles_fts table is kept in sync by \
+        triggers and search uses it.
+
+    The connection is shared by the Tk thread and the background threads \
+        (catalog scan, search index, link graph, prefetch). Every method \
+        holds lock while it uses it, so a reader never runs between the \
+        statements of an edit or a delete and sees the article missing.
+
+    Attributes:
+        path: path of the database file
+
+        connection: the sqlite3 connection
+
+        lock: the lock held while the connection is used
+
+        has_fts: True if the full text table exists
+    '''
+
+    ARTICLES_TABLE = '''
+        CREATE TABLE IF NOT EXISTS articles (
+            id INTEGER PRIMARY KEY,
+            title TEXT NOT NULL,
+            title_key TEXT NOT NULL UNIQUE,
+            content TEXT NOT NULL,
+            modified REAL NOT NULL
+        )
+    '''
+
+    SCHEMA = ARTICLES_TABLE + ''';
+        CREATE TABLE IF NOT EXISTS removed_articles (
+            id INTEGER PRIMARY KEY,
+            title TEXT NOT NULL,
+            content TEXT NOT NULL,
+            removed REAL NOT NULL
+        );
+    '''
+
+    FTS_SCHEMA = '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5(
+            title, content, content='articles', content_rowid='id'
+        );
+        CREATE TRIGGER IF NOT EXISTS articles_ai AFTER INSERT ON articles BEGIN
+            INSERT INTO articles_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+        END;
+        CREATE TRIGGER IF NOT EXISTS articles_ad AFTER DELETE ON articles BEGIN
+            INSERT INTO articles_fts(articles_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+        END;
+        CREATE TRIGGER IF NOT EXISTS articles_au AFTER UPDATE ON articles BEGIN
+            INSERT INTO articles_fts(articles_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+            INSERT INTO articles_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+        END;
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.RLock()
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        columns = [row[1] for row in self.connection.execute('PRAGMA table_info(articles)')]
+        migrated = bool(columns) and 'title_key' not in columns
+        if migrated:
+            self.__add_title_keys()
+        with self.connection:
+            self.connection.executescript(self.SCHEMA)
+            try:
+                self.connection.executescript(self.FTS_SCHEMA)
+                if migrated:
+                    self.connection.execute("INSERT INTO articles_fts(articles_fts) VALUES ('rebuild')")
+                self.has_fts = True
+            except sqlite3.OperationalError:
+                # the SQLite library was built without FTS5
+                self.has_fts = False
+
+    def __add_title_keys(self):
+        # databases made before the title_key column had the titles unique
+        # with COLLATE NOCASE, the table is made again with the keys; of
+        # titles which are the same once case folded the newest is kept and
+        # the others are moved to removed_articles
+        self.connection.create_function('title_key', 1, Catalog.title_key, deterministic=True)
+        with self.connection:
+            # the statements below do not start a transaction by themselves
+            self.connection.execute('BEGIN')
+            for trigger in ('articles_ai', 'articles_ad', 'articles_au'):
+                self.connection.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+            self.connection.execute('ALTER TABLE articles RENAME TO articles_nocase')
+            self.connection.execute(self.ARTICLES_TABLE)
+            self.connection.execute(
+                'INSERT OR IGNORE INTO articles (id, title, title_key, content, modified) '
+                'SELECT id, title, title_key(title), content, modified FROM articles_nocase ORDER BY modified DESC')
+            self.connection.execute(
+                'INSERT INTO removed_articles (title, content, removed) '
+                'SELECT title, content, ? FROM articles_nocase WHERE id NOT IN (SELECT id FROM articles)', (time.time(),))
+            self.connection.execute('DROP TABLE articles_nocase')
+            self.connection.execute('DROP TABLE IF EXISTS articles_fts')
+
+    def __upsert(self, file_name, file_content):
+        self.connection.execute(
+            'INSERT INTO articles (title, title_key, content, modified) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT(title_key) DO UPDATE SET title=excluded.title, content=excluded.content, modified=excluded.modified',
+            (file_name, Catalog.title_key(file_name), file_content, time.time()))
+
+    def __remove(self, file_name):
+        cursor = self.connection.execute(
+            'INSERT INTO removed_articles (title, content, removed) '
+            'SELECT title, content, ? FROM articles WHERE title_key=?', (time.time(), Catalog.title_key(file_name)))
+        if cursor.rowcount==0:
+            raise FileNotFoundError(f'no article named {file_name!r}')
+        self.connection.execute('DELETE FROM articles WHERE title_key=?', (Catalog.title_key(file_name),))
+
+    def create_and_save(self, file_name, file_content):
+        with self.lock, self.connection:
+            self.__upsert(file_name, file_content)
+
+    def get(self, file_name):
+        with self.lock:
+            row = self.connection.execute('SELECT content FROM articles WHERE title_key=?', (Catalog.title_key(file_name),)).fetchone()
+        if row is None:
+            raise FileNotFoundError(f'no article named {file_name!r}')
+        return row[0]
+
+    def get_articles_list(self):
+        with self.lock:
+            titles = [row[0] for row in self.connection.execute('SELECT title FROM articles')]
+        return sorted((title+'.md' for title in titles), key=lambda file_name: (Catalog.title_key(file_name), file_name))
+
+    def exists(self, file_name):
+        with self.lock:
+            return self.connection.execute('SELECT 1 FROM articles WHERE title_key=?', (Catalog.title_key(file_name),)).fetchone() is not None
+
+    @staticmethod
+    def __version(title, modified, size):
+        # the version is the time of the last save in nanoseconds
+        return title+'.md', int(modified * 1e9), size
+
+    def stat(self, file_name):
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT title, modified, length(CAST(content AS BLOB)) FROM articles WHERE title_key=?', (Catalog.title_key(file_name),)).fetchone()
+        return None if row is None else self.__version(*row)
+
+    def versions(self):
+        with self.lock:
+            rows = self.connection.execute('SELECT title, modified, length(CAST(content AS BLOB)) FROM articles').fetchall()
+        return {file_name: (version, size) for file_name, version, size in (self.__version(*row) for row in rows)}
+
+    def delete(self, file_name):
+        with self.lock, self.connection:
+            self.__remove(file_name)
+
+    def edit(self, file_name, file_content):
+        with self.lock, self.connection:
+            self.__remove(file_name)
+            self.__upsert(file_name, file_content)
+
+    def save_many(self, articles):
+        count = 0
+        with self.lock, self.connection:
+            for file_name, file_content in articles:
+                self.__upsert(file_name, file_content)
+                count += 1
+        return count
+
+    def search(self, query, limit=50):
+        '''Searches the articles with FTS5, best first.
+
+        Without FTS5, or when the query is not valid FTS5 syntax (like \
+            'a-b'), every word of the query has to be found in the title or\
+            the content with LIKE, see search_like.
+
+        Arguments:
+            query (str): an FTS5 query, plain words match all of them
+
+        Returns:
+            list: list of (title, score) tuples, a higher score is better
+        '''
+
+        if self.has_fts:
+            try:
+                with self.lock:
+                    rows = self.connection.execute(
+                        'SELECT title, bm25(articles_fts) FROM articles_fts WHERE articles_fts MATCH ? ORDER BY bm25(articles_fts) LIMIT ?',
+                        (query, limit)).fetchall()
+            except sqlite3.OperationalError:
+                pass
+            else:
+                return [(title, -score) for title, score in rows]
+        return self.search_like(query, limit)
+
+    def search_like(self, query, limit=50):
+        '''Searches the articles with LIKE, scanning all of them.
+
+        Every word of the query has to be found in the title or the content,\
+            ignoring the case of ASCII letters. The score is the number of \
+            words found in the title.
+
+        Returns:
+            list: list of (title, score) tuples, a higher score is better
+        '''
+
+        words = re.findall(r'[^\W_]+', query)
+        if not words:
+            return []
+        # the words hold letters and digits only, nothing LIKE has to escape
+        patterns = ['%' + word + '%' for word in words]
+        matches = ' AND '.join('(title LIKE ? OR content LIKE ?)' for word in words)
+        score = ' + '.join('(title LIKE ?)' for word in words)
+        with self.lock:
+            rows = self.connection.execute(
+                f'SELECT title, {score} AS score FROM articles WHERE {matches} ORDER BY score DESC, title LIMIT ?',
+                patterns + [pattern for pattern in patterns for _ in range(2)] + [limit]).fetchall()
+        return [(title, float(score)) for title, score in rows]
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+def migrate(source, destination, batch_size=1000):
+    '''Copies every article of source to destination.
+
+    Articles which can not be read are skipped. Old versions are not copied.
+
+    Arguments:
+        source, destination: Storage instances
+        batch_size: number of articles saved at once
+
+    Returns:
+        dict: {'articles': int, 'copied': int, 'failed': list of file names}
+    '''
+
+    result = {'articles': 0, 'copied': 0, 'failed': []}
+    batch = []
+    for file_name in source.get_articles_list():
+        result['articles'] += 1
+        try:
+            batch.append((file_name[:-3], source.get(file_name[:-3])))
+        except (OSError, UnicodeDecodeError):
+            result['failed'].append(file_name)
+            continue
+        if len(batch)>=batch_size:
+            result['copied'] += destination.save_many(batch)
+            batch = []
+    result['copied'] += destination.save_many(batch)
+    return result
+
+def main():
+    base_dir = os.getcwd()
+    arg_parser = argparse.ArgumentParser(description='Copies the articles between the storage backends.')
+    subparsers = arg_parser.add_subparsers(dest='command', required=True)
+    migrate_parser = subparsers.add_parser('migrate', help='copy the articles of data/mds to a SQLite database')
+    migrate_parser.add_argument('--source', default=os.path.join(base_dir, 'data', 'mds'), help='directory of the .md files')
+    migrate_parser.add_argument('--db', default=os.path.join(base_dir, 'data', 'wiki.sqlite3'), help='path of the database')
+    migrate_parser.add_argument('--reverse', action='store_true', help='copy from the database to the directory instead')
+    args = arg_parser.parse_args()
+
+    directory = DirectoryStorage(args.source, RevisionStore(os.path.join(os.path.dirname(args.source), 'revisions')))
+    database = SqliteStorage(args.db)
+    source, destination = (database, directory) if args.reverse else (directory, database)
+    started = time.perf_counter()
+    result = migrate(source, destination)
+    database.close()
+    print(f'{result["copied"]} of {result["articles"]} articles copied in {time.perf_counter()-started:.2f} s')
+    for file_name in result['failed']:
+        print(f'failed: {file_name}', file=sys.stderr)
+
+if __name__=='__main__':
+    main()
@@ -0,0 +1,128 @@
+'''This module keeps the fonts and tags used for styling the rendered text.
+
+The Renderer needs one tag per combination of attributes ('bold', 'italic',\
+    'h1' etc.) and there are only a few dozen of them. The registry creates \
+    each Font once and configures each tag once per Text widget, then every \
+    Renderer working on the same widget, or on another widget with the same\
+    base font, reuses them.
+
+The app has a single Tk root, so one registry is shared by the whole process:
+    from styles import style_registry
+    tag = style_registry.tag_for(textarea, ['bold', 'italic'])
+
+'''
+
+import weakref
+from tkinter import font
+
+class StyleRegistry():
+    '''Creates fonts and tag configurations once and reuses them.
+
+    Attributes:
+        fonts: a dictionary of type {(base_font, attrs): Font}
+
+        widgets: for every Text widget, its base font and the set of tags \
+            already configured on it. Widgets are weakly referenced, so a \
+            destroyed screen does not keep its entry alive.
+
+        hits: number of tag_for calls answered from the registry
+
+        misses: number of tag_for calls which had to configure a tag
+
+    Methods:
+        tag_for: returns the tag to use for a list of attributes
+
+        make_font: creates the font for a base font and attributes
+
+        stats: returns the counters
+
+        reset: forgets all fonts, tags and counters
+    '''
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        '''Forgets all fonts, tags and counters.'''
+
+        self.fonts = {}
+        self.widgets = weakref.WeakKeyDictionary()
+        self.hits = 0
+        self.misses = 0
+
+    def make_font(self, textarea, base_font, attrs):
+        '''Creates the font for a base font and a sorted tuple of attributes.
+
+        Arguments:
+            textarea: the Text widget, used as the root of the font
+            base_font: the font of the Text widget
+            attrs: sorted tuple of attributes
+
+        Returns:
+            Font
+        '''
+
+        my_font = font.Font(textarea, base_font)
+        for attr in attrs:
+            if attr=='bold':
+                my_font.configure(weight="bold")
+            elif attr=='italic':
+                my_font.configure(slant='italic')
+            elif attr=='underline':
+                my_font.configure(underline=True)
+            elif attr=='h1':
+                my_font.configure(size=24)
+            elif attr=='h2':
+                my_font.configure(size=20)
+        return my_font
+
+    def tag_for(self, textarea, attrs):
+        '''Returns the tag to use for a list of attributes.
+
+        The tag is named after the sorted attributes, for example \
+            'bold_italic'. It is configured on textarea the first time it is \
+            asked for.
+
+        Arguments:
+            textarea: a Text widget
+            attrs: list of strings specifying the styles for a character
+
+        Returns:
+            str: the tag name
+        '''
+
+        attrs = tuple(sorted(attrs))
+        tag = '_'.join(attrs)
+        widget = self.widgets.get(textarea)
+        if widget is None:
+            widget = {'font': str(textarea.cget('font')), 'tags': set()}
+            self.widgets[textarea] = widget
+        if tag in widget['tags']:
+            self.hits += 1
+            return tag
+
+        self.misses += 1
+        key = (widget['font'], attrs)
+        my_font = self.fonts.get(key)
+        if my_font is None:
+            my_font = self.make_font(textarea, widget['font'], attrs)
+            self.fonts[key] = my_font
+        textarea.tag_configure(tag, font=my_font)
+        widget['tags'].add(tag)
+        return tag
+
+    def stats(self):
+        '''Returns the counters of the registry.
+
+        Returns:
+            dict: {'hits': int, 'misses': int, 'fonts': int, 'widgets': int}
+        '''
+
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'fonts': len(self.fonts),
+            'widgets': len(self.widgets),
+        }
+
+style_registry = StyleRegistry()